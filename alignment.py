@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+alignment.py
+------------
+Dieses Modul implementiert den verschiebungstoleranten Vergleich der extrahierten Bits mit dem erwarteten Muster.
+Statt die Bits nur mit dem Anfang des Musters zu vergleichen, wird die Trefferzahl für jede (zyklische) Verschiebung
+berechnet: Eine gelöschte oder umsortierte Funktion verschiebt die Bitfolge, und der Embedder verwendet das Muster
+zyklisch wieder (next_bit), sodass der Anfang einer Datei an beliebiger Stelle des Musters liegen kann.
+
+- Popcount-Pfad: Das zyklisch fortgesetzte Muster wird als Ganzzahl gepackt, je Verschiebung genügen
+  Shift, XOR und bit_count.
+- FFT-Pfad (mit NumPy, für lange Folgen): Die Bits werden als ±1 auf die Musterlänge gefaltet, die zyklische
+  Kreuzkorrelation liefert alle Trefferzahlen in O(m log m).
+- Bewertung: Unter der Nullhypothese (Bits unabhängig vom Muster) ist die Trefferzahl je Verschiebung
+  binomialverteilt mit p = 1/2. Der p-Wert der besten Verschiebung wird für die Anzahl geprüfter Verschiebungen
+  korrigiert (Šidák), damit kurze Folgen nicht durch die Suche allein signifikant erscheinen.
+"""
+
+import math
+from bitvector import BitVector
+from error_correction import np
+
+# Ab diesem Produkt aus Bit- und Musterlänge wird (mit NumPy) die FFT-Korrelation verwendet
+FFT_THRESHOLD = 1 << 15
+
+# Bis zu dieser Bitanzahl wird der Binomial-Tail exakt summiert, darüber per Normalapproximation
+EXACT_TAIL_LIMIT = 2000
+
+class WatermarkAlignment:
+    """Ergebnis des Abgleichs: beste Verschiebung, Treffer, verglichene Bits und korrigierter p-Wert."""
+    __slots__ = ("offset", "matches", "compared", "p_value", "offsets")
+
+    def __init__(self, offset: int, matches: int, compared: int, p_value: float, offsets: int):
+        self.offset = offset
+        self.matches = matches
+        self.compared = compared
+        self.p_value = p_value
+        self.offsets = offsets
+
+    @property
+    def confidence(self) -> float:
+        """Anteil übereinstimmender Bits an der besten Verschiebung in %."""
+        return self.matches / self.compared * 100 if self.compared else 0
+
+    def to_dict(self) -> dict:
+        return {"offset": self.offset, "matches": self.matches, "compared": self.compared,
+                "confidence": round(self.confidence, 2), "p_value": self.p_value}
+
+def _tile(pattern: BitVector, length: int) -> tuple[int, int]:
+    """Setzt das Muster zyklisch auf mindestens length Bits fort (Ganzzahl, tatsächliche Bitlänge)."""
+    m = len(pattern)
+    repeats = (length + m - 1) // m
+    value = pattern.to_int()
+    tiled = 0
+    for _ in range(repeats):
+        tiled = (tiled << m) | value
+    return tiled, repeats * m
+
+def _match_counts_popcount(bits: BitVector, pattern: BitVector) -> list[int]:
+    """Trefferzahlen je Verschiebung über Ganzzahl-XOR und Popcount."""
+    n, m = len(bits), len(pattern)
+    # Jedes Fenster der Länge n ab einer Verschiebung < m liegt in den ersten m + n - 1 Bits
+    tiled, width = _tile(pattern, m + n - 1)
+    query = bits.to_int()
+    mask = (1 << n) - 1
+    return [n - (((tiled >> (width - offset - n)) & mask) ^ query).bit_count() for offset in range(m)]
+
+def cyclic_matches(bits: BitVector, pattern: BitVector) -> int:
+    """Treffer ohne Verschiebung: bits[i] wird mit pattern[i mod len(pattern)] verglichen."""
+    if not bits or not pattern:
+        return 0
+    n = len(bits)
+    tiled, width = _tile(pattern, n)
+    return n - ((tiled >> (width - n)) ^ bits.to_int()).bit_count()
+
+def cyclic_window(pattern: BitVector, offset: int, length: int) -> BitVector:
+    """Die length Bits des zyklisch fortgesetzten Musters ab Position offset (was eine Verschiebung erwartet)."""
+    if not pattern or length <= 0:
+        return BitVector()
+    tiled, width = _tile(pattern, offset + length)
+    return BitVector.from_int((tiled >> (width - offset - length)) & ((1 << length) - 1), length)
+
+def _match_counts_fft(bits: BitVector, pattern: BitVector) -> list[int]:
+    """Trefferzahlen je Verschiebung als zyklische Kreuzkorrelation der ±1-Folgen."""
+    n, m = len(bits), len(pattern)
+    signs = np.unpackbits(np.frombuffer(bits.to_bytes(), dtype=np.uint8))[:n].astype(np.float64) * 2 - 1
+    reference = np.unpackbits(np.frombuffer(pattern.to_bytes(), dtype=np.uint8))[:m].astype(np.float64) * 2 - 1
+    # Bit i wird mit Musterposition (offset + i) mod m verglichen: Bits auf die Musterlänge falten
+    folded = np.bincount(np.arange(n) % m, weights=signs, minlength=m)
+    correlation = np.fft.irfft(np.conj(np.fft.rfft(folded)) * np.fft.rfft(reference), m)
+    return ((n + np.rint(correlation)) // 2).astype(np.int64).tolist()
+
+def match_counts(bits: BitVector, pattern: BitVector) -> list[int]:
+    """
+    Liefert für jede zyklische Verschiebung k (0 <= k < len(pattern)) die Anzahl der Positionen i mit
+    bits[i] == pattern[(k + i) mod len(pattern)].
+    """
+    if not bits or not pattern:
+        return []
+    if np is not None and len(bits) * len(pattern) >= FFT_THRESHOLD:
+        return _match_counts_fft(bits, pattern)
+    return _match_counts_popcount(bits, pattern)
+
+def binomial_tail(n: int, successes: int) -> float:
+    """P(X >= successes) für X ~ Binomial(n, 1/2)."""
+    if successes <= 0:
+        return 1.0
+    if successes > n:
+        return 0.0
+    if n > EXACT_TAIL_LIMIT:
+        # Normalapproximation mit Stetigkeitskorrektur
+        return 0.5 * math.erfc((successes - 0.5 - n / 2) / math.sqrt(n / 2))
+    term = math.comb(n, successes)
+    total = 0
+    for k in range(successes, n + 1):
+        total += term
+        term = term * (n - k) // (k + 1)
+    return total / (1 << n)
+
+def align_watermark(bits: BitVector, pattern: BitVector) -> WatermarkAlignment:
+    """
+    Sucht die zyklische Verschiebung des Musters mit den meisten Treffern (bei Gleichstand die kleinste).
+    Der p-Wert gibt an, wie wahrscheinlich ein mindestens so gutes Ergebnis bei zufälligen Bits über alle
+    geprüften Verschiebungen wäre.
+    """
+    return alignment_from_counts(match_counts(bits, pattern), len(bits))
+
+def sidak_correction(p_value: float, tests: int) -> float:
+    """Korrigiert einen p-Wert für tests unabhängige Prüfungen, numerisch stabil auch für sehr kleine p-Werte."""
+    return min(1.0, -math.expm1(tests * math.log1p(-p_value))) if p_value < 1 else 1.0
+
+def alignment_from_counts(counts: list[int], compared: int) -> WatermarkAlignment:
+    """Wertet die Trefferzahlen je Verschiebung aus (siehe match_counts), z. B. aus einem Matrixvergleich."""
+    if not counts or not compared:
+        return WatermarkAlignment(0, 0, 0, 1.0, 0)
+    best = max(counts)
+    offset = counts.index(best)
+    # Šidák-Korrektur für len(pattern) Verschiebungen
+    p_value = sidak_correction(binomial_tail(compared, best), len(counts))
+    return WatermarkAlignment(offset, best, compared, p_value, len(counts))
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""
+batch_processing.py
+-------------------
+Dieses Modul implementiert den Batch-Modus für ganze Repositories.
+Wasserzeichen-Bits und Whitelist werden einmalig im Hauptprozess berechnet und an einen
+ProcessPoolExecutor übergeben. Jeder Worker-Prozess initialisiert seinen Zustand (inkl. Plugin Manager)
+genau einmal und transformiert anschließend beliebig viele Dateien.
+Die Ausgabe erfolgt in einen gespiegelten Verzeichnisbaum.
+Die Batch-Erkennung durchsucht Verzeichnisse oder Archive (tar/zip), vergleicht die Rohbits jeder Datei mit
+der einmalig berechneten Payload, streamt die Ergebnisse als JSON Lines und kombiniert
+abschließend die Bits aller Dateien zu einem Gesamturteil für das Korpus.
+Alternativ prüft die sequentielle Erkennung die Dateien in zufälliger Reihenfolge und bricht ab, sobald
+der SPRT (siehe sequential_test) mit den vorgegebenen Fehlerraten entscheiden kann.
+"""
+
+import ast
+import glob
+import json
+import logging
+import os
+import random
+import tarfile
+import time
+import tokenize
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
+
+from watermark_embedder import WatermarkEmbedder, embed_streaming, render_output
+from watermark_detector import (build_name_index, extract_watermark_bits_from_file, decode_aligned_window,
+                                compare_watermark, watermark_detected)
+from bytecode_scanner import is_bytecode_file
+from alignment import match_counts
+from sequential_test import SequentialTest, UNDECIDED, DETECTED, null_match_rate
+from plugin_manager import PluginManager, check_output_backend
+from bitvector import BitVector
+from embed_cache import EmbedCache, source_hash, context_hash, DEFAULT_MAX_ENTRIES
+from event_log import get_logger, log_file_changes
+from instrumentation import StageTimer, profiled
+
+_log = get_logger("batch")
+
+# Verzeichnisse, die beim Durchsuchen eines Repositories übersprungen werden
+SKIPPED_DIRS = {"__pycache__", ".git", ".hg", ".svn", ".tox", ".nox", ".venv", "venv", "node_modules"}
+
+# Dateiendungen, die als Archiv (z. B. Leak-Dump) behandelt werden; Wheels sind Zip-Archive
+ARCHIVE_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz", ".zip", ".whl")
+
+# Dateiendungen, die die Erkennung auswertet (Quelltext und kompilierte Dateien)
+DETECTION_SUFFIXES = (".py", ".pyc")
+
+# Anzahl der Dateien, die gemeinsam an einen Erkennungs-Worker übergeben werden
+DETECT_CHUNK_SIZE = 32
+
+# Kleinere Blöcke für die sequentielle Erkennung, damit nach der Entscheidung wenig Arbeit verworfen wird
+SEQUENTIAL_CHUNK_SIZE = 4
+
+# Größe des Puffers, mit dem die Einträge komprimierter tar-Archive gemischt werden
+SHUFFLE_BUFFER_SIZE = 1024
+
+# Zustand der Worker-Prozesse (wird einmal pro Prozess durch den Initializer gesetzt)
+_worker_state = {}
+
+def is_batch_target(target: str) -> bool:
+    """Prüft, ob das Ziel ein Verzeichnis oder ein Glob-Muster ist."""
+    return os.path.isdir(target) or glob.has_magic(target)
+
+def is_archive(target: str) -> bool:
+    """Prüft, ob das Ziel ein unterstütztes Archiv ist."""
+    return os.path.isfile(target) and target.lower().endswith(ARCHIVE_SUFFIXES)
+
+def collect_source_files(target: str) -> tuple[str, list[str]]:
+    """
+    Ermittelt alle Python-Quelldateien eines Verzeichnisses oder Glob-Musters.
+    Gibt das Wurzelverzeichnis (Basis für den gespiegelten Ausgabebaum) und die sortierte Dateiliste zurück.
+    """
+    if os.path.isdir(target):
+        root = os.path.normpath(target)
+        files = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if d not in SKIPPED_DIRS)
+            files.extend(os.path.join(dirpath, name) for name in sorted(filenames) if name.endswith(".py"))
+        return root, files
+    files = sorted(f for f in glob.glob(target, recursive=True) if os.path.isfile(f))
+    if not files:
+        return ".", []
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in files])
+    return root, files
+
+def pyc_source_name(name: str) -> str:
+    """Name der Quelldatei zu einer pyc-Datei ("pkg/__pycache__/mod.cpython-311.pyc" bzw. "pkg/mod.pyc")."""
+    parts = name.replace(os.sep, "/").split("/")
+    source = parts[-1].split(".")[0] + ".py"
+    if len(parts) > 1 and parts[-2] == "__pycache__":
+        return "/".join(parts[:-2] + [source])
+    return "/".join(parts[:-1] + [source])
+
+def prefer_sources(names: list[str]) -> list[str]:
+    """
+    Filtert pyc-Dateien heraus, deren Quelltext ebenfalls vorliegt: Jede Datei soll nur einmal in das
+    Korpus-Urteil eingehen, und der Quelltext enthält alle Bits. Der Bytecode-Pfad läuft also nur für
+    pyc-Dateien ohne Quelltext; seine Reihenfolge kann bei Comprehensions in Dekoratoren oder Default-Werten
+    vom AST abweichen (siehe bytecode_scanner). Welcher Pfad verwendet wurde, steht im Feld "source" der
+    Ergebnisse ("bytecode" oder "source").
+    """
+    sources = {name.replace(os.sep, "/") for name in names if not is_bytecode_file(name)}
+    return [name for name in names if not is_bytecode_file(name) or pyc_source_name(name) not in sources]
+
+def collect_detection_files(target: str) -> list[str]:
+    """
+    Wie collect_source_files, aber für die Erkennung: Berücksichtigt auch pyc-Dateien (einschließlich
+    __pycache__-Verzeichnissen), sofern ihr Quelltext nicht vorliegt.
+    """
+    if not os.path.isdir(target):
+        return prefer_sources(sorted(f for f in glob.glob(target, recursive=True)
+                                     if os.path.isfile(f) and f.endswith(DETECTION_SUFFIXES)))
+    files = []
+    for dirpath, dirnames, filenames in os.walk(os.path.normpath(target)):
+        dirnames[:] = sorted(d for d in dirnames if d == "__pycache__" or d not in SKIPPED_DIRS)
+        files.extend(os.path.join(dirpath, name) for name in sorted(filenames) if name.endswith(DETECTION_SUFFIXES))
+    return prefer_sources(files)
+
+def mirror_output_path(source_file: str, root: str, output_dir: str) -> str:
+    """Bildet eine Quelldatei auf den gespiegelten Pfad im Ausgabeverzeichnis ab."""
+    relative = os.path.relpath(os.path.abspath(source_file), os.path.abspath(root))
+    return os.path.join(output_dir, relative)
+
+def _init_embed_worker(watermark_bits, variable_whitelist: list, code_section_whitelist: list,
+                       alternate_naming: bool, plugins_dir: str | None, stream: bool = False,
+                       backend: str = "astor", cache_path: str | None = None,
+                       cache_max_entries: int = DEFAULT_MAX_ENTRIES, cache_context: str = "",
+                       log_changes: bool = False, timings: bool = False) -> None:
+    """
+    Initialisiert einen Worker-Prozess einmalig mit Wasserzeichen, Whitelist, Plugins und Cache.
+    Mit log_changes gibt der Worker die Änderungen je Datei zurück; protokolliert wird im Hauptprozess,
+    damit sich die Ausgaben paralleler Worker nicht vermischen.
+    Mit timings misst der Worker die Stufen je Datei und gibt sie zur Aggregation zurück.
+    """
+    _worker_state["watermark_bits"] = watermark_bits
+    _worker_state["variable_whitelist"] = variable_whitelist
+    _worker_state["code_section_whitelist"] = code_section_whitelist
+    _worker_state["alternate_naming"] = alternate_naming
+    _worker_state["plugin_manager"] = PluginManager(plugins_dir) if plugins_dir else None
+    _worker_state["stream"] = stream
+    _worker_state["backend"] = backend
+    # Der Cache wird im Streaming-Modus nicht genutzt (die Ausgabe soll nicht komplett im Speicher liegen)
+    _worker_state["cache"] = EmbedCache(cache_path, cache_max_entries) if cache_path and not stream else None
+    _worker_state["cache_context"] = cache_context
+    _worker_state["log_changes"] = log_changes
+    _worker_state["timings"] = timings
+
+def _embed_worker(task: tuple[str, str, str | None]) -> dict:
+    """
+    Bettet das Wasserzeichen in eine einzelne Datei ein und schreibt das Ergebnis.
+    Ist im Task ein Profilpfad gesetzt, werden die cProfile-Daten der Datei dorthin geschrieben.
+    """
+    source_file, output_file, profile_path = task
+    timer = StageTimer(_worker_state["timings"])
+    with profiled(profile_path):
+        result = _embed_file(source_file, output_file, timer)
+    if timer.enabled and result["status"] == "ok":
+        timer.files = 1
+        result["timings"] = timer.to_dict()
+    return result
+
+def _embed_file(source_file: str, output_file: str, timer: StageTimer) -> dict:
+    """Einbettung einer Datei mit Messung der Stufen (read, cache, parse, plugins, embed, serialize, write)."""
+    plugin_manager = _worker_state["plugin_manager"]
+    embedder = WatermarkEmbedder(_worker_state["watermark_bits"],
+                                 _worker_state["variable_whitelist"],
+                                 _worker_state["code_section_whitelist"],
+                                 review_mode=False,
+                                 alternate_naming=_worker_state["alternate_naming"])
+    cache = _worker_state["cache"]
+    cached = None
+    try:
+        os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+        if _worker_state["stream"]:
+            if plugin_manager:
+                with timer.stage("plugins"):
+                    embedder.node_hooks = plugin_manager.node_hooks
+            with timer.stage("stream"):
+                embed_streaming(source_file, output_file, embedder, plugin_manager, backend=_worker_state["backend"])
+            timer.count_embedder(embedder)
+        else:
+            with timer.stage("read"):
+                with open(source_file, "rb") as f:
+                    raw = f.read()
+            with timer.stage("cache"):
+                cache_key = EmbedCache.make_key(source_hash(raw), _worker_state["cache_context"]) if cache else None
+                cached = cache.get(cache_key) if cache else None
+            if cached:
+                new_code, embedder.changes = cached
+                timer.count("cache_hits")
+            else:
+                with timer.stage("parse"):
+                    code = raw.decode("utf-8")
+                    tree = ast.parse(code, filename=source_file)
+                if plugin_manager:
+                    # Plugins werden erst beim ersten Cache-Fehltreffer des Workers importiert
+                    with timer.stage("plugins"):
+                        tree = plugin_manager.apply_plugins(tree)
+                        embedder.node_hooks = plugin_manager.node_hooks
+                with timer.stage("embed"):
+                    new_tree = embedder.visit(tree)
+                with timer.stage("serialize"):
+                    new_code = render_output(code, new_tree, embedder, _worker_state["backend"])
+                timer.count_embedder(embedder, new_tree)
+                if cache:
+                    with timer.stage("cache"):
+                        cache.put(cache_key, new_code, embedder.changes)
+            with timer.stage("write"):
+                with open(output_file, "w", encoding="utf-8") as f:
+                    f.write(new_code)
+    except (OSError, SyntaxError, UnicodeDecodeError, ValueError, tokenize.TokenError) as e:
+        return {"file": source_file, "status": "error", "error": str(e)}
+    result = {"file": source_file, "output": output_file, "status": "ok",
+              "changes": len(embedder.changes), "cached": cached is not None}
+    if _worker_state["log_changes"]:
+        result["change_log"] = embedder.changes
+    return result
+
+def run_batch_embed(files: list[str], root: str, output_dir: str, watermark_bits,
+                    variable_whitelist: list, code_section_whitelist: list,
+                    alternate_naming: bool = False, plugins_dir: str | None = "plugins",
+                    workers: int | None = None, stream: bool = False, backend: str = "astor",
+                    cache_path: str | None = None, cache_max_entries: int = DEFAULT_MAX_ENTRIES,
+                    timings: bool = False, profile_dir: str | None = None) -> dict:
+    """
+    Verteilt die Einbettung über alle CPU-Kerne und liefert eine aggregierte Zusammenfassung.
+    Mit stream=True wird jede Datei abschnittsweise verarbeitet (siehe embed_streaming),
+    backend wählt das Ausgabe-Backend ("astor" oder "tokens"); "tokens" setzt voraus, dass keine Plugins
+    vorhanden sind (sonst ValueError, siehe check_output_backend).
+    Ist cache_path gesetzt, werden unveränderte Dateien aus dem Einbettungs-Cache bedient.
+    Mit timings enthält die Zusammenfassung unter "timings" die über alle Worker summierten Stufen
+    und Zähler (siehe instrumentation.StageTimer); mit profile_dir wird je Datei eine pstats-Datei
+    im gespiegelten Verzeichnisbaum geschrieben.
+    """
+    check_output_backend(backend, plugins_dir)
+    start = time.perf_counter()
+    tasks = [(source_file, mirror_output_path(source_file, root, output_dir),
+              mirror_output_path(source_file, root, profile_dir) + ".pstats" if profile_dir else None)
+             for source_file in files]
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(tasks) // (workers * 4))
+    cache_context = context_hash(variable_whitelist, code_section_whitelist, watermark_bits, plugins_dir,
+                                 {"alternate_naming": alternate_naming, "backend": backend}) if cache_path else ""
+    results = []
+    timer = StageTimer(timings)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_embed_worker,
+                             initargs=(watermark_bits, variable_whitelist, code_section_whitelist,
+                                       alternate_naming, plugins_dir, stream, backend, cache_path,
+                                       cache_max_entries, cache_context,
+                                       _log.isEnabledFor(logging.INFO), timings)) as executor:
+        for result in executor.map(_embed_worker, tasks, chunksize=chunksize):
+            if "timings" in result:
+                timer.merge(result.pop("timings"))
+            if "change_log" in result:
+                log_file_changes(_log, result["file"], result.pop("change_log"), result["cached"])
+            results.append(result)
+    if cache_path:
+        # Größenbegrenzung nach dem Lauf einmal zentral durchsetzen
+        EmbedCache(cache_path, cache_max_entries).close()
+    succeeded = [r for r in results if r["status"] == "ok"]
+    return {
+        "files": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "changes": sum(r["changes"] for r in succeeded),
+        "cache_hits": sum(1 for r in succeeded if r["cached"]),
+        "errors": [r for r in results if r["status"] == "error"],
+        "output_dir": output_dir,
+        "elapsed": time.perf_counter() - start,
+        "timings": timer.to_dict() if timings else None,
+    }
+
+def _buffered_shuffle(items, rng: random.Random, size: int) -> Iterator:
+    """
+    Mischt einen Strom mit einem Puffer fester Größe: Jedes neue Element ersetzt ein zufällig gewähltes
+    Element des Puffers, das stattdessen ausgegeben wird.
+    """
+    buffer = []
+    for item in items:
+        if len(buffer) < size:
+            buffer.append(item)
+            continue
+        index = rng.randrange(size)
+        yield buffer[index]
+        buffer[index] = item
+    rng.shuffle(buffer)
+    yield from buffer
+
+def iter_detection_sources(target: str,
+                           shuffle_seed: int | None = None) -> Iterator[tuple[str, str | None, bytes | None]]:
+    """
+    Liefert die zu prüfenden Quellen als (Name, Pfad, Inhalt).
+    Dateien auf der Festplatte werden erst im Worker gelesen (Inhalt None),
+    Archiv-Einträge werden sequentiell gelesen und als Bytes weitergereicht.
+    Neben Quelltext werden pyc-Dateien ausgewertet, deren Quelltext fehlt (z. B. Wheels ohne Quelltext).
+    Mit shuffle_seed werden die Quellen reproduzierbar gemischt. Verzeichnisse und Zip-Archive werden
+    vollständig gemischt; tar-Archive lassen sich (komprimiert) nur sequentiell lesen und werden daher über
+    einen Puffer von SHUFFLE_BUFFER_SIZE Einträgen gemischt.
+    """
+    rng = random.Random(shuffle_seed) if shuffle_seed is not None else None
+    if is_archive(target):
+        if target.lower().endswith((".zip", ".whl")):
+            with zipfile.ZipFile(target) as archive:
+                infos = [info for info in archive.infolist()
+                         if not info.is_dir() and info.filename.endswith(DETECTION_SUFFIXES)]
+                wanted = set(prefer_sources([info.filename for info in infos]))
+                infos = [info for info in infos if info.filename in wanted]
+                if rng is not None:
+                    rng.shuffle(infos)
+                for info in infos:
+                    yield info.filename, None, archive.read(info)
+        else:
+            with tarfile.open(target, "r:*") as archive:
+                members = [member for member in archive.getmembers()
+                           if member.isfile() and member.name.endswith(DETECTION_SUFFIXES)]
+                wanted = set(prefer_sources([member.name for member in members]))
+                entries = ((member.name, None, archive.extractfile(member).read())
+                           for member in members if member.name in wanted)
+                if rng is not None:
+                    entries = _buffered_shuffle(entries, rng, SHUFFLE_BUFFER_SIZE)
+                yield from entries
+        return
+    files = collect_detection_files(target)
+    if rng is not None:
+        rng.shuffle(files)
+    for source_file in files:
+        yield source_file, source_file, None
+
+def _init_detect_worker(variable_whitelist: list, payload_bits: BitVector, error_method: str,
+                        rs_params: dict) -> None:
+    """Initialisiert einen Erkennungs-Worker einmalig mit Whitelist, eingebetteter Bitfolge und ECC-Parametern."""
+    _worker_state["variable_whitelist"] = variable_whitelist
+    _worker_state["name_index"] = build_name_index(variable_whitelist)
+    _worker_state["payload_bits"] = payload_bits
+    _worker_state["error_method"] = error_method
+    _worker_state["rs_params"] = rs_params
+
+def _detect_source(name: str, path: str | None, data: bytes | None) -> dict:
+    """Extrahiert und bewertet die Wasserzeichen-Bits einer einzelnen Quelle."""
+    try:
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        raw_bits = extract_watermark_bits_from_file(name, data, _worker_state["variable_whitelist"],
+                                                    name_index=_worker_state["name_index"])
+    except (OSError, SyntaxError, UnicodeDecodeError, ValueError) as e:
+        return {"type": "file", "file": name, "status": "error", "error": str(e)}
+    payload_bits = _worker_state["payload_bits"]
+    # Ausrichtung auf den Rohbits, erst danach Fehlerkorrektur des ausgerichteten Fensters
+    alignment = compare_watermark(raw_bits, payload_bits)
+    _, ecc_decoded = decode_aligned_window(raw_bits, alignment, len(payload_bits), _worker_state["error_method"],
+                                           **_worker_state["rs_params"])
+    return {"type": "file", "file": name, "status": "ok",
+            "source": "bytecode" if is_bytecode_file(name) else "source", "bits_found": len(raw_bits), "bits": raw_bits,
+            "ecc_decoded": ecc_decoded, "matches": alignment.matches, "confidence": round(alignment.confidence, 2),
+            "offset": alignment.offset, "p_value": alignment.p_value, "detected": watermark_detected(alignment)}
+
+def _detect_chunk(chunk: list[tuple[str, str | None, bytes | None]]) -> list[dict]:
+    """Verarbeitet einen Block von Quellen in einem Worker-Prozess."""
+    return [_detect_source(*source) for source in chunk]
+
+def _chunked(iterable, size: int) -> Iterator[list]:
+    """Teilt einen (ggf. sehr großen) Iterator in Listen der Länge size auf."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _bounded_map(executor: ProcessPoolExecutor, fn, iterable, window: int) -> Iterator:
+    """
+    Wie executor.map, hält aber höchstens window Aufträge gleichzeitig vor.
+    So bleibt der Speicherbedarf auch bei Archiven mit zehntausenden Dateien begrenzt.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def combine_corpus_bits(bit_sequences: list[BitVector]) -> BitVector:
+    """
+    Kombiniert die Rohbits aller Dateien positionsweise per Mehrheitsentscheid (jede Datei beginnt beim Einbetten
+    am Anfang der Payload); eine gemeinsame Verschiebung gleicht der anschließende Abgleich aus.
+    """
+    ones = []
+    counts = []
+    for bits in bit_sequences:
+        for position, bit in enumerate(bits):
+            if position == len(counts):
+                ones.append(0)
+                counts.append(0)
+            counts[position] += 1
+            ones[position] += bit
+    return BitVector.from_bits(2 * o > c for o, c in zip(ones, counts))
+
+def run_batch_detect(sources, variable_whitelist: list, payload_bits: BitVector, error_method: str,
+                     sink, workers: int | None = None, rs_params: dict | None = None) -> dict:
+    """
+    Prüft alle Quellen parallel und schreibt pro Datei einen JSON-Lines-Datensatz in sink.
+    Abschließend wird das Gesamturteil für das Korpus berechnet, ebenfalls nach sink geschrieben
+    und zurückgegeben.
+    """
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    bit_sequences = []
+    files = failed = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_detect_worker,
+                             initargs=(variable_whitelist, payload_bits, error_method, rs_params or {})) as executor:
+        chunks = _chunked(sources, DETECT_CHUNK_SIZE)
+        for results in _bounded_map(executor, _detect_chunk, chunks, window=workers * 4):
+            for result in results:
+                files += 1
+                if result["status"] == "ok":
+                    if result["bits"]:
+                        bit_sequences.append(result["bits"])
+                else:
+                    failed += 1
+                # Bitvektoren werden erst bei der Ausgabe in ihre Debug-Stringform überführt
+                sink.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+            sink.flush()
+    combined_bits = combine_corpus_bits(bit_sequences)
+    alignment = compare_watermark(combined_bits, payload_bits)
+    verdict = {
+        "type": "corpus",
+        "files": files,
+        "files_with_bits": len(bit_sequences),
+        "failed": failed,
+        "combined_bits": str(combined_bits),
+        "matches": alignment.matches,
+        "confidence": round(alignment.confidence, 2),
+        "offset": alignment.offset,
+        "p_value": alignment.p_value,
+        "detected": watermark_detected(alignment),
+        "elapsed": round(time.perf_counter() - start, 3),
+    }
+    sink.write(json.dumps(verdict, ensure_ascii=False) + "\n")
+    sink.flush()
+    return verdict
+
+def run_sequential_detect(sources, variable_whitelist: list, payload_bits: BitVector, error_method: str,
+                          sink, workers: int | None = None, rs_params: dict | None = None,
+                          test: SequentialTest | None = None) -> dict:
+    """
+    Prüft die Quellen in der gelieferten (zufälligen) Reihenfolge und aktualisiert nach jeder Datei den SPRT.
+    Sobald der Test entscheidet, werden ausstehende Aufträge verworfen. Pro ausgewerteter Datei wird ein
+    JSON-Lines-Datensatz mit dem laufenden Log-Likelihood-Verhältnis geschrieben, abschließend das Ergebnis
+    inklusive der benötigten Dateianzahl.
+    """
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    test = test or SequentialTest()
+    files = failed = files_with_bits = 0
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_detect_worker,
+                                   initargs=(variable_whitelist, payload_bits, error_method, rs_params or {}))
+    try:
+        chunks = _chunked(sources, SEQUENTIAL_CHUNK_SIZE)
+        for results in _bounded_map(executor, _detect_chunk, chunks, window=workers * 2):
+            for result in results:
+                files += 1
+                if result["status"] == "ok":
+                    if result["bits"]:
+                        files_with_bits += 1
+                        # Rohbits gegen die Payload über alle Verschiebungen, H0-Trefferrate aus dem Bit-Anteil
+                        test.update(match_counts(result["bits"], payload_bits), len(result["bits"]),
+                                    null_match_rate(result["bits"], payload_bits))
+                else:
+                    failed += 1
+                result["llr"] = round(test.llr, 3)
+                sink.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+                if test.decision != UNDECIDED:
+                    break
+            sink.flush()
+            if test.decision != UNDECIDED:
+                break
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        close = getattr(sources, "close", None)
+        if close is not None:
+            close()
+    verdict = {
+        "type": "sequential",
+        "files": files,
+        "files_with_bits": files_with_bits,
+        "failed": failed,
+        **test.to_dict(),
+        "files_needed": files if test.decision != UNDECIDED else None,
+        "detected": test.decision == DETECTED,
+        "elapsed": round(time.perf_counter() - start, 3),
+    }
+    sink.write(json.dumps(verdict, ensure_ascii=False) + "\n")
+    sink.flush()
+    return verdict
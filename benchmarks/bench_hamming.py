@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+benchmarks/bench_hamming.py
+---------------------------
+Vergleicht den tabellengesteuerten Hamming(7,4)-Codec mit der bisherigen blockweisen
+String-Implementierung (Referenz, unverändert übernommen) und prüft dabei die Bit-Identität.
+Aufruf: python benchmarks/bench_hamming.py [Anzahl Bits] [Wiederholungen]
+"""
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bitvector import BitVector
+from error_correction import hamming_encode, hamming_decode, np
+
+def legacy_hamming_encode(bitstring: str) -> str:
+    """Bisherige Implementierung: ein 4-Bit-Block pro Iteration, Paritäten bitweise."""
+    pad_length = (4 - len(bitstring) % 4) % 4
+    bitstring += "0" * pad_length
+    coded = []
+    for i in range(0, len(bitstring), 4):
+        d = [int(b) for b in bitstring[i:i+4]]
+        p1 = d[0] ^ d[1] ^ d[3]
+        p2 = d[0] ^ d[2] ^ d[3]
+        p3 = d[1] ^ d[2] ^ d[3]
+        codeword = [p1, p2, d[0], p3, d[1], d[2], d[3]]
+        coded.extend(str(bit) for bit in codeword)
+    return "".join(coded)
+
+def legacy_hamming_decode(bitstring: str) -> str:
+    """Bisherige Implementierung: ein 7-Bit-Block pro Iteration, Ergebnis per String-Verkettung."""
+    def correct_hamming_block(codeword: str) -> str:
+        bits = [int(b) for b in codeword]
+        s1 = bits[0] ^ bits[2] ^ bits[3] ^ bits[6]
+        s2 = bits[1] ^ bits[2] ^ bits[4] ^ bits[6]
+        s3 = bits[3] ^ bits[4] ^ bits[5] ^ bits[6]
+        syndrome = (s3 << 2) | (s2 << 1) | s1
+        if syndrome != 0 and syndrome <= 7:
+            idx = syndrome - 1
+            bits[idx] ^= 1
+        return "".join(str(b) for b in [bits[2], bits[4], bits[5], bits[6]])
+    decoded = ""
+    for i in range(0, len(bitstring), 7):
+        block = bitstring[i:i+7]
+        if len(block) == 7:
+            decoded += correct_hamming_block(block)
+    return decoded
+
+def best_of(func, repeat: int) -> float:
+    """Gibt die beste Laufzeit (Sekunden) aus repeat Einzelmessungen zurück."""
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    rng = random.Random(42)
+    bitstring = "".join(rng.choice("01") for _ in range(size))
+    bits = BitVector.from_str(bitstring)
+    legacy_encoded = legacy_hamming_encode(bitstring)
+    encoded = hamming_encode(bits)
+    assert str(encoded) == legacy_encoded, "Kodierung nicht bit-identisch"
+    assert str(hamming_decode(encoded)) == legacy_hamming_decode(legacy_encoded), "Dekodierung nicht bit-identisch"
+    rows = [
+        ("encode", best_of(lambda: legacy_hamming_encode(bitstring), repeat), best_of(lambda: hamming_encode(bits), repeat)),
+        ("decode", best_of(lambda: legacy_hamming_decode(legacy_encoded), repeat), best_of(lambda: hamming_decode(encoded), repeat)),
+    ]
+    if np is not None:
+        array = np.frombuffer(bitstring.encode("ascii"), dtype=np.uint8) - ord("0")
+        encoded_array = hamming_encode(array)
+        rows.append(("encode (numpy)", rows[0][1], best_of(lambda: hamming_encode(array), repeat)))
+        rows.append(("decode (numpy)", rows[1][1], best_of(lambda: hamming_decode(encoded_array), repeat)))
+    print(f"Hamming(7,4) mit {size} Datenbits (beste von {repeat} Messungen):")
+    for name, legacy, table in rows:
+        print(f"  {name:<15} alt: {legacy * 1000:9.2f} ms   neu: {table * 1000:9.2f} ms   Faktor: {legacy / table:6.1f}x")
+
+if __name__ == "__main__":
+    main()
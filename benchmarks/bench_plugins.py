@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+benchmarks/bench_plugins.py
+---------------------------
+Vergleicht die bisherige Plugin-Anwendung (ein NodeTransformer-Durchlauf je Plugin, danach der
+Embedder) mit dem gemeinsamen Durchlauf über NODE_HOOKS und prüft dabei die Gleichheit der Ausgabe.
+Aufruf: python benchmarks/bench_plugins.py [Anzahl Plugins] [Wiederholungen]
+"""
+
+import ast
+import contextlib
+import io
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import astor
+from watermark_embedder import WatermarkEmbedder
+
+def make_hook(index: int):
+    """Erzeugt einen Hook, der Funktionsnamen mit plugin-spezifischem Präfix markiert."""
+    def hook(node: ast.FunctionDef) -> ast.AST:
+        if node.name.startswith(f"p{index}_"):
+            return node
+        node.name = f"p{index}_{node.name}"
+        return node
+    return hook
+
+def make_legacy_plugin(hook):
+    """Verpackt einen Hook als Legacy-Plugin mit eigenem NodeTransformer-Durchlauf."""
+    def apply(tree: ast.AST) -> ast.AST:
+        class Legacy(ast.NodeTransformer):
+            def visit_FunctionDef(self, node):
+                node = hook(node)
+                self.generic_visit(node)
+                return node
+        return Legacy().visit(tree)
+    return apply
+
+def sample_module(functions: int = 400) -> str:
+    """Erzeugt ein Modul mit vielen kleinen Funktionen."""
+    return "".join(f"def func_{i}(value_{i}):\n    result_{i} = value_{i} * 2\n"
+                   f"    for item in range(result_{i}):\n        result_{i} += item\n    return result_{i}\n\n"
+                   for i in range(functions))
+
+def best_of(func, repeat: int) -> float:
+    """Gibt die beste Laufzeit (Sekunden) aus repeat Einzelmessungen zurück."""
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+def main():
+    plugins = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    hooks = [make_hook(i) for i in range(plugins)]
+    legacy = [make_legacy_plugin(hook) for hook in hooks]
+    # Entspricht PluginManager.node_hooks nach dem Laden der Hook-Plugins
+    node_hooks = {ast.FunctionDef: tuple(hooks)}
+    code = sample_module()
+    whitelist = [f"result_{i}" for i in range(0, 400, 3)]
+    bits = "10" * 64
+
+    def multi_pass() -> str:
+        tree = ast.parse(code)
+        for apply in legacy:
+            tree = apply(tree)
+        random.seed(0)
+        return astor.to_source(WatermarkEmbedder(bits, whitelist, []).visit(tree))
+
+    def fused() -> str:
+        random.seed(0)
+        embedder = WatermarkEmbedder(bits, whitelist, [], node_hooks=node_hooks)
+        return astor.to_source(embedder.visit(ast.parse(code)))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert multi_pass() == fused(), "Ausgabe nicht identisch"
+        old = best_of(multi_pass, repeat)
+        new = best_of(fused, repeat)
+    print(f"{plugins} Plugins, {len(code.splitlines())} Zeilen (beste von {repeat} Messungen, inkl. Parse/Serialisierung):")
+    print(f"  getrennte Durchläufe: {old * 1000:9.2f} ms   gemeinsamer Durchlauf: {new * 1000:9.2f} ms   Faktor: {old / new:5.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+benchmarks/run_benchmarks.py
+----------------------------
+Reproduzierbare Benchmark-Suite über alle Stufen: Wasserzeichen-Erzeugung, Fehlerkorrektur (Hamming,
+Reed-Solomon), Krypto (HKDF, AES-EAX), Parsen, Embedder-Durchlauf, Serialisierung, Detector-Durchlauf
+sowie die End-to-End-Pfade der Kommandozeile (Batch-Einbettung und Batch-Erkennung).
+
+Gemessen wird auf einem synthetischen Korpus mit festem Seed (Anzahl Funktionen, Anteil der
+Whitelist-Treffer, Schleifen je Funktion). Die Ergebnisse werden als JSON gespeichert (Standard:
+benchmarks/results/<Commit>.json); mit --compare werden sie gegen eine frühere Ergebnisdatei
+verglichen, bei Verschlechterung über --threshold endet der Lauf mit Exit-Code 1.
+
+Aufruf: python benchmarks/run_benchmarks.py [--functions N] [--hit-ratio R] [--loops L] [--repeat K]
+                                             [--only PRÄFIX ...] [--no-cli] [--output DATEI]
+                                             [--compare BASELINE.json] [--threshold 1.2]
+"""
+
+import argparse
+import ast
+import importlib.util
+import json
+import marshal
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import astor
+import yaml
+import key_session
+from bitvector import BitVector
+from error_correction import hamming_encode, hamming_decode, reed_solomon_encode, reed_solomon_decode, np
+from key_session import AesEaxCipherFactory, derive_aes_key
+from watermark_embedder import WatermarkEmbedder, generate_watermark_bits, encrypt_watermark, render_output
+from watermark_detector import (WatermarkDetector, build_name_index, decrypt_watermark,
+                                extract_watermark_bits_from_source, extract_watermark_bits_from_bytecode)
+
+RESULTS_FORMAT = 1
+DEFAULT_RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+BENCH_CONFIG = {
+    "projektname": "BenchmarkProject",
+    "copyright": {"jahr": 2024},
+    "uuid": "00000000-0000-4000-8000-000000000000",
+    "encryption_key_embedder": "benchmarkkey1234",
+    "encryption_key_detector": "",
+    "reed_solomon": {"nsym": 10, "nsize": 255},
+    "random_bit_assignment": True,
+    "alternate_naming": False,
+}
+
+def generate_corpus(functions: int = 500, hit_ratio: float = 0.5, loops: int = 1,
+                    seed: int = 0) -> tuple[str, list[str]]:
+    """
+    Erzeugt ein synthetisches Modul und die passende Whitelist.
+    Je Funktion werden mit Wahrscheinlichkeit hit_ratio der Funktionsname und die Ergebnisvariable
+    in die Whitelist aufgenommen; jede Funktion enthält loops For-Schleifen.
+    """
+    rng = random.Random(seed)
+    parts = []
+    whitelist = []
+    for i in range(functions):
+        if rng.random() < hit_ratio:
+            whitelist.extend((f"compute_{i}", f"total_{i}"))
+        lines = [f"def compute_{i}(limit_{i}):", f"    total_{i} = 0"]
+        for j in range(loops):
+            lines.append(f"    for item_{j} in range(limit_{i}):")
+            lines.append(f"        total_{i} += item_{j} * {j + 1}")
+        lines.append(f"    return total_{i}")
+        parts.append("\n".join(lines) + "\n")
+    return "\n\n".join(parts), whitelist
+
+def measure(func, repeat: int, setup=None) -> dict:
+    """
+    Führt func repeat-mal aus (setup vor jeder Messung, nicht mitgemessen) und liefert beste,
+    mittlere und durchschnittliche Laufzeit in Sekunden.
+    """
+    samples = []
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        func(argument) if setup else func()
+        samples.append(time.perf_counter() - start)
+    return {"best": min(samples), "median": statistics.median(samples), "mean": statistics.fmean(samples),
+            "rounds": repeat}
+
+def bench_in_process(args) -> dict:
+    """Misst die einzelnen Stufen im Prozess."""
+    code, whitelist = generate_corpus(args.functions, args.hit_ratio, args.loops, args.seed)
+    code_sections = ["for_loop"] if args.loops else []
+    rng = random.Random(args.seed)
+    ecc_bits = BitVector.from_bits(rng.getrandbits(1) for _ in range(args.ecc_bits))
+    hamming_encoded = hamming_encode(ecc_bits)
+    rs_payload = BitVector(rng.randbytes(args.rs_bytes))
+    rs_encoded = reed_solomon_encode(rs_payload)
+    factory = AesEaxCipherFactory.coerce(BENCH_CONFIG["encryption_key_embedder"])
+    watermark = generate_watermark_bits(dict(BENCH_CONFIG, error_correction="hamming"), shuffle_seed=args.seed)
+    encrypted = encrypt_watermark(ecc_bits, factory)
+    name_index = build_name_index(whitelist)
+
+    def fresh_derive():
+        key_session._derived_keys.clear()
+        return derive_aes_key(BENCH_CONFIG["encryption_key_embedder"])
+
+    def embedded_tree():
+        random.seed(args.seed)
+        embedder = WatermarkEmbedder(watermark, whitelist, code_sections)
+        return embedder, embedder.visit(ast.parse(code))
+
+    embedded_code = astor.to_source(embedded_tree()[1])
+    embedded_ast = ast.parse(embedded_code)
+    # pyc-Inhalt wie von py_compile geschrieben (Magic Number, 12 Byte Header-Felder, marshal-Daten)
+    embedded_pyc = importlib.util.MAGIC_NUMBER + bytes(12) + marshal.dumps(compile(embedded_code, "<bench>", "exec"))
+
+    def detect(tree):
+        WatermarkDetector(whitelist, verbose=False, name_index=name_index).visit(tree)
+
+    stages = {
+        "watermark.generate[hamming]": (lambda: generate_watermark_bits(
+            dict(BENCH_CONFIG, error_correction="hamming"), shuffle_seed=args.seed), None),
+        "watermark.generate[reed-solomon]": (lambda: generate_watermark_bits(
+            dict(BENCH_CONFIG, error_correction="reed-solomon"), shuffle_seed=args.seed), None),
+        "ecc.hamming_encode": (lambda: hamming_encode(ecc_bits), None),
+        "ecc.hamming_decode": (lambda: hamming_decode(hamming_encoded), None),
+        "ecc.reed_solomon_encode": (lambda: reed_solomon_encode(rs_payload), None),
+        "ecc.reed_solomon_decode": (lambda: reed_solomon_decode(rs_encoded), None),
+        "crypto.derive_key": (fresh_derive, None),
+        "crypto.encrypt": (lambda: encrypt_watermark(ecc_bits, factory), None),
+        "crypto.decrypt": (lambda: decrypt_watermark(encrypted, factory), None),
+        "ast.parse": (lambda: ast.parse(code), None),
+        "embed.visit": (lambda tree: WatermarkEmbedder(watermark, whitelist, code_sections).visit(tree),
+                        lambda: (random.seed(args.seed), ast.parse(code))[1]),
+        "embed.astor_to_source": (astor.to_source, lambda: embedded_tree()[1]),
+        "embed.tokens_render": (lambda state: render_output(code, state[1], state[0], "tokens"), embedded_tree),
+        "detect.build_name_index": (lambda: build_name_index(whitelist), None),
+        "detect.visit": (detect, lambda: embedded_ast),
+        "detect.parse_and_visit": (lambda: detect(ast.parse(embedded_code)), None),
+        "detect.fast_scan": (lambda: extract_watermark_bits_from_source(embedded_code, whitelist,
+                                                                        name_index=name_index), None),
+        "detect.bytecode_scan": (lambda: extract_watermark_bits_from_bytecode(embedded_pyc, whitelist,
+                                                                              name_index=name_index), None),
+    }
+    results = {}
+    for name, (func, setup) in stages.items():
+        if args.only and not name.startswith(tuple(args.only)):
+            continue
+        results[name] = measure(func, args.repeat, setup)
+        print(f"  {name:<34} {results[name]['best'] * 1000:10.3f} ms")
+    return results
+
+def bench_cli(args) -> dict:
+    """Misst die Kommandozeilen-Pfade (Batch-Einbettung und -Erkennung) als eigene Prozesse."""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        source_dir = os.path.join(tmp, "src")
+        os.makedirs(source_dir)
+        whitelist = []
+        per_file = max(1, args.functions // args.files)
+        for index in range(args.files):
+            code, names = generate_corpus(per_file, args.hit_ratio, args.loops, args.seed + index)
+            # Funktionsnamen je Datei eindeutig halten
+            code = code.replace("compute_", f"f{index}_compute_")
+            whitelist.extend(name.replace("compute_", f"f{index}_compute_") for name in names)
+            with open(os.path.join(source_dir, f"module_{index}.py"), "w", encoding="utf-8") as f:
+                f.write(code)
+        with open(os.path.join(tmp, "whitelist.json"), "w", encoding="utf-8") as f:
+            json.dump({"variables": [{"name": name} for name in whitelist],
+                       "code_sections": [{"type": "for_loop"}] if args.loops else []}, f)
+        with open(os.path.join(tmp, "config.yaml"), "w", encoding="utf-8") as f:
+            yaml.safe_dump(dict(BENCH_CONFIG, error_correction="hamming"), f)
+        env = {k: v for k, v in os.environ.items() if k not in ("STEGOPY_KEY_AGENT", "KEY_VAULT_MASTER")}
+        main_py = os.path.join(ROOT, "main.py")
+        commands = {
+            "cli.embed_batch": [sys.executable, main_py, "embed", "src", "-o", "out", "--no-cache"],
+            "cli.detect_batch": [sys.executable, main_py, "detect", "out", "--jsonl", os.devnull],
+        }
+        for name, command in commands.items():
+            if args.only and not name.startswith(tuple(args.only)):
+                continue
+            if args.workers:
+                command = command + ["--workers", str(args.workers)]
+
+            def run(command=command):
+                subprocess.run(command, cwd=tmp, env=env, check=True, stdin=subprocess.DEVNULL,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            if name == "cli.detect_batch" and not os.path.isdir(os.path.join(tmp, "out")):
+                run(commands["cli.embed_batch"])
+            results[name] = measure(run, max(1, min(args.repeat, args.cli_repeat)))
+            print(f"  {name:<34} {results[name]['best'] * 1000:10.3f} ms")
+        shutil.rmtree(os.path.join(tmp, "out"), ignore_errors=True)
+    return results
+
+def git_commit() -> str | None:
+    """Kurzer Hash des aktuellen Commits (None außerhalb eines Git-Repositorys)."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_results(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """Vergleicht die besten Laufzeiten und gibt die Stufen zurück, die um mehr als threshold langsamer sind."""
+    regressions = []
+    print(f"\nVergleich mit {baseline['meta'].get('commit') or 'Baseline'} (beste Messung, Faktor > {threshold} = Regression):")
+    for name, result in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            print(f"  {name:<34} neu")
+            continue
+        ratio = result["best"] / old["best"] if old["best"] else float("inf")
+        marker = "  REGRESSION" if ratio > threshold else ""
+        print(f"  {name:<34} {old['best'] * 1000:10.3f} ms -> {result['best'] * 1000:10.3f} ms   {ratio:5.2f}x{marker}")
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark-Suite des Wasserzeichen-Systems")
+    parser.add_argument("--functions", type=int, default=500, help="Anzahl Funktionen im synthetischen Korpus")
+    parser.add_argument("--hit-ratio", type=float, default=0.5, help="Anteil der Funktionen mit Whitelist-Treffern")
+    parser.add_argument("--loops", type=int, default=1, help="For-Schleifen je Funktion")
+    parser.add_argument("--files", type=int, default=8, help="Anzahl Dateien für die Kommandozeilen-Pfade")
+    parser.add_argument("--ecc-bits", type=int, default=100_000, help="Datenbits für die Hamming-Messungen")
+    parser.add_argument("--rs-bytes", type=int, default=4096, help="Nutzbytes für die Reed-Solomon-Messungen")
+    parser.add_argument("--repeat", type=int, default=7, help="Messungen je Stufe")
+    parser.add_argument("--cli-repeat", type=int, default=3, help="Höchstens so viele Messungen je Kommandozeilen-Pfad")
+    parser.add_argument("--workers", type=int, default=None, help="Worker-Prozesse der Kommandozeilen-Pfade")
+    parser.add_argument("--seed", type=int, default=0, help="Seed für Korpus und Zufallsdaten")
+    parser.add_argument("--only", nargs="+", help="Nur Stufen mit diesen Präfixen (z. B. ecc. embed.)")
+    parser.add_argument("--no-cli", action="store_true", help="Kommandozeilen-Pfade nicht messen")
+    parser.add_argument("--output", help="Ergebnisdatei (Standard: benchmarks/results/<Commit>.json)")
+    parser.add_argument("--compare", help="Frühere Ergebnisdatei, gegen die verglichen wird")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Faktor, ab dem eine Stufe als Regression gilt")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    print(f"Benchmarks ({args.functions} Funktionen, Treffer {args.hit_ratio:.0%}, {args.loops} Schleifen, "
+          f"beste von {args.repeat} Messungen):")
+    results = bench_in_process(args)
+    if not args.no_cli:
+        results.update(bench_cli(args))
+    report = {
+        "format": RESULTS_FORMAT,
+        "meta": {
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__ if np is not None else None,
+            "params": {key: getattr(args, key) for key in ("functions", "hit_ratio", "loops", "files", "ecc_bits",
+                                                           "rs_bytes", "repeat", "seed", "workers")},
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(DEFAULT_RESULTS_DIR, f"{commit or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nErgebnisse gespeichert in '{output}'.")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("params") != report["meta"]["params"]:
+            print("Hinweis: Die Baseline wurde mit anderen Parametern gemessen.")
+        if compare_results(report, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+bitvector.py
+------------
+Dieses Modul implementiert einen kompakten Bitvektor für das Wasserzeichen.
+Die Bits werden MSB-first in Bytes gepackt (8 Bits pro Byte statt ein Zeichen pro Bit).
+Unterstützt werden Länge, Indizierung, Slicing, Iteration (liefert 0/1 als int), Verkettung
+und schnelle Vergleiche über Ganzzahl-XOR und Popcount.
+Die Stringform ('0'/'1') steht nur noch als Debug-Ansicht (str) zur Verfügung.
+"""
+
+# Vorberechnete Bit-Tupel je Bytewert für die Iteration
+_BYTE_BITS = tuple(tuple((value >> shift) & 1 for shift in range(7, -1, -1)) for value in range(256))
+
+class BitVector:
+    """Unveränderlicher, in Bytes gepackter Bitvektor."""
+    __slots__ = ("_data", "_length")
+
+    def __init__(self, data: bytes = b"", length: int | None = None):
+        data = bytes(data)
+        if length is None:
+            length = len(data) * 8
+        if length < 0 or length > len(data) * 8:
+            raise ValueError(f"Ungültige Bitlänge {length} für {len(data)} Bytes.")
+        nbytes = (length + 7) // 8
+        data = data[:nbytes]
+        spare = nbytes * 8 - length
+        if spare:
+            # Überzählige Bits im letzten Byte auf 0 setzen, damit Vergleich und Hash eindeutig sind
+            data = data[:-1] + bytes([data[-1] & (0xFF << spare) & 0xFF])
+        self._data = data
+        self._length = length
+
+    @classmethod
+    def from_int(cls, value: int, length: int) -> "BitVector":
+        """Erzeugt einen Bitvektor aus den unteren length Bits einer Ganzzahl."""
+        nbytes = (length + 7) // 8
+        value &= (1 << length) - 1
+        return cls((value << (nbytes * 8 - length)).to_bytes(nbytes, "big"), length)
+
+    @classmethod
+    def from_bits(cls, bits) -> "BitVector":
+        """Erzeugt einen Bitvektor aus einer Folge von 0/1-Werten (int, bool oder '0'/'1')."""
+        value = 0
+        length = 0
+        for bit in bits:
+            value = (value << 1) | (1 if bit in (1, "1", True) else 0)
+            length += 1
+        return cls.from_int(value, length)
+
+    @classmethod
+    def from_str(cls, bitstring: str) -> "BitVector":
+        """Erzeugt einen Bitvektor aus der Debug-Stringform ('0'/'1')."""
+        if not bitstring:
+            return cls()
+        return cls.from_int(int(bitstring, 2), len(bitstring))
+
+    @classmethod
+    def coerce(cls, bits) -> "BitVector":
+        """Gibt bits als Bitvektor zurück; Strings werden als Debug-Stringform interpretiert."""
+        if isinstance(bits, BitVector):
+            return bits
+        if isinstance(bits, str):
+            return cls.from_str(bits)
+        return cls.from_bits(bits)
+
+    def to_bytes(self) -> bytes:
+        """Gibt die gepackten Bytes zurück (das letzte Byte ggf. mit 0 aufgefüllt)."""
+        return self._data
+
+    def to_int(self) -> int:
+        """Gibt den Bitvektor als Ganzzahl zurück (erstes Bit = höchstwertiges Bit)."""
+        return int.from_bytes(self._data, "big") >> (len(self._data) * 8 - self._length)
+
+    def count(self, bit: int = 1) -> int:
+        """Zählt die gesetzten (bzw. bei bit=0 die nicht gesetzten) Bits."""
+        ones = self.to_int().bit_count()
+        return ones if bit else self._length - ones
+
+    def matches(self, other: "BitVector") -> int:
+        """Zählt die übereinstimmenden Bits beider Vektoren über die kürzere Länge."""
+        length = min(self._length, len(other))
+        if not length:
+            return 0
+        diff = self[:length].to_int() ^ other[:length].to_int()
+        return length - diff.bit_count()
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self):
+        remaining = self._length
+        for value in self._data:
+            bits = _BYTE_BITS[value]
+            if remaining < 8:
+                yield from bits[:remaining]
+                return
+            yield from bits
+            remaining -= 8
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            if step != 1:
+                return BitVector.from_bits(self[i] for i in range(start, stop, step))
+            if stop <= start:
+                return BitVector()
+            if start % 8 == 0 and stop == self._length:
+                return BitVector(self._data[start // 8:], stop - start)
+            return BitVector.from_int(self.to_int() >> (self._length - stop), stop - start)
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("Bitindex außerhalb des gültigen Bereichs.")
+        return (self._data[index // 8] >> (7 - index % 8)) & 1
+
+    def __add__(self, other: "BitVector") -> "BitVector":
+        if not isinstance(other, BitVector):
+            return NotImplemented
+        if self._length % 8 == 0:
+            return BitVector(self._data + other._data, self._length + other._length)
+        return BitVector.from_int((self.to_int() << len(other)) | other.to_int(), self._length + len(other))
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, BitVector):
+            return NotImplemented
+        return self._length == other._length and self._data == other._data
+
+    def __hash__(self) -> int:
+        return hash((self._length, self._data))
+
+    def __bool__(self) -> bool:
+        return self._length > 0
+
+    def __str__(self) -> str:
+        """Debug-Ansicht als '0'/'1'-String."""
+        return format(self.to_int(), f"0{self._length}b") if self._length else ""
+
+    def __repr__(self) -> str:
+        return f"BitVector('{self}')"
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+bytecode_scanner.py
+-------------------
+Dieses Modul implementiert den Erkennungspfad für kompilierte Dateien (.pyc, z. B. aus __pycache__-Verzeichnissen
+oder Wheels ohne Quelltext). Die Datei wird ohne Parsen per marshal geladen, anschließend werden die Code-Objekte
+rekursiv in Definitionsreihenfolge durchlaufen:
+- Funktionsnamen stammen aus co_name der verschachtelten Code-Objekte (wie im Detector ohne "async def",
+  Lambdas und Comprehensions),
+- Zuweisungsziele aus den STORE_*-Instruktionen, deren Argumente auf co_varnames, co_names bzw. die
+  Zellvariablen verweisen. Anders als die Tabellen selbst enthalten die Instruktionen jedes Vorkommen
+  (ein Bit je Zuweisung) und keine Parameter, Attribute oder gelesenen Namen.
+Bindungen, die im AST keine Name-Knoten sind (Import-Aliase, "except ... as NAME", die Namen von def- und
+class-Anweisungen), werden übersprungen. Da der Bytecode Werte vor ihren Zielen auswertet und Comprehensions
+als eigene Code-Objekte ablegt, werden die Funde nach ihrer Quelltextposition sortiert. Das Ergebnis hat dasselbe
+Format wie fast_scanner.scan_definitions, sodass Bit-Extraktion und Fehlerkorrektur unverändert bleiben.
+Grenzen: Annotationen ohne Wert, Capture-Muster in match-Anweisungen und vom Compiler entfernter Code erzeugen
+keine Zuweisung im Bytecode. Comprehensions in Dekoratoren, Default-Werten oder Dict-Schlüsseln besucht der AST
+nicht in Quelltextreihenfolge (Dekoratoren z. B. erst nach dem Rumpf); dort weicht die Reihenfolge ab, und anders
+als fast_scanner gibt es keinen AST, auf den zurückgefallen werden könnte. Die Erkennung nutzt pyc-Dateien daher
+nur, wenn ihr Quelltext fehlt (siehe batch_processing.prefer_sources). pyc-Dateien lassen sich nur mit der
+Python-Version laden, die sie erzeugt hat.
+"""
+
+import dis
+import importlib.util
+import inspect
+import marshal
+import re
+from types import CodeType
+
+# Länge des pyc-Headers (Magic Number, Flags, Zeitstempel bzw. Hash, Quellgröße; PEP 552)
+PYC_HEADER_SIZE = 16
+
+def _opcodes(*names: str) -> set[int]:
+    """Opcodes der angegebenen Instruktionen, soweit die laufende Python-Version sie kennt."""
+    return {dis.opmap[name] for name in names if name in dis.opmap}
+
+_NAME_STORES = _opcodes("STORE_NAME", "STORE_GLOBAL")
+_FAST_STORES = _opcodes("STORE_FAST")
+_DEREF_STORES = _opcodes("STORE_DEREF")
+# Superinstruktionen ab Python 3.13: zwei lokale Variablen in einem Argument (je 4 Bit)
+_PAIR_STORES = _opcodes("STORE_FAST_STORE_FAST", "STORE_FAST_LOAD_FAST")
+_STORE_FAST_PAIR = dis.opmap.get("STORE_FAST_STORE_FAST")
+_DELETES = _opcodes("DELETE_NAME", "DELETE_GLOBAL", "DELETE_FAST", "DELETE_DEREF")
+_IMPORTS = _opcodes("IMPORT_NAME", "IMPORT_FROM")
+_EXC_MATCH = _opcodes("CHECK_EXC_MATCH", "JUMP_IF_NOT_EXC_MATCH")
+# Eingebettete Comprehensions (ab Python 3.12) sichern die Schleifenvariable und stellen sie per SWAP/STORE wieder her
+_CLEARS = _opcodes("LOAD_FAST_AND_CLEAR")
+_SWAPS = _opcodes("SWAP")
+_LOAD_CONST = dis.opmap["LOAD_CONST"]
+_STORES = _NAME_STORES | _FAST_STORES | _DEREF_STORES | _PAIR_STORES
+
+# Ein regulärer Ausdruck findet alle relevanten Opcodes in C-Geschwindigkeit; der Rest des Bytecodes wird übersprungen
+_RELEVANT_RE = re.compile(b"["
+                          + re.escape(bytes(sorted(_STORES | _DELETES | _CLEARS | {_LOAD_CONST})))
+                          + b"]")
+
+_ASYNC_FLAGS = inspect.CO_COROUTINE | inspect.CO_ASYNC_GENERATOR
+# Vom Compiler erzeugte Funktionen (z. B. Annotationen ab Python 3.14), die im Quelltext nicht als def erscheinen
+_SYNTHETIC_FUNCTIONS = {"__annotate__"}
+# Vom Compiler erzeugte Zuweisungen (Docstrings, Attribute von Klassenkörpern)
+_SYNTHETIC_NAMES = {"__doc__", "__module__", "__qualname__", "__firstlineno__", "__static_attributes__",
+                    "__classcell__", "__classdictcell__", "__type_params__"}
+
+def is_bytecode_file(name: str) -> bool:
+    """Prüft, ob der Name auf eine kompilierte Python-Datei verweist."""
+    return name.endswith(".pyc")
+
+def load_pyc(data: bytes) -> CodeType:
+    """
+    Lädt das Modul-Code-Objekt einer pyc-Datei. Stammt die Datei von einer anderen Python-Version
+    (abweichende Magic Number), ist sie nicht lesbar und es wird ein ValueError ausgelöst.
+    """
+    if data[:4] != importlib.util.MAGIC_NUMBER:
+        raise ValueError("pyc-Datei einer anderen Python-Version (Magic Number "
+                         f"{data[:4].hex()}, erwartet {importlib.util.MAGIC_NUMBER.hex()})")
+    code = marshal.loads(data[PYC_HEADER_SIZE:])
+    if not isinstance(code, CodeType):
+        raise ValueError("pyc-Datei enthält kein Code-Objekt")
+    return code
+
+def _previous(ops: bytes, index: int) -> int:
+    """Index der vorangehenden Instruktion (Inline-Cache-Einträge haben den Opcode 0)."""
+    index -= 1
+    while index > 0 and ops[index] == 0:
+        index -= 1
+    return index
+
+def _demangle(name: str, class_name: str | None) -> str:
+    """Macht die Namensverschleierung privater Namen ("__x" in Klasse K wird "_K__x") rückgängig."""
+    if class_name:
+        prefix = "_" + class_name.lstrip("_")
+        if name.startswith(prefix + "__"):
+            return name[len(prefix):]
+    return name
+
+def _positions(code: CodeType) -> list[tuple]:
+    """Quelltextposition (Zeile, Endzeile, Spalte, Endspalte) je Instruktion; vor Python 3.11 nur die Zeile."""
+    if hasattr(code, "co_positions"):
+        return list(code.co_positions())
+    positions = [(None, None, None, None)] * (len(code.co_code) // 2)
+    line = None
+    starts = dict(dis.findlinestarts(code))
+    for index in range(len(positions)):
+        line = starts.get(index * 2, line)
+        positions[index] = (line, line, None, None)
+    return positions
+
+class _CodeWalker:
+    """
+    Sammelt die Definitionen eines Code-Objekts und der darin definierten Code-Objekte. Jeder Eintrag trägt die
+    Quelltextposition seiner Instruktion; die Besuchsreihenfolge des AST entspricht bis auf Sonderfälle der
+    Reihenfolge im Quelltext, während der Bytecode z. B. den Wert vor dem Ziel einer Zuweisung ausführt,
+    Comprehensions als eigene Code-Objekte ablegt und finally-Blöcke mehrfach erzeugt.
+    """
+    def __init__(self, code: CodeType, found: list, class_name: str | None = None):
+        self.code = code
+        self.found = found
+        self.class_name = class_name
+        self.positions = None
+        self.seen_positions = set()
+        self.bindings = {}       # durch def/class gebundene Namen, deren nächste Zuweisung übersprungen wird
+        self.handler_names = set()
+        self.cleared = set()
+        self.last_store = None   # (Name, Position in found) der unmittelbar vorangehenden erfassten Zuweisung
+
+    def _add(self, kind: str, name: str, line: int | None, column: int) -> None:
+        line = line or self.code.co_firstlineno
+        self.found.append((line, column, len(self.found), kind, name))
+
+    def _nested(self, nested: CodeType) -> None:
+        self.last_store = None
+        name = nested.co_name
+        class_name = self.class_name
+        if not nested.co_flags & inspect.CO_NEWLOCALS:
+            # Klassenkörper: der Klassenname ist keine Name-Zuweisung
+            self.bindings[name] = self.bindings.get(name, 0) + 1
+            class_name = name
+        elif not name.startswith("<") and name not in _SYNTHETIC_FUNCTIONS:
+            self.bindings[name] = self.bindings.get(name, 0) + 1
+            if not nested.co_flags & _ASYNC_FLAGS:
+                # Vor allen Zuweisungen derselben Zeile (Rumpf einer einzeiligen Funktion)
+                self._add("function", name, nested.co_firstlineno, -1)
+        _CodeWalker(nested, self.found, class_name).walk()
+
+    def _store(self, ops: bytes, index: int, name: str) -> None:
+        name = _demangle(name, self.class_name)
+        if name in _SYNTHETIC_NAMES or name in self.cleared and ops[_previous(ops, index)] in _SWAPS:
+            return
+        if self.bindings.get(name):
+            self.bindings[name] -= 1
+            return
+        if self.positions is None:
+            self.positions = _positions(self.code)
+        position = self.positions[index]
+        # Vom Compiler mehrfach erzeugter Code (finally-Blöcke, while-Bedingungen) hat dieselbe Quelltextposition
+        if position[0] is not None:
+            if position in self.seen_positions:
+                return
+            self.seen_positions.add(position)
+        self.last_store = (name, len(self.found))
+        self._add("variable", name, position[0], position[2] or 0)
+
+    def walk(self) -> None:
+        raw = self.code.co_code
+        ops = raw[0::2]
+        args = raw[1::2]
+        consts = self.code.co_consts
+        names = self.code.co_names
+        varnames = self.code.co_varnames
+        local_name = getattr(self.code, "_varname_from_oparg", None)
+        cells = self.code.co_cellvars + self.code.co_freevars
+        for match in _RELEVANT_RE.finditer(ops):
+            index = match.start()
+            op = ops[index]
+            arg = args[index]
+            shift = 8
+            position = index
+            while position > 0 and ops[position - 1] == dis.EXTENDED_ARG:
+                position -= 1
+                arg |= args[position] << shift
+                shift += 8
+            if op == _LOAD_CONST:
+                if type(consts[arg]) is CodeType:
+                    self._nested(consts[arg])
+                continue
+            if op in _CLEARS:
+                self.cleared.add(varnames[arg])
+                continue
+            if op in _DELETES:
+                # "except ... as NAME" räumt den Namen per "NAME = None; del NAME" auf
+                if self.last_store is not None and self.last_store[0] in self.handler_names:
+                    del self.found[self.last_store[1]]
+                self.last_store = None
+                continue
+            if op in _NAME_STORES:
+                targets = (names[arg],)
+            elif op in _FAST_STORES:
+                targets = (varnames[arg],)
+            elif op in _DEREF_STORES:
+                targets = (local_name(arg) if local_name else cells[arg],)
+            elif op == _STORE_FAST_PAIR:
+                targets = (varnames[arg >> 4], varnames[arg & 15])
+            else:
+                targets = (varnames[arg >> 4],)
+            previous = _previous(ops, position)
+            self.last_store = None
+            if ops[previous] in _IMPORTS:
+                continue
+            if ops[_previous(ops, previous)] in _EXC_MATCH:
+                self.handler_names.update(targets)
+                continue
+            for name in targets:
+                self._store(ops, index, name)
+
+def scan_code_object(code: CodeType) -> list[tuple[str, str, int]]:
+    """
+    Liefert die Definitionen und Zuweisungsziele eines Code-Objekts als (Art, Name, Zeile) in
+    Definitionsreihenfolge ("function" oder "variable").
+    """
+    found = []
+    _CodeWalker(code, found).walk()
+    found.sort()
+    return [(kind, name, line) for line, _, _, kind, name in found]
+
+def scan_pyc(data: bytes) -> list[tuple[str, str, int]]:
+    """Wie scan_code_object, aber direkt für den Inhalt einer pyc-Datei."""
+    return scan_code_object(load_pyc(data))
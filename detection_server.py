@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+detection_server.py
+-------------------
+Dieses Modul implementiert einen langlebigen Erkennungsdienst (asyncio) für lokale Aufrufer.
+Whitelist-Index, eingebettete Bitfolge und ECC-Parameter werden beim Start einmalig berechnet und
+an einen Pool von Worker-Prozessen übergeben (siehe batch_processing); jede Anfrage kostet danach
+nur noch Parsen, Extraktion und Vergleich.
+
+Der Dienst spricht ein minimales HTTP/1.1 (mit Keep-Alive) auf localhost oder einem Unix-Socket:
+  GET  /health   Zustand des Dienstes
+  POST /detect   JSON {"source": "<Quelltext>", "name": "<optional>"} oder {"path": "<Datei>"}
+                 Antwort: JSON-Urteil wie in der Batch-Erkennung (inklusive "detected")
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+
+from bitvector import BitVector
+from batch_processing import _init_detect_worker, _detect_source
+
+# Obergrenzen je Anfrage
+MAX_HEADER_LINES = 100
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+class _HttpError(Exception):
+    """
+    Fehler, der als HTTP-Antwort mit Statuscode an den Aufrufer geht. Mit close_connection wird die
+    Verbindung danach geschlossen, weil ungelesene Header oder Body-Bytes im Datenstrom verbleiben.
+    """
+    def __init__(self, status: HTTPStatus, message: str, close_connection: bool = False):
+        super().__init__(message)
+        self.status = status
+        self.close_connection = close_connection
+
+class DetectionServer:
+    """Hält den vorbereiteten Erkennungszustand und beantwortet Anfragen über einen Worker-Pool."""
+
+    def __init__(self, variable_whitelist: list, payload_bits: BitVector, error_method: str, rs_params: dict,
+                 workers: int | None = None):
+        self.payload_bits = payload_bits
+        self.requests = 0
+        self.started = time.time()
+        # forkserver statt fork: Nachträglich gestartete Worker erben sonst offene Client-Verbindungen
+        # des Dienstes, deren Ende der Client dann nie sieht
+        context = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods()
+                                              else None)
+        self.executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, mp_context=context,
+                                            initializer=_init_detect_worker,
+                                            initargs=(variable_whitelist, payload_bits, error_method, rs_params))
+
+    async def detect(self, payload: dict) -> dict:
+        """Bewertet eine Quelle ({"source": ...} oder {"path": ...}) im Worker-Pool."""
+        if isinstance(payload.get("source"), str):
+            name = str(payload.get("name", "<source>"))
+            args = (name, None, payload["source"].encode("utf-8"))
+        elif isinstance(payload.get("path"), str):
+            args = (payload["path"], payload["path"], None)
+        else:
+            raise _HttpError(HTTPStatus.BAD_REQUEST, "Erwartet wird 'source' (Quelltext) oder 'path' (Dateipfad).")
+        result = await asyncio.get_running_loop().run_in_executor(self.executor, _detect_source, *args)
+        self.requests += 1
+        if result["status"] == "ok":
+            result["bits"] = str(result["bits"])
+        return result
+
+    def health(self) -> dict:
+        return {"status": "ok", "requests": self.requests, "uptime": round(time.time() - self.started, 3),
+                "payload_bits": len(self.payload_bits)}
+
+    async def _dispatch(self, method: str, target: str, body: bytes) -> dict:
+        if target == "/health" and method == "GET":
+            return self.health()
+        if target == "/detect" and method == "POST":
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError as e:
+                raise _HttpError(HTTPStatus.BAD_REQUEST, f"Ungültiges JSON: {e}")
+            if not isinstance(payload, dict):
+                raise _HttpError(HTTPStatus.BAD_REQUEST, "Erwartet wird ein JSON-Objekt.")
+            return await self.detect(payload)
+        if target in ("/health", "/detect"):
+            raise _HttpError(HTTPStatus.METHOD_NOT_ALLOWED, f"Methode {method} nicht erlaubt.")
+        raise _HttpError(HTTPStatus.NOT_FOUND, f"Unbekannter Pfad {target}.")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Beantwortet HTTP-Anfragen einer Verbindung, bis der Client sie schließt."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                keep_alive = True
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                    headers = {}
+                    for _ in range(MAX_HEADER_LINES):
+                        line = await reader.readline()
+                        if line in (b"\r\n", b"\n", b""):
+                            break
+                        key, _, value = line.decode("latin-1").partition(":")
+                        headers[key.strip().lower()] = value.strip()
+                    else:
+                        raise _HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Zu viele Header-Zeilen.",
+                                         close_connection=True)
+                    connection = headers.get("connection", "").lower()
+                    keep_alive = connection != "close" and (version == "HTTP/1.1" or connection == "keep-alive")
+                    length = int(headers.get("content-length", "0"))
+                    if length < 0 or length > MAX_BODY_SIZE:
+                        raise _HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Anfrage zu groß.", close_connection=True)
+                    body = await reader.readexactly(length) if length else b""
+                    status, response = HTTPStatus.OK, await self._dispatch(method, target.split("?", 1)[0], body)
+                except _HttpError as e:
+                    status, response = e.status, {"status": "error", "error": str(e)}
+                    keep_alive = keep_alive and not e.close_connection
+                except ValueError:
+                    status, response = HTTPStatus.BAD_REQUEST, {"status": "error", "error": "Ungültige HTTP-Anfrage."}
+                    keep_alive = False
+                data = json.dumps(response, ensure_ascii=False, default=str).encode("utf-8")
+                writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                             "Content-Type: application/json; charset=utf-8\r\n"
+                             f"Content-Length: {len(data)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765, socket_path: str | None = None) -> None:
+        """Startet den Dienst auf host:port bzw. auf dem Unix-Socket und läuft bis zum Abbruch."""
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            previous_umask = os.umask(0o177)
+            try:
+                server = await asyncio.start_unix_server(self.handle_connection, socket_path)
+            finally:
+                os.umask(previous_umask)
+            print(f"Erkennungsdienst lauscht auf Unix-Socket {socket_path}")
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            print(f"Erkennungsdienst lauscht auf http://{host}:{port}")
+        # Worker-Prozesse vorab starten, damit bereits die erste Anfrage warm ist
+        await asyncio.get_running_loop().run_in_executor(self.executor, _detect_source, "<warmup>", None, b"")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if socket_path and os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+    def close(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
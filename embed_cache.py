@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+embed_cache.py
+--------------
+Dieses Modul implementiert einen persistenten, inkrementellen Cache für die Einbettung.
+Der Schlüssel setzt sich aus dem SHA-256 des Quelltexts und einem Kontext-Hash zusammen, der
+Whitelist, Wasserzeichen-Bits, Embedder-Version, Plugin-Stand und Ausgabeoptionen abdeckt.
+Bei einem Treffer werden der transformierte Code und die Änderungsliste direkt zurückgegeben;
+ast.parse, Plugins, Embedder und Serialisierung entfallen.
+Gespeichert wird in SQLite mit größenbegrenzter LRU-Verdrängung.
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+
+from bitvector import BitVector
+from watermark_embedder import EMBEDDER_VERSION
+from plugin_manager import plugins_fingerprint
+
+# Standardablage und Größenbegrenzung des Caches
+DEFAULT_CACHE_PATH = ".stegopy_cache.sqlite"
+DEFAULT_MAX_ENTRIES = 10000
+
+# Nach so vielen Schreibvorgängen prüft eine Verbindung die Größenbegrenzung
+_EVICT_INTERVAL = 256
+
+def source_hash(source: bytes) -> str:
+    """Berechnet den SHA-256 des Quelltexts."""
+    return hashlib.sha256(source).hexdigest()
+
+def context_hash(variable_whitelist: list, code_section_whitelist: list, watermark_bits,
+                 plugins_dir: str | None, options: dict | None = None) -> str:
+    """
+    Berechnet den Kontext-Hash aus Whitelist, Wasserzeichen-Bits, Embedder-Version, Plugin-Stand
+    (plugins_dir None = keine Plugins) und Ausgabeoptionen (z. B. alternate_naming, backend).
+    Er wird einmal pro Lauf berechnet.
+    """
+    watermark_bits = BitVector.coerce(watermark_bits)
+    version = f"{EMBEDDER_VERSION}/{plugins_fingerprint(plugins_dir) if plugins_dir else '-'}"
+    digest = hashlib.sha256()
+    whitelist = json.dumps([variable_whitelist, code_section_whitelist], sort_keys=True)
+    digest.update(hashlib.sha256(whitelist.encode("utf-8")).digest())
+    digest.update(hashlib.sha256(len(watermark_bits).to_bytes(8, "big") + watermark_bits.to_bytes()).digest())
+    digest.update(version.encode("utf-8"))
+    digest.update(json.dumps(options or {}, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+class EmbedCache:
+    """SQLite-Cache für transformierten Code mit LRU-Verdrängung."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        # Mehrere Worker-Prozesse teilen sich die Datei; SQLite serialisiert die Schreibzugriffe
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS embed_cache ("
+                          "key TEXT PRIMARY KEY, output TEXT NOT NULL, changes TEXT NOT NULL, last_access REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embed_cache_lru ON embed_cache (last_access)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(source_digest: str, context_digest: str) -> str:
+        """Bildet den Cache-Schlüssel aus Quelltext- und Kontext-Hash."""
+        return f"{source_digest}:{context_digest}"
+
+    def get(self, key: str) -> tuple[str, list] | None:
+        """Gibt (Ausgabe, Änderungen) zurück oder None, falls kein Eintrag existiert."""
+        row = self.conn.execute("SELECT output, changes FROM embed_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute("UPDATE embed_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+        self.conn.commit()
+        return row[0], json.loads(row[1])
+
+    def put(self, key: str, output: str, changes: list) -> None:
+        """Speichert das Ergebnis einer Einbettung."""
+        self.conn.execute("INSERT OR REPLACE INTO embed_cache (key, output, changes, last_access) VALUES (?, ?, ?, ?)",
+                          (key, output, json.dumps(changes, ensure_ascii=False), time.time()))
+        self.conn.commit()
+        self._writes += 1
+        if self._writes % _EVICT_INTERVAL == 0:
+            self.evict()
+
+    def evict(self) -> int:
+        """Verdrängt die am längsten nicht genutzten Einträge oberhalb von max_entries."""
+        cursor = self.conn.execute("DELETE FROM embed_cache WHERE key IN (SELECT key FROM embed_cache "
+                                   "ORDER BY last_access DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+        self.conn.commit()
+        return cursor.rowcount
+
+    def close(self) -> None:
+        """Setzt die Größenbegrenzung durch und schließt die Verbindung."""
+        self.evict()
+        self.conn.close()
@@ -4,52 +4,128 @@ error_correction.py
 -------------------
 Dieses Modul implementiert alternative Fehlerkorrekturcodes.
 Unterstützt werden:
-- Hamming(7,4)-Code
+- Hamming(7,4)-Code (tabellengesteuert, optional vektorisiert mit NumPy)
 - Reed-Solomon-Code (über die Bibliothek reedsolo)
 
 Die Funktionen encode_error_correction und decode_error_correction
 wenden den gewählten Algorithmus zur Kodierung bzw. Dekodierung an.
 """
 
-import math
+from bitvector import BitVector
 
 # Hamming-Code Implementierung
-def hamming_encode(bitstring: str) -> str:
-    """Kodiert einen Binärstring mittels Hamming(7,4)-Code."""
-    # Falls die Länge nicht durch 4 teilbar ist, wird gepadded.
-    pad_length = (4 - len(bitstring) % 4) % 4
-    bitstring += "0" * pad_length
-    coded = []
-    for i in range(0, len(bitstring), 4):
-        d = [int(b) for b in bitstring[i:i+4]]
-        # Berechnung der Paritätsbits
-        p1 = d[0] ^ d[1] ^ d[3]
-        p2 = d[0] ^ d[2] ^ d[3]
-        p3 = d[1] ^ d[2] ^ d[3]
-        # Zusammenstellung des 7-Bit-Codeworts
-        codeword = [p1, p2, d[0], p3, d[1], d[2], d[3]]
-        coded.extend(str(bit) for bit in codeword)
-    return "".join(coded)
-
-def hamming_decode(bitstring: str) -> str:
-    """Dekodiert einen Binärstring, der mittels Hamming(7,4)-Code kodiert wurde."""
-    def correct_hamming_block(codeword: str) -> str:
-        bits = [int(b) for b in codeword]
-        s1 = bits[0] ^ bits[2] ^ bits[3] ^ bits[6]
-        s2 = bits[1] ^ bits[2] ^ bits[4] ^ bits[6]
-        s3 = bits[3] ^ bits[4] ^ bits[5] ^ bits[6]
-        syndrome = (s3 << 2) | (s2 << 1) | s1
-        if syndrome != 0 and syndrome <= 7:
-            idx = syndrome - 1
-            bits[idx] ^= 1
-        # Extrahiere die 4 Databits
-        return "".join(str(b) for b in [bits[2], bits[4], bits[5], bits[6]])
-    decoded = ""
-    for i in range(0, len(bitstring), 7):
-        block = bitstring[i:i+7]
-        if len(block) == 7:
-            decoded += correct_hamming_block(block)
-    return decoded
+def _hamming_encode_block(nibble: int) -> int:
+    """Kodiert 4 Datenbits (als Zahl 0–15) in ein 7-Bit-Codewort [p1, p2, d0, p3, d1, d2, d3]."""
+    d = [(nibble >> shift) & 1 for shift in (3, 2, 1, 0)]
+    # Berechnung der Paritätsbits
+    p1 = d[0] ^ d[1] ^ d[3]
+    p2 = d[0] ^ d[2] ^ d[3]
+    p3 = d[1] ^ d[2] ^ d[3]
+    codeword = 0
+    for bit in (p1, p2, d[0], p3, d[1], d[2], d[3]):
+        codeword = (codeword << 1) | bit
+    return codeword
+
+def _hamming_decode_block(codeword: int) -> int:
+    """Korrigiert ein 7-Bit-Codewort über das Syndrom und gibt die 4 Datenbits (0–15) zurück."""
+    bits = [(codeword >> shift) & 1 for shift in range(6, -1, -1)]
+    # Prüfgleichungen der Positionen 1–7: s1 über 1, 3, 5, 7; s2 über 2, 3, 6, 7; s3 über 4, 5, 6, 7
+    s1 = bits[0] ^ bits[2] ^ bits[4] ^ bits[6]
+    s2 = bits[1] ^ bits[2] ^ bits[5] ^ bits[6]
+    s3 = bits[3] ^ bits[4] ^ bits[5] ^ bits[6]
+    syndrome = (s3 << 2) | (s2 << 1) | s1
+    if syndrome != 0 and syndrome <= 7:
+        idx = syndrome - 1
+        bits[idx] ^= 1
+    # Extrahiere die 4 Databits
+    return (bits[2] << 3) | (bits[4] << 2) | (bits[5] << 1) | bits[6]
+
+# Vorberechnete Tabellen: 16 Codewörter, 128 Syndrom-/Dekodiereinträge und 256 Byte-Einträge (2 Codewörter)
+_HAMMING_ENCODE_TABLE = tuple(_hamming_encode_block(nibble) for nibble in range(16))
+_HAMMING_DECODE_TABLE = tuple(_hamming_decode_block(codeword) for codeword in range(128))
+_HAMMING_BYTE_ENCODE_TABLE = tuple((_HAMMING_ENCODE_TABLE[value >> 4] << 7) | _HAMMING_ENCODE_TABLE[value & 0x0F]
+                                   for value in range(256))
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def hamming_encode(bits: BitVector) -> BitVector:
+    """
+    Kodiert einen Bitvektor mittels Hamming(7,4)-Code.
+    Je 4 Bytes (8 Nibbles) werden über die Byte-Tabelle zu 7 Ausgabebytes zusammengesetzt.
+    NumPy-Arrays aus 0/1-Werten werden vektorisiert kodiert und als Array zurückgegeben.
+    """
+    if np is not None and isinstance(bits, np.ndarray):
+        return _hamming_encode_array(bits)
+    # Falls die Länge nicht durch 4 teilbar ist, wird gepadded (die Füllbits sind bereits 0).
+    nibbles = (len(bits) + 3) // 4
+    groups = nibbles // 8
+    data = bits.to_bytes()
+    table = _HAMMING_BYTE_ENCODE_TABLE
+    out = bytearray()
+    for i in range(0, groups * 4, 4):
+        word = (table[data[i]] << 42) | (table[data[i + 1]] << 28) | (table[data[i + 2]] << 14) | table[data[i + 3]]
+        out += word.to_bytes(7, "big")
+    coded = BitVector(out)
+    # Restliche Nibbles (weniger als 8) einzeln über die 16er-Tabelle kodieren
+    tail_nibbles = nibbles - groups * 8
+    if tail_nibbles:
+        tail = 0
+        for k in range(tail_nibbles):
+            value = data[groups * 4 + k // 2]
+            nibble = value >> 4 if k % 2 == 0 else value & 0x0F
+            tail = (tail << 7) | _HAMMING_ENCODE_TABLE[nibble]
+        coded = coded + BitVector.from_int(tail, tail_nibbles * 7)
+    return coded
+
+def hamming_decode(bits: BitVector) -> BitVector:
+    """
+    Dekodiert einen Bitvektor, der mittels Hamming(7,4)-Code kodiert wurde.
+    Je 7 Bytes (8 Codewörter) werden über die 128er-Tabelle zu 4 Ausgabebytes dekodiert;
+    unvollständige Codewörter am Ende werden verworfen.
+    """
+    if np is not None and isinstance(bits, np.ndarray):
+        return _hamming_decode_array(bits)
+    blocks = len(bits) // 7
+    data = bits.to_bytes()
+    table = _HAMMING_DECODE_TABLE
+    groups = blocks // 8
+    out = bytearray()
+    for i in range(0, groups * 7, 7):
+        word = int.from_bytes(data[i:i + 7], "big")
+        decoded = 0
+        for shift in (49, 42, 35, 28, 21, 14, 7, 0):
+            decoded = (decoded << 4) | table[(word >> shift) & 0x7F]
+        out += decoded.to_bytes(4, "big")
+    result = BitVector(out)
+    tail_blocks = blocks - groups * 8
+    if tail_blocks:
+        word = bits[groups * 56:blocks * 7].to_int()
+        decoded = 0
+        for shift in range((tail_blocks - 1) * 7, -1, -7):
+            decoded = (decoded << 4) | table[(word >> shift) & 0x7F]
+        result = result + BitVector.from_int(decoded, tail_blocks * 4)
+    return result
+
+def _hamming_encode_array(bits: "np.ndarray") -> "np.ndarray":
+    """Vektorisierte Hamming-Kodierung eines NumPy-Arrays aus 0/1-Werten."""
+    bits = np.asarray(bits, dtype=np.uint8)
+    pad_length = (4 - bits.size % 4) % 4
+    if pad_length:
+        bits = np.concatenate([bits, np.zeros(pad_length, dtype=np.uint8)])
+    nibbles = bits.reshape(-1, 4) @ np.array([8, 4, 2, 1], dtype=np.uint8)
+    codewords = np.array(_HAMMING_ENCODE_TABLE, dtype=np.uint8)[nibbles]
+    return np.unpackbits(codewords[:, None], axis=1)[:, 1:].reshape(-1)
+
+def _hamming_decode_array(bits: "np.ndarray") -> "np.ndarray":
+    """Vektorisierte Hamming-Dekodierung eines NumPy-Arrays aus 0/1-Werten."""
+    bits = np.asarray(bits, dtype=np.uint8)
+    blocks = bits.size // 7
+    codewords = bits[:blocks * 7].reshape(-1, 7) @ np.array([64, 32, 16, 8, 4, 2, 1], dtype=np.uint8)
+    nibbles = np.array(_HAMMING_DECODE_TABLE, dtype=np.uint8)[codewords]
+    return np.unpackbits(nibbles[:, None], axis=1)[:, 4:].reshape(-1)
 
 # Reed-Solomon Implementierung
 try:
@@ -57,57 +133,81 @@ try:
 except ImportError:
     reedsolo = None
 
-def reed_solomon_encode(bitstring: str) -> str:
-    """Kodiert einen Binärstring mittels Reed-Solomon-Code.
-    (Achtung: Die Bibliothek 'reedsolo' muss installiert sein.)
-    """
+# Ausnahmen, die beim Dekodieren nicht korrigierbarer Bitfolgen auftreten können
+DECODING_ERRORS = (ValueError, reedsolo.ReedSolomonError) if reedsolo else (ValueError,)
+
+# Standardparameter: 10 Fehlerkorrektur-Symbole, Blocklänge 255 Bytes (GF(2^8)), erste Nullstelle 0
+RS_DEFAULT_NSYM = 10
+RS_DEFAULT_NSIZE = 255
+RS_DEFAULT_FCR = 0
+
+# Modulweiter Cache der RSCodec-Objekte (Generatorpolynom und Galois-Tabellen werden nur einmal erzeugt)
+_rs_codecs = {}
+
+def get_rs_codec(nsym: int = RS_DEFAULT_NSYM, nsize: int = RS_DEFAULT_NSIZE, fcr: int = RS_DEFAULT_FCR):
+    """Gibt den (gecachten) RSCodec für die Parameter (nsym, nsize, fcr) zurück."""
     if reedsolo is None:
         raise ImportError("Die Bibliothek 'reedsolo' ist nicht installiert.")
-    # Umwandlung des Bitstrings in Bytes (Länge sollte durch 8 teilbar sein)
-    byte_array = []
-    for i in range(0, len(bitstring), 8):
-        byte = int(bitstring[i:i+8], 2)
-        byte_array.append(byte)
-    data = bytes(byte_array)
-    # RSCodec mit 10 Fehlerkorrektur-Bytes initialisieren
-    rs = reedsolo.RSCodec(10)
-    encoded = rs.encode(data)
-    # Rückumwandlung in einen Binärstring
-    return ''.join(format(b, '08b') for b in encoded)
-
-def reed_solomon_decode(bitstring: str) -> str:
-    """Dekodiert einen Binärstring, der mittels Reed-Solomon kodiert wurde.
+    key = (nsym, nsize, fcr)
+    codec = _rs_codecs.get(key)
+    if codec is None:
+        codec = _rs_codecs[key] = reedsolo.RSCodec(nsym, nsize=nsize, fcr=fcr)
+    return codec
+
+def reed_solomon_params(config: dict) -> dict:
+    """Liest die Reed-Solomon-Parameter (nsym, nsize, fcr) aus dem Abschnitt 'reed_solomon' der Konfiguration."""
+    section = config.get("reed_solomon") or {}
+    return {
+        "nsym": int(section.get("nsym", RS_DEFAULT_NSYM)),
+        "nsize": int(section.get("nsize", RS_DEFAULT_NSIZE)),
+        "fcr": int(section.get("fcr", RS_DEFAULT_FCR)),
+    }
+
+def reed_solomon_encode(bits: BitVector, nsym: int = RS_DEFAULT_NSYM, nsize: int = RS_DEFAULT_NSIZE,
+                        fcr: int = RS_DEFAULT_FCR) -> BitVector:
+    """Kodiert einen Bitvektor mittels Reed-Solomon-Code.
+    Nutzdaten, die länger als nsize - nsym Bytes sind, werden auf mehrere RS-Blöcke verteilt
+    (jeder Block trägt eigene nsym Korrektursymbole).
     (Achtung: Die Bibliothek 'reedsolo' muss installiert sein.)
     """
-    if reedsolo is None:
-        raise ImportError("Die Bibliothek 'reedsolo' ist nicht installiert.")
-    byte_array = []
-    for i in range(0, len(bitstring), 8):
-        byte = int(bitstring[i:i+8], 2)
-        byte_array.append(byte)
-    data = bytes(byte_array)
-    rs = reedsolo.RSCodec(10)
-    decoded = rs.decode(data)
-    # decoded liefert ein Tupel: (message, ecc)
-    message = decoded[0]
-    return ''.join(format(b, '08b') for b in message)
-
-def encode_error_correction(bitstring: str, method: str = "hamming") -> str:
-    """Wendet den ausgewählten Fehlerkorrekturalgorithmus zur Kodierung an."""
+    # Die gepackten Bytes werden direkt kodiert (Länge sollte durch 8 teilbar sein)
+    encoded = get_rs_codec(nsym, nsize, fcr).encode(bits.to_bytes())
+    return BitVector(encoded)
+
+def reed_solomon_decode(data: BitVector | bytes | bytearray | memoryview, nsym: int = RS_DEFAULT_NSYM,
+                        nsize: int = RS_DEFAULT_NSIZE, fcr: int = RS_DEFAULT_FCR) -> BitVector:
+    """Dekodiert einen Bitvektor oder Byte-Puffer, der mittels Reed-Solomon kodiert wurde.
+    Mehrblöckige Nachrichten werden blockweise (je nsize Bytes) dekodiert.
+    (Achtung: Die Bibliothek 'reedsolo' muss installiert sein.)
+    """
+    if isinstance(data, BitVector):
+        data = data.to_bytes()
+    # decode liefert ein Tupel: (message, message+ecc, errata_pos)
+    message = get_rs_codec(nsym, nsize, fcr).decode(bytearray(data))[0]
+    return BitVector(message)
+
+def encode_error_correction(bits: BitVector, method: str = "hamming", **rs_params) -> BitVector:
+    """
+    Wendet den ausgewählten Fehlerkorrekturalgorithmus zur Kodierung an.
+    rs_params (nsym, nsize, fcr) werden an den Reed-Solomon-Code weitergereicht, siehe reed_solomon_params.
+    """
     match method:
         case "hamming":
-            return hamming_encode(bitstring)
+            return hamming_encode(bits)
         case "reed-solomon":
-            return reed_solomon_encode(bitstring)
+            return reed_solomon_encode(bits, **rs_params)
         case _:
             raise ValueError(f"Unbekannte Fehlerkorrektur-Methode: {method}")
 
-def decode_error_correction(bitstring: str, method: str = "hamming") -> str:
-    """Wendet den ausgewählten Fehlerkorrekturalgorithmus zur Dekodierung an."""
+def decode_error_correction(bits: BitVector, method: str = "hamming", **rs_params) -> BitVector:
+    """
+    Wendet den ausgewählten Fehlerkorrekturalgorithmus zur Dekodierung an.
+    rs_params (nsym, nsize, fcr) werden an den Reed-Solomon-Code weitergereicht, siehe reed_solomon_params.
+    """
     match method:
         case "hamming":
-            return hamming_decode(bitstring)
+            return hamming_decode(bits)
         case "reed-solomon":
-            return reed_solomon_decode(bitstring)
+            return reed_solomon_decode(bits, **rs_params)
         case _:
             raise ValueError(f"Unbekannte Fehlerkorrektur-Methode: {method}")
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+event_log.py
+------------
+Dieses Modul implementiert die strukturierte Protokollierung des Wasserzeichen-Systems (statt print).
+- Alle Module protokollieren über Kind-Logger von "stegopy"; ohne Konfiguration bleibt die Bibliothek still.
+- Ereignisse je Bezeichner (Umbenennung, erkanntes Bit) laufen auf DEBUG. Embedder und Detector prüfen den
+  Level einmal beim Anlegen, sodass die AST-Durchläufe bei abgeschalteter Ausgabe nichts formatieren.
+- Die Änderungen einer Datei werden im Embedder gepuffert (embedder.changes) und als ein Ereignis
+  "file_changes" (INFO) ausgegeben; Batch-Worker reichen sie an den Hauptprozess zurück.
+- Optional schreibt eine JSON-Lines-Senke jedes Ereignis als Objekt mit Zeit, Level, Logger,
+  Ereignisname, Meldung und den Feldern des Ereignisses.
+"""
+
+import json
+import logging
+import sys
+
+LOGGER_NAME = "stegopy"
+
+# Stufen der Kommandozeile (-v, -vv) -> Log-Level der Konsole
+VERBOSITY_LEVELS = (logging.WARNING, logging.INFO, logging.DEBUG)
+
+_root_logger = logging.getLogger(LOGGER_NAME)
+_root_logger.addHandler(logging.NullHandler())
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger eines Moduls unterhalb von "stegopy"."""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+def log_event(logger: logging.Logger, level: int, event: str, message: str, **fields) -> None:
+    """Protokolliert ein strukturiertes Ereignis; ist der Level nicht aktiv, entstehen keine weiteren Kosten."""
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={"event": event, "fields": fields})
+
+def log_file_changes(logger: logging.Logger, file: str, changes: list, cached: bool = False) -> None:
+    """Gibt die gepufferten Änderungen einer Datei als ein Ereignis aus."""
+    log_event(logger, logging.INFO, "file_changes", f"{file}: {len(changes)} Änderungen"
+              + (" (aus dem Cache)" if cached else ""), file=file, changes=list(changes), cached=cached)
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formatiert einen Log-Eintrag als JSON-Objekt in einer Zeile."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"time": round(record.created, 6), "level": record.levelname, "logger": record.name,
+                 "event": getattr(record, "event", None), "message": record.getMessage()}
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def configure_logging(verbosity: int = 0, jsonl_path: str | None = None, stream=None) -> None:
+    """
+    Richtet die Ausgabe ein: Konsole (stderr) ab WARNING, mit verbosity 1 ab INFO, ab 2 mit DEBUG.
+    Ist jsonl_path gesetzt, werden zusätzlich alle Ereignisse ab INFO (bzw. dem Konsolen-Level, falls
+    niedriger) als JSON Lines angehängt. Wiederholte Aufrufe ersetzen die zuvor eingerichteten Senken.
+    """
+    for handler in [h for h in _root_logger.handlers if getattr(h, "_stegopy_sink", False)]:
+        _root_logger.removeHandler(handler)
+        handler.close()
+    level = VERBOSITY_LEVELS[min(max(verbosity, 0), len(VERBOSITY_LEVELS) - 1)]
+    console = logging.StreamHandler(stream or sys.stderr)
+    console.setLevel(level)
+    console.setFormatter(logging.Formatter("%(message)s"))
+    handlers = [console]
+    if jsonl_path:
+        sink = logging.FileHandler(jsonl_path, encoding="utf-8")
+        sink.setLevel(min(level, logging.INFO))
+        sink.setFormatter(JsonLinesFormatter())
+        handlers.append(sink)
+    for handler in handlers:
+        handler._stegopy_sink = True
+        _root_logger.addHandler(handler)
+    _root_logger.setLevel(min(handler.level for handler in handlers))
+    _root_logger.propagate = False
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+fast_scanner.py
+---------------
+Dieses Modul implementiert den schnellen Extraktionspfad der Erkennung: Statt ast.parse und eines
+NodeVisitor-Durchlaufs zerlegt ein kompilierter regulärer Ausdruck den Quelltext in Tokens, und eine kleine
+Zustandsmaschine liest daraus genau die Stellen, die auch WatermarkDetector auswertet:
+- "def NAME" (Funktionsnamen; wie im Detector ohne "async def"),
+- Zuweisungsziele "NAME = ...", "a, b = ...", "NAME += ...", "NAME: T = ...",
+- Schleifen- und Comprehension-Ziele "for NAME in", Ziele von "with ... as NAME".
+Die Reihenfolge entspricht der Besuchsreihenfolge des AST-Durchlaufs. Konstrukte, bei denen das nicht sicher
+gilt (z. B. Walross-Operator, Comprehensions in Dekoratoren, Default-Werten oder Dict-Schlüsseln), markieren
+das Ergebnis als nicht exakt; der Aufrufer fällt dann auf den AST zurück.
+Da nichts geparst wird, liefert der Scanner auch für Dateien, die unter der laufenden Python-Version nicht
+parsen (andere Versionen, teilweise beschädigte Leaks), ein Ergebnis nach bestem Wissen.
+"""
+
+import keyword
+import re
+import unicodedata
+
+# Ein Token je Treffer (Gruppe 1). Leerraum und ein Kommentar bis zum Zeilenende werden als Präfix des nächsten
+# Treffers verbraucht. Die häufigsten Alternativen stehen vorn. Strings sind wie im Modul tokenize als
+# "entrollte Schleife" geschrieben (normale Zeichen, dann je Escape bzw. einzelnes Quote wieder normale Zeichen):
+# Jede Stelle passt nur auf eine Alternative, sodass auch nicht abgeschlossene Strings nicht zu exponentiellem
+# Backtracking führen.
+_TOKEN_RE = re.compile(r"""
+    [ \t\f]*(?:\#[^\r\n]*)?                          # Leerraum, Kommentar
+    (
+        (?![rRbBuUfF]{1,2}['"])[^\W\d]\w*            # Name (aber kein String-Präfix wie rb"...")
+      | [()\[\]{},]                                   # Klammern und Komma
+      | \r?\n                                         # Zeilenumbruch
+      | (?:[rRbBuUfF]{1,2})?                           # String mit optionalem Präfix:
+        (?: '''[^'\\]*(?:(?:\\.|'(?!''))[^'\\]*)*'''   #   dreifach in '
+          | \"\"\"[^"\\]*(?:(?:\\.|"(?!""))[^"\\]*)*\"\"\"   #   dreifach in "
+          | '[^'\\\n]*(?:\\.[^'\\\n]*)*'             #   einfach in ' (Escapes auch vor Zeilenumbrüchen)
+          | "[^"\\\n]*(?:\\.[^"\\\n]*)*"             #   einfach in "
+        )
+      | \\\r?\n                                       # Zeilenfortsetzung
+      | \.?\d[\w.]*                                    # Zahl
+      | \*\*= | //= | >>= | <<= | := | == | != | <= | >= | -> | [-+*/%&|^@]= | \*\* | // | << | >> | \.\.\.
+      | \S                                             # sonst jedes einzelne Zeichen
+    )
+""", re.VERBOSE | re.DOTALL)
+
+_KEYWORDS = frozenset(keyword.kwlist)
+_OPENERS = frozenset("([{")
+_CLOSERS = frozenset(")]}")
+_ASSIGN_OPS = frozenset({"=", "+=", "-=", "*=", "/=", "//=", "%=", "**=", ">>=", "<<=", "&=", "|=", "^=", "@="})
+# Schlüsselwörter, deren Zeile ein Kopf bis zum Doppelpunkt ist (ohne eigene Zuweisungsziele)
+_HEADER_KEYWORDS = frozenset({"if", "elif", "else", "while", "try", "except", "finally", "class", "match", "case"})
+_DEPTH_DELTA = {"(": 1, "[": 1, "{": 1, ")": -1, "]": -1, "}": -1}
+# Logische Zeilen ohne eines dieser Tokens (und ohne Annotation) enthalten keine Definitionen
+_TRIGGERS = _ASSIGN_OPS | {"for", "def", "with"}
+
+class _LineScanner:
+    """Wertet eine logische Zeile (Tokens ohne Kommentare und Umbrüche) aus."""
+    __slots__ = ("tokens", "depths", "lambda_tokens", "exact", "found")
+
+    def __init__(self, tokens: list[str]):
+        self.tokens = tokens
+        self.exact = True
+        self.found = []
+        # Klammertiefe je Token und die ':'/'=' von Lambda-Parametern (keine Zuweisung, keine Annotation)
+        self.lambda_tokens = lambda_tokens = set()
+        if "lambda" not in tokens:
+            if _OPENERS.isdisjoint(tokens) and _CLOSERS.isdisjoint(tokens):
+                self.depths = [0] * len(tokens)
+                return
+            # Öffner zählen (wie Schließer) zur äußeren Ebene
+            self.depths = depths = []
+            depth = 0
+            for token in tokens:
+                if token in _OPENERS:
+                    depths.append(depth)
+                    depth += 1
+                elif token in _CLOSERS:
+                    depth -= 1
+                    depths.append(depth)
+                    if depth < 0:
+                        self.exact = False
+                else:
+                    depths.append(depth)
+            return
+        self.depths = depths = []
+        pending = [0]
+        depth = 0
+        for index, token in enumerate(tokens):
+            if token in _OPENERS:
+                depths.append(depth)
+                depth += 1
+                pending.append(0)
+                continue
+            if token in _CLOSERS:
+                if depth:
+                    depth -= 1
+                    pending.pop()
+                else:
+                    self.exact = False
+                depths.append(depth)
+                continue
+            depths.append(depth)
+            if token == "lambda":
+                pending[depth] += 1
+            elif pending[depth] and (token == ":" or token == "="):
+                if token == ":":
+                    pending[depth] -= 1
+                lambda_tokens.add(index)
+            elif token == "for" and any(pending):
+                # Comprehension in einem Lambda-Default: Reihenfolge der Argumente im AST weicht ab
+                self.exact = False
+
+    def _find(self, token: str, start: int, stop: int, depth: int) -> int | None:
+        tokens, depths = self.tokens, self.depths
+        for index in range(start, stop):
+            if tokens[index] == token and depths[index] == depth and index not in self.lambda_tokens:
+                return index
+        return None
+
+    def _targets(self, start: int, stop: int) -> None:
+        """Sammelt die Namen eines Zuweisungsziels (ohne Attribute, Subskripte und Aufrufe)."""
+        tokens = self.tokens
+        brackets = []
+        previous = None
+        for index in range(start, stop):
+            token = tokens[index]
+            if token in _OPENERS:
+                access = previous is not None and (previous[-1] in ")]}'\""
+                                                   or (previous.isidentifier() and previous not in _KEYWORDS))
+                brackets.append(access)
+            elif token in _CLOSERS:
+                if brackets:
+                    brackets.pop()
+            elif token.isidentifier() and not any(brackets):
+                if token in _KEYWORDS:
+                    self.exact = False
+                elif previous != "." and (index + 1 >= stop or tokens[index + 1] not in (".", "(", "[")):
+                    self.found.append((index, "variable", token))
+            previous = token
+
+    def _comprehensions(self, start: int, stop: int) -> bool:
+        """Sammelt die Ziele aller "for ... in" im Bereich; True, falls es welche gibt."""
+        tokens, depths = self.tokens, self.depths
+        found = False
+        for index in range(start, stop):
+            if tokens[index] == "for":
+                end = self._find("in", index + 1, stop, depths[index])
+                if end is None:
+                    self.exact = False
+                    continue
+                self._targets(index + 1, end)
+                found = True
+        return found
+
+    def _check_order(self, start: int, stop: int) -> None:
+        """
+        Comprehensions in Ausdrücken, deren AST-Felder nicht in Quelltextreihenfolge besucht werden:
+        im Test eines bedingten Ausdrucks (test vor body), *args nach Keyword-Argumenten und in Dict-Schlüsseln
+        (keys vor values).
+        """
+        tokens, depths = self.tokens, self.depths
+        # Je offener Klammer: [Öffner, Keyword-Argument gesehen, Comprehension im aktuellen Element]
+        frames = []
+        # Tiefe eines offenen "if" -> enthält sein Test eine Comprehension?
+        tests = {}
+        for index in range(start, stop):
+            token = tokens[index]
+            if token == "if":
+                tests[depths[index]] = False
+            elif token == "else":
+                if tests.pop(depths[index], False):
+                    self.exact = False
+                    return
+            elif token == "for":
+                depth = depths[index]
+                for test_depth in tests:
+                    if test_depth < depth:
+                        tests[test_depth] = True
+                for outer in frames:
+                    outer[2] = True
+            elif token in _OPENERS:
+                frames.append([token, False, False])
+            elif token in _CLOSERS:
+                if frames:
+                    frames.pop()
+            elif frames:
+                frame = frames[-1]
+                if token == ",":
+                    frame[2] = False
+                elif index in self.lambda_tokens:
+                    continue
+                elif token == "=":
+                    frame[1] = True
+                elif token == "*" and frame[1] and tokens[index - 1] in ("(", ","):
+                    self.exact = False
+                    return
+                elif token == ":" and frame[0] == "{" and frame[2]:
+                    self.exact = False
+                    return
+
+    def _simple_statement(self, start: int, stop: int) -> None:
+        tokens, depths, lambda_tokens = self.tokens, self.depths, self.lambda_tokens
+        segment_start = start
+        annotation = None
+        targets = []
+        for index in range(start, stop):
+            if depths[index] or index in lambda_tokens:
+                continue
+            token = tokens[index]
+            if token in _ASSIGN_OPS:
+                targets.append((segment_start, index))
+                segment_start = index + 1
+            elif token == ":" and annotation is None and not targets:
+                annotation = index
+        if annotation is not None:
+            # NAME: T = wert bzw. NAME: T – das Ziel steht vor der Annotation
+            targets = [(start, annotation)]
+        if (targets and tokens[start] == "type" and start + 1 < stop and tokens[start + 1].isidentifier()
+                and tokens[start + 1] not in _KEYWORDS):
+            # Typalias (type X = ...): nur X ist ein Zuweisungsziel
+            self.found.append((start + 1, "variable", tokens[start + 1]))
+            targets = targets[1:]
+        for target_start, target_stop in targets:
+            self._targets(target_start, target_stop)
+        if self._comprehensions(start, stop):
+            self._check_order(start, stop)
+
+    def scan(self) -> None:
+        tokens, depths = self.tokens, self.depths
+        count = len(tokens)
+        index = 0
+        while index < count:
+            token = tokens[index]
+            if token == "@":
+                # Dekoratoren werden im AST erst nach dem Rumpf besucht
+                if "for" in tokens:
+                    self.exact = False
+                return
+            is_async = token == "async" and index + 1 < count and tokens[index + 1] in ("def", "for", "with")
+            if is_async:
+                index += 1
+                token = tokens[index]
+            if token in ("def", "for", "with") or token in _HEADER_KEYWORDS:
+                colon = self._find(":", index + 1, count, 0)
+                soft = token in ("match", "case")
+                if soft and (colon is None or index + 1 >= count or tokens[index + 1] in _ASSIGN_OPS
+                             or tokens[index + 1] in (":", ".")):
+                    # "match"/"case" als gewöhnlicher Name
+                    colon = None
+                elif colon is None:
+                    self.exact = False
+                    return
+                if colon is not None:
+                    self._header(token, index, colon, is_async)
+                    index = colon + 1
+                    continue
+            stop = self._find(";", index, count, 0)
+            stop = count if stop is None else stop
+            self._simple_statement(index, stop)
+            index = stop + 1
+
+    def _header(self, token: str, index: int, colon: int, is_async: bool) -> None:
+        tokens, depths = self.tokens, self.depths
+        if token == "def":
+            # Comprehensions in Defaults oder Annotationen: Reihenfolge der arguments-Felder weicht ab
+            if "for" in tokens[index + 1:colon]:
+                self.exact = False
+            if not is_async and index + 1 < colon and tokens[index + 1].isidentifier():
+                self.found.append((index + 1, "function", tokens[index + 1]))
+        elif token == "class":
+            if "for" in tokens[index + 1:colon]:
+                self.exact = False
+        elif token == "for":
+            end = self._find("in", index + 1, colon, 0)
+            if end is None:
+                self.exact = False
+                return
+            self._targets(index + 1, end)
+            if self._comprehensions(end + 1, colon):
+                self._check_order(end + 1, colon)
+        elif token == "with":
+            for position in range(index + 1, colon):
+                if tokens[position] == "as":
+                    depth = depths[position]
+                    end = position + 1
+                    while end < colon and not (depths[end] == depth and tokens[end] == ","
+                                               or depths[end] < depth):
+                        end += 1
+                    self._targets(position + 1, end)
+            if self._comprehensions(index + 1, colon):
+                self._check_order(index + 1, colon)
+        elif self._comprehensions(index + 1, colon):
+            self._check_order(index + 1, colon)
+
+def scan_definitions(source: str | bytes) -> tuple[list[tuple[str, str, int]], bool]:
+    """
+    Liefert die Definitionen und Zuweisungsziele als (Art, Name, Zeile) in Besuchsreihenfolge des AST
+    ("function" oder "variable") und ob das Ergebnis exakt ist. Bei exact=False sollte der Aufrufer auf den
+    AST-Durchlauf zurückfallen; parst die Datei nicht, bleibt das Ergebnis die beste verfügbare Schätzung.
+    """
+    if isinstance(source, bytes):
+        source = source.decode("utf-8")
+    tokens = _TOKEN_RE.findall(source if source.endswith("\n") else source + "\n")
+    # Walross-Operator und nicht abgeschlossene Strings (einzelnes Anführungszeichen als Token)
+    exact = ":=" not in tokens and "'" not in tokens and '"' not in tokens
+    if exact and ("f'" in source or 'f"' in source or "F'" in source or 'F"' in source):
+        exact = not any(_ambiguous_fstring(token) for token in tokens if token[-1] in "'\"")
+    if exact and not source.isascii():
+        # Nicht normalisierte Bezeichner (NFKC) oder kombinierende Zeichen, die der Ausdruck nicht als Namen erkennt
+        for token in tokens:
+            if token.isascii() or token[-1] in "'\"":
+                continue
+            if len(token) == 1 and not token.isidentifier() or unicodedata.normalize("NFKC", token) != token:
+                exact = False
+                break
+    # Ein Durchlauf über alle Tokens: Klammertiefe, Ende der logischen Zeilen (Zeilenumbruch auf Tiefe 0) und
+    # newlines[i], die Anzahl der Zeilenumbrüche vor Token i (auch in Strings und fortgesetzten Zeilen)
+    newlines = [0]
+    line_breaks = 0
+    depth = 0
+    found = []
+    start = 0
+    for index, token in enumerate(tokens):
+        if token in _DEPTH_DELTA:
+            depth += _DEPTH_DELTA[token]
+            if depth < 0:
+                # Überzählige schließende Klammer (beschädigte Datei): Tiefe wie der Tokenizer bei 0 festhalten
+                depth = 0
+                exact = False
+        elif "\n" in token:
+            if not depth and (token == "\n" or token == "\r\n"):
+                if index > start:
+                    line = tokens[start:index]
+                    if not _TRIGGERS.isdisjoint(line) or ":" in line and line[0] not in _KEYWORDS:
+                        exact = _flush(line, start, newlines, found) and exact
+                start = index + 1
+            line_breaks += token.count("\n")
+        newlines.append(line_breaks)
+    if depth:
+        exact = False
+    if start < len(tokens):
+        # Nicht geschlossene Klammer bis zum Dateiende: Rest nach bestem Wissen auswerten
+        _flush(tokens[start:], start, newlines, found)
+    return found, exact
+
+def _ambiguous_fstring(token: str) -> bool:
+    """f-String mit Comprehension bzw. verschachtelten Quotes (ab Python 3.12)."""
+    if not (token[0] in "fF" or token[1] in "fF" and token[0] in "rRbBuU"):
+        return False
+    return "for" in token or token.count("{") != token.count("}")
+
+def _flush(raw: list[str], start: int, newlines: list[int], found: list) -> bool:
+    """
+    Wertet die logische Zeile raw (ab Token-Index start) aus und hängt ihre Definitionen in Quelltextreihenfolge
+    an. newlines[i] ist die Anzahl der Zeilenumbrüche vor dem Token i.
+    """
+    lineno = newlines[start] + 1
+    if newlines[start + len(raw)] == newlines[start]:
+        line = raw
+        lines = None
+    else:
+        # Logische Zeile über mehrere physische Zeilen: Umbrüche entfernen, Zeilennummer je Token
+        line = []
+        lines = []
+        for offset, token in enumerate(raw):
+            first = token[0]
+            if first == "\n" or first == "\r" or first == "\\":
+                continue
+            line.append(token)
+            lines.append(newlines[start + offset] + 1)
+    if lines is None and ";" not in line:
+        # Häufigste Formen ohne Zustandsmaschine: "NAME = wert", "def NAME(...):" und "for NAME in ...:"
+        first, second = line[0], line[1] if len(line) > 1 else None
+        if (second in _ASSIGN_OPS and first.isidentifier() and first not in _KEYWORDS and "for" not in line
+                and _ASSIGN_OPS.isdisjoint(line[2:])):
+            found.append(("variable", first, lineno))
+            return True
+        if line[-1] == ":" and line.count("for") == (first == "for"):
+            if first == "def" and second.isidentifier():
+                found.append(("function", second, lineno))
+                return True
+            if first == "for" and second.isidentifier() and second not in _KEYWORDS and line[2] == "in":
+                found.append(("variable", second, lineno))
+                return True
+    scanner = _LineScanner(line)
+    scanner.scan()
+    scanner.found.sort()
+    found.extend((kind, name, lines[index] if lines else lineno) for index, kind, name in scanner.found)
+    return scanner.exact
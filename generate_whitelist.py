@@ -4,66 +4,259 @@ generate_whitelist.py
 ---------------------
 Dieses Skript generiert automatisch eine Whitelist aus einem gegebenen Python-Quellcode.
 Es parst den Code mittels AST, analysiert die Häufigkeit von Variablen und Funktionen,
-schließt Standardnamen aus und wendet benutzerdefinierte Filter (z. B. reguläre Ausdrücke) an.
+schließt Standardnamen aus und wendet benutzerdefinierte Filter (z. B. reguläre Ausdrücke) an.
 Die generierte Whitelist wird im JSON-Format gespeichert.
+Erweiterungen in dieser Version:
+- Ganze Projektbäume (Verzeichnis oder Glob-Muster) werden parallel in Worker-Prozessen gescannt;
+  jeder Worker liefert pro Datei nur Zähler zurück, die im Hauptprozess in einem globalen Counter landen.
+- Jeder Name erscheint genau einmal in der Whitelist, zusammen mit seiner Kapazität (Anzahl der Stellen,
+  an denen der Embedder ein Bit einbetten kann) und der Anzahl der Dateien.
+- Dateiübergreifende Regeln: Namen, die ein Modul exportiert (__all__) oder die andere Module aus einem
+  Projektmodul per "from ... import" bzw. als Modulattribut verwenden, gehören zur öffentlichen API und
+  werden nicht umbenannt. Importe aus der Standardbibliothek oder Drittpaketen schließen keine
+  gleichnamigen lokalen Namen aus.
+- Wie im WatermarkEmbedder tragen nur synchrone Funktionsdefinitionen ein Bit; async-Funktionen werden
+  nicht umbenannt und zählen daher nicht zur Kapazität.
+- Die Kandidaten werden absteigend nach Kapazität sortiert; optional nur die ersten N (--limit).
 """
 
+import argparse
 import ast
+import builtins
 import json
-import sys
+import os
 import re
+import sys
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from batch_processing import collect_source_files, is_batch_target
 
 # Liste von Standardnamen, die nicht verändert werden sollen
-STANDARD_NAMES = {"print", "input", "len", "range", "str", "int", "float", "list", "dict", "set"}
+STANDARD_NAMES = {"print", "input", "len", "range", "str", "int", "float", "list", "dict", "set"} | set(dir(builtins))
+
+# Anzahl der Dateien, die gemeinsam an einen Worker übergeben werden
+SCAN_CHUNK_SIZE = 16
 
 class WhitelistGenerator(ast.NodeVisitor):
+    """
+    Sammelt die Kandidaten einer Datei: Funktionsnamen und Zuweisungsziele (je Vorkommen ein Bit,
+    wie im WatermarkEmbedder) sowie die für die dateiübergreifenden Regeln nötigen Namen.
+    """
     def __init__(self):
-        self.variables = []
-        self.functions = []
-        self.var_counter = Counter()
+        self.variables = Counter()
+        self.functions = Counter()
+        self.first_lines = {}
+        self.global_names = set()
+        self.exported = set()
+        # Von anderen Modulen verwendete Namen als (Modul, Name); relative Module beginnen mit "."
+        self.references = set()
+        self.module_aliases = {}
+        self._depth = 0
+
+    def _record(self, counter: Counter, name: str, lineno: int) -> None:
+        counter[name] += 1
+        self.first_lines.setdefault(name, lineno)
+        if self._depth == 0:
+            self.global_names.add(name)
 
     def visit_FunctionDef(self, node: ast.FunctionDef):
         if node.name.lower() != "main" and node.name not in STANDARD_NAMES:
-            self.functions.append({
-                "name": node.name,
-                "line_number": node.lineno,
-                "code_context": "Funktion",
-                "is_global": True,
-                "reason_for_inclusion": "Automatisch ausgewählt (Häufigkeit: selten)"
-            })
+            self._record(self.functions, node.name, node.lineno)
+        self._depth += 1
+        self.generic_visit(node)
+        self._depth -= 1
+
+    def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef):
+        # Der Embedder benennt nur synchrone Funktionen um; der Rumpf zählt trotzdem
+        self._depth += 1
         self.generic_visit(node)
+        self._depth -= 1
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        self._depth += 1
+        self.generic_visit(node)
+        self._depth -= 1
 
     def visit_Name(self, node: ast.Name):
         if isinstance(node.ctx, ast.Store) and node.id not in STANDARD_NAMES:
-            self.var_counter[node.id] += 1
-            self.variables.append({
-                "name": node.id,
-                "line_number": node.lineno,
-                "code_context": "Variable",
-                "is_global": False,
-                "reason_for_inclusion": "Automatisch ausgewählt (Häufigkeit: {})".format(self.var_counter[node.id])
-            })
+            self._record(self.variables, node.id, node.lineno)
+
+    def visit_Assign(self, node: ast.Assign):
+        # __all__ = [...] legt die exportierten Namen eines Moduls fest
+        if self._depth == 0 and any(isinstance(t, ast.Name) and t.id == "__all__" for t in node.targets):
+            if isinstance(node.value, (ast.List, ast.Tuple)):
+                self.exported.update(e.value for e in node.value.elts
+                                     if isinstance(e, ast.Constant) and isinstance(e.value, str))
         self.generic_visit(node)
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python generate_whitelist.py <python_file>")
-        sys.exit(1)
-    file_to_parse = sys.argv[1]
-    with open(file_to_parse, "r", encoding="utf-8") as f:
-        code = f.read()
-    tree = ast.parse(code)
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            if alias.asname:
+                self.module_aliases[alias.asname] = alias.name
+            else:
+                self.module_aliases[alias.name.split(".")[0]] = alias.name.split(".")[0]
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        module = "." * node.level + (node.module or "")
+        for alias in node.names:
+            self.references.add((module, alias.name))
+            # "from paket import modul" bindet ein Modul, dessen Attribute ebenfalls öffentlich sind
+            self.module_aliases[alias.asname or alias.name] = f"{module}.{alias.name}"
+
+    def visit_Attribute(self, node: ast.Attribute):
+        if (isinstance(node.value, ast.Name) and node.value.id in self.module_aliases
+                and node.attr not in STANDARD_NAMES):
+            self.references.add((self.module_aliases[node.value.id], node.attr))
+        self.generic_visit(node)
+
+    def result(self, file: str) -> dict:
+        return {
+            "file": file,
+            "status": "ok",
+            "variables": dict(self.variables),
+            "functions": dict(self.functions),
+            "first_lines": self.first_lines,
+            "global_names": sorted(self.global_names),
+            "exported": sorted(self.exported),
+            # Über Import/Attribut angesprochene Namen anderer Module; ob diese zum Projekt gehören, entscheidet
+            # erst build_whitelist
+            "references": sorted(self.references),
+        }
+
+def scan_file(source_file: str) -> dict:
+    """Scannt eine Datei; Syntax- und Lesefehler werden als Ergebnis mit status "error" zurückgegeben."""
+    try:
+        with open(source_file, "rb") as f:
+            tree = ast.parse(f.read(), filename=source_file)
+    except (OSError, SyntaxError, ValueError) as e:
+        return {"file": source_file, "status": "error", "error": str(e)}
     generator = WhitelistGenerator()
     generator.visit(tree)
-    whitelist = {
-        "variables": generator.variables,
-        "functions": generator.functions,
-        "code_sections": []  # Hier können später weitere Codeabschnitte ergänzt werden, inkl. Start-/Endzeilen
+    return generator.result(source_file)
+
+def _scan_chunk(files: list[str]) -> list[dict]:
+    """Scannt mehrere Dateien in einem Worker (weniger Prozess-Roundtrips bei vielen kleinen Dateien)."""
+    return [scan_file(f) for f in files]
+
+def scan_files(files: list[str], workers: int | None = None) -> list[dict]:
+    """Scannt alle Dateien parallel; bei einem Worker oder einer Datei ohne Prozesspool."""
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(files) <= 1:
+        return [scan_file(f) for f in files]
+    chunks = [files[i:i + SCAN_CHUNK_SIZE] for i in range(0, len(files), SCAN_CHUNK_SIZE)]
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk_results in executor.map(_scan_chunk, chunks):
+            results.extend(chunk_results)
+    return results
+
+def project_packages(results: list[dict], root: str = ".") -> set[str]:
+    """
+    Oberste Paket- bzw. Modulnamen des Projekts: erste Komponente jeder gescannten Datei relativ zu root
+    sowie root selbst, falls es ein Paket ist (Importe der Form "from root.modul import name").
+    """
+    packages = set()
+    for result in results:
+        parts = os.path.relpath(result["file"], root).split(os.sep)
+        packages.add(os.path.splitext(parts[0])[0])
+    if os.path.isfile(os.path.join(root, "__init__.py")):
+        packages.add(os.path.basename(os.path.abspath(root)))
+    return packages
+
+def is_project_module(module: str, packages: set[str]) -> bool:
+    """Relative Importe gehören immer zum Projekt, absolute, wenn ihr oberstes Paket gescannt wurde."""
+    return module.startswith(".") or module.split(".")[0] in packages
+
+def build_whitelist(results: list[dict], root: str = ".", exclude: str | None = None,
+                    min_count: int = 1, limit: int | None = None) -> dict:
+    """
+    Führt die Ergebnisse aller Dateien zusammen: Je Name ein Eintrag mit Kapazität (Vorkommen über alle
+    Dateien), absteigend nach Kapazität sortiert. Öffentliche API-Namen (__all__ sowie aus Projektmodulen
+    importierte oder als deren Attribut verwendete Namen), Dunder-Namen und Namen, die auf den regulären
+    Ausdruck exclude passen, werden ausgeschlossen.
+    """
+    capacity = Counter()
+    file_counts = Counter()
+    function_capacity = Counter()
+    global_names = set()
+    public = set()
+    first_seen = {}
+    packages = project_packages(results, root)
+    for result in results:
+        if result["status"] != "ok":
+            continue
+        public.update(result["exported"])
+        public.update(name for module, name in result["references"] if is_project_module(module, packages))
+        global_names.update(result["global_names"])
+        function_capacity.update(result["functions"])
+        for counts in (result["variables"], result["functions"]):
+            capacity.update(counts)
+        file_counts.update(set(result["variables"]) | set(result["functions"]))
+        for name, line in result["first_lines"].items():
+            first_seen.setdefault(name, (os.path.relpath(result["file"], root), line))
+    pattern = re.compile(exclude) if exclude else None
+    candidates = [(name, count) for name, count in capacity.items()
+                  if count >= min_count and name not in public
+                  and not (name.startswith("__") and name.endswith("__"))
+                  and not (pattern and pattern.search(name))]
+    candidates.sort(key=lambda item: (-item[1], item[0]))
+    if limit is not None:
+        candidates = candidates[:limit]
+    variables = []
+    for name, count in candidates:
+        file, line = first_seen[name]
+        variables.append({
+            "name": name,
+            "capacity": count,
+            "files": file_counts[name],
+            "file": file,
+            "line_number": line,
+            "code_context": "Funktion" if function_capacity[name] * 2 >= count else "Variable",
+            "is_global": name in global_names,
+            "reason_for_inclusion": f"Automatisch ausgewählt (Häufigkeit: {count} in {file_counts[name]} Dateien)",
+        })
+    return {
+        "variables": variables,
+        "code_sections": [],  # Hier können später weitere Codeabschnitte ergänzt werden, inkl. Start-/Endzeilen
+        "excluded_public": len(public & set(capacity)),
     }
-    with open("generated_whitelist.json", "w", encoding="utf-8") as f:
-        json.dump(whitelist, f, indent=2)
-    print("Whitelist generiert und in 'generated_whitelist.json' gespeichert.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Whitelist für die Wasserzeichen-Einbettung generieren")
+    parser.add_argument("targets", nargs="+", help="Python-Dateien, Verzeichnisse oder Glob-Muster")
+    parser.add_argument("-o", "--output", default="generated_whitelist.json", help="Zieldatei der Whitelist")
+    parser.add_argument("--workers", type=int, default=None, help="Anzahl der Worker-Prozesse (Standard: CPU-Kerne)")
+    parser.add_argument("--min-count", type=int, default=1, help="Mindestkapazität eines Namens")
+    parser.add_argument("--limit", type=int, default=None, help="Nur die N Namen mit der höchsten Kapazität")
+    parser.add_argument("--exclude", default=None, help="Regulärer Ausdruck für auszuschließende Namen")
+    args = parser.parse_args()
+
+    files = []
+    roots = []
+    for target in args.targets:
+        if is_batch_target(target):
+            root, found = collect_source_files(target)
+            roots.append(root)
+            files.extend(found)
+        else:
+            roots.append(os.path.dirname(os.path.abspath(target)))
+            files.append(target)
+    if not files:
+        print("Keine Python-Dateien gefunden.")
+        sys.exit(1)
+    root = os.path.commonpath([os.path.abspath(r) for r in roots])
+    results = scan_files(files, args.workers)
+    for result in results:
+        if result["status"] != "ok":
+            print(f"Übersprungen: {result['file']} ({result['error']})", file=sys.stderr)
+    whitelist = build_whitelist(results, root, args.exclude, args.min_count, args.limit)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(whitelist, f, indent=2, ensure_ascii=False)
+    capacity = sum(entry["capacity"] for entry in whitelist["variables"])
+    print(f"Whitelist mit {len(whitelist['variables'])} Namen (Kapazität {capacity} Bits, "
+          f"{whitelist['excluded_public']} öffentliche Namen ausgeschlossen) aus {len(files)} Dateien "
+          f"in '{args.output}' gespeichert.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+instrumentation.py
+------------------
+Dieses Modul implementiert die Laufzeitmessung je Stufe (main.py --timings) und das Profiling je Datei
+(main.py --profile).
+- StageTimer sammelt die Zeit je Stufe (z. B. YAML laden, Key Vault, ast.parse, Plugins, Embedder,
+  Serialisierung, Datei-I/O) sowie Zähler (besuchte Knoten, verbrauchte Bits, Umbenennungen).
+  Ein abgeschalteter Timer misst nichts.
+- Timer aus Worker-Prozessen werden als Dict (to_dict) zurückgegeben und im Hauptprozess per merge
+  aufsummiert.
+- profiled() schreibt für einen Block cProfile-Daten im pstats-Format (auswertbar mit python -m pstats).
+"""
+
+import ast
+import contextlib
+import cProfile
+import os
+import time
+
+class _Stage:
+    """Kontextmanager, der die Dauer eines Blocks auf eine Stufe addiert."""
+    __slots__ = ("timer", "name", "start")
+
+    def __init__(self, timer: "StageTimer", name: str):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timer.add(self.name, time.perf_counter() - self.start)
+        return False
+
+_NULL_STAGE = contextlib.nullcontext()
+
+class StageTimer:
+    """Summiert Laufzeiten (Sekunden) je Stufe und Zähler; mit enabled=False ohne Messaufwand."""
+    __slots__ = ("enabled", "stages", "counters", "files")
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.stages = {}
+        self.counters = {}
+        self.files = 0
+
+    def stage(self, name: str):
+        """Kontextmanager für eine Stufe: with timer.stage("parse"): ..."""
+        return _Stage(self, name) if self.enabled else _NULL_STAGE
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name: str, value: int = 1) -> None:
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def count_embedder(self, embedder, tree=None) -> None:
+        """Übernimmt die Zähler eines Embedders; mit tree zusätzlich die Anzahl der Knoten im Durchlauf."""
+        if not self.enabled:
+            return
+        if tree is not None:
+            self.count("nodes_visited", sum(1 for _ in ast.walk(tree)))
+        self.count("bits_consumed", embedder.bits_consumed)
+        self.count("renames", embedder.renames)
+        self.count("changes", len(embedder.changes))
+
+    def to_dict(self) -> dict:
+        return {"stages": dict(self.stages), "counters": dict(self.counters), "files": self.files}
+
+    def merge(self, data: dict) -> None:
+        """Addiert die Messwerte eines anderen Timers (to_dict, z. B. aus einem Worker-Prozess)."""
+        for name, seconds in data["stages"].items():
+            self.add(name, seconds)
+        for name, value in data["counters"].items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        self.files += data["files"]
+
+    def report(self, title: str = "Laufzeit je Stufe") -> str:
+        """Tabelle der Stufen (absteigend nach Dauer, mit Anteil) und der Zähler."""
+        total = sum(self.stages.values())
+        lines = [f"{title} (Summe {total * 1000:.2f} ms" + (f", {self.files} Dateien" if self.files else "") + "):"]
+        for name, seconds in sorted(self.stages.items(), key=lambda item: item[1], reverse=True):
+            share = seconds / total * 100 if total else 0.0
+            lines.append(f" - {name:<16} {seconds * 1000:12.2f} ms  {share:5.1f}%")
+        if self.counters:
+            lines.append("Zähler: " + ", ".join(f"{name}={value}" for name, value in sorted(self.counters.items())))
+        return "\n".join(lines)
+
+@contextlib.contextmanager
+def profiled(path: str | None):
+    """Profilierung des Blocks mit cProfile; die pstats-Daten werden nach path geschrieben (None: aus)."""
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        profiler.dump_stats(path)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+key_session.py
+--------------
+Dieses Modul implementiert eine langlebige Schlüssel-Session für Einbettung und Erkennung.
+- Das Key Vault wird pro Session genau einmal entschlüsselt.
+- Aus dem Schlüssel einer Rolle (z. B. 'embedder', 'detector') wird das AES-Schlüsselmaterial
+  einmalig per HKDF-SHA256 abgeleitet und pro Rolle zwischengespeichert.
+- Embedder und Detector erhalten fertige Cipher-Fabriken (AesEaxCipherFactory) statt Schlüssel-Strings.
+- Optional hält ein lokaler Agent-Prozess (ähnlich ssh-agent) die Session und beantwortet Anfragen
+  über einen Unix-Socket, sodass parallele Prozesse das Vault nicht jeweils selbst entschlüsseln.
+  Der Agent gibt nur abgeleitete Schlüssel heraus, nie das Vault oder den Master-Key.
+
+Agent starten:   python key_session.py agent [--socket PFAD]
+Der Socket-Pfad wird Clients über die Umgebungsvariable STEGOPY_KEY_AGENT bekannt gemacht.
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+from Crypto.Cipher import AES
+from Crypto.Hash import SHA256
+from Crypto.Protocol.KDF import HKDF
+
+from event_log import get_logger
+
+# Umgebungsvariable mit dem Socket-Pfad des Agenten (analog zu SSH_AUTH_SOCK)
+AGENT_ENV = "STEGOPY_KEY_AGENT"
+DEFAULT_AGENT_SOCKET = os.path.join(os.path.expanduser("~"), ".stegopy-key-agent.sock")
+
+_log = get_logger("key_session")
+
+# Parameter der Schlüsselableitung (AES-128 wie bisher)
+KEY_LENGTH = 16
+_KDF_SALT = b"stegopy-watermark-kdf-v1"
+_KDF_CONTEXT = b"aes-eax"
+
+# Abgeleitete Schlüssel je Schlüssel-String (für Aufrufer ohne Session)
+_derived_keys = {}
+
+def derive_aes_key(secret: str) -> bytes:
+    """Leitet das AES-Schlüsselmaterial per HKDF-SHA256 aus einem Schlüssel-String ab (zwischengespeichert)."""
+    key = _derived_keys.get(secret)
+    if key is None:
+        key = HKDF(secret.encode("utf-8"), KEY_LENGTH, _KDF_SALT, SHA256, context=_KDF_CONTEXT)
+        _derived_keys[secret] = key
+    return key
+
+class AesEaxCipherFactory:
+    """Erzeugt AES-EAX-Cipher-Objekte aus bereits abgeleitetem Schlüsselmaterial."""
+    __slots__ = ("key",)
+
+    def __init__(self, key: bytes):
+        self.key = key
+
+    @classmethod
+    def coerce(cls, key) -> "AesEaxCipherFactory":
+        """Gibt key als Cipher-Fabrik zurück; Schlüssel-Strings werden per HKDF abgeleitet."""
+        if isinstance(key, AesEaxCipherFactory):
+            return key
+        return cls(derive_aes_key(key))
+
+    def new(self, nonce: bytes | None = None):
+        """Neues Cipher-Objekt (EAX-Cipher sind nur einmal verwendbar); ohne nonce wird eine zufällige erzeugt."""
+        return AES.new(self.key, AES.MODE_EAX, nonce=nonce)
+
+class KeySession:
+    """
+    Hält die Rollen-Schlüssel einer Sitzung und leitet das AES-Schlüsselmaterial je Rolle einmalig ab.
+    Quelle ist entweder ein Dict Rolle -> Schlüssel-String oder (für Agent-Clients) eine Funktion
+    fetch(role) -> bytes | None, die bereits abgeleitetes Material liefert.
+    """
+    def __init__(self, secrets: dict | None = None, fetch=None):
+        self.secrets = secrets or {}
+        self.fetch = fetch
+        self._keys = {}
+
+    @classmethod
+    def from_vault(cls, vault_file: str = "key_vault.json.enc", master_key: str | None = None) -> "KeySession":
+        """Entschlüsselt das Key Vault einmalig und übernimmt dessen Schlüssel."""
+        from key_vault import KeyVault
+        return cls(dict(KeyVault(vault_file, master_key).keys))
+
+    @classmethod
+    def from_agent(cls, socket_path: str) -> "KeySession":
+        """Session, deren Schlüssel bei einem laufenden Agenten abgefragt werden."""
+        return cls(fetch=lambda role: request_agent_key(socket_path, role))
+
+    def key(self, role: str) -> bytes | None:
+        """Abgeleitetes Schlüsselmaterial der Rolle oder None, falls kein Schlüssel hinterlegt ist."""
+        if role not in self._keys:
+            if self.fetch is not None:
+                self._keys[role] = self.fetch(role)
+            else:
+                secret = self.secrets.get(role)
+                self._keys[role] = derive_aes_key(secret) if secret else None
+        return self._keys[role]
+
+    def cipher_factory(self, role: str) -> AesEaxCipherFactory | None:
+        """Cipher-Fabrik der Rolle oder None, falls nicht verschlüsselt werden soll."""
+        key = self.key(role)
+        return AesEaxCipherFactory(key) if key else None
+
+def open_key_session(config: dict, vault_file: str = "key_vault.json.enc") -> KeySession:
+    """
+    Öffnet die Schlüssel-Session für einen Lauf, in dieser Reihenfolge:
+      1. laufender Agent (Umgebungsvariable STEGOPY_KEY_AGENT),
+      2. Key Vault (Master-Key aus KEY_VAULT_MASTER), einmalig entschlüsselt,
+      3. Schlüssel aus der Konfiguration bzw. der Umgebungsvariable ENCRYPTION_KEY.
+    """
+    socket_path = os.environ.get(AGENT_ENV)
+    if socket_path:
+        return KeySession.from_agent(socket_path)
+    try:
+        return KeySession.from_vault(vault_file)
+    except Exception as e:
+        _log.warning("Key Vault Fehler: %s. Schlüssel aus der Konfiguration werden verwendet.", e)
+    fallback = os.environ.get("ENCRYPTION_KEY")
+    return KeySession({"embedder": config.get("encryption_key_embedder", fallback),
+                       "detector": config.get("encryption_key_detector", fallback)})
+
+def request_agent_key(socket_path: str, role: str) -> bytes | None:
+    """Fragt das abgeleitete Schlüsselmaterial einer Rolle beim Agenten ab."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(json.dumps({"role": role}).encode("utf-8") + b"\n")
+        response = json.loads(client.makefile("rb").readline())
+    if "error" in response:
+        raise ValueError(f"Key Agent Fehler: {response['error']}")
+    return bytes.fromhex(response["key"]) if response["key"] else None
+
+class _AgentHandler(socketserver.StreamRequestHandler):
+    """Beantwortet eine JSON-Zeile {"role": ...} mit {"key": hex | null}."""
+    def handle(self):
+        try:
+            role = json.loads(self.rfile.readline())["role"]
+            key = self.server.session.key(role)
+            response = {"key": key.hex() if key else None}
+        except (ValueError, KeyError, TypeError) as e:
+            response = {"error": str(e)}
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+class KeyAgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix-Socket-Server, der die Schlüssel einer Session an lokale Prozesse ausgibt."""
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, session: KeySession):
+        self.session = session
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        # Socket nur für den eigenen Benutzer zugänglich anlegen
+        previous_umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, _AgentHandler)
+        finally:
+            os.umask(previous_umask)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+def main():
+    parser = argparse.ArgumentParser(description="Schlüssel-Agent für das Wasserzeichen-System")
+    parser.add_argument("command", choices=["agent"], help="'agent': Session halten und über einen Unix-Socket bereitstellen")
+    parser.add_argument("--socket", default=DEFAULT_AGENT_SOCKET, help="Pfad des Unix-Sockets")
+    parser.add_argument("--vault", default="key_vault.json.enc", help="Pfad zur verschlüsselten Vault-Datei")
+    args = parser.parse_args()
+    try:
+        session = KeySession.from_vault(args.vault)
+    except ValueError as e:
+        print(f"Key Vault Fehler: {e}", file=sys.stderr)
+        sys.exit(1)
+    with KeyAgentServer(args.socket, session) as server:
+        print(f"{AGENT_ENV}={args.socket}; export {AGENT_ENV};")
+        sys.stdout.flush()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
@@ -4,18 +4,45 @@ main.py
 -------
 Dies ist der Haupteinstiegspunkt für das erweiterte Wasserzeichen-System.
 Über die Kommandozeile kann zwischen Wasserzeicheneinbettung (embed) und -erkennung (detect) gewählt werden.
+Mit "issue" wird das Wasserzeichen einmalig als Artefakt vorberechnet, das embed und detect statt der
+Konfiguration verwenden können (--artifact bzw. watermark_artifact in config.yaml).
+Mit "issue --tenant" wird das Artefakt zusätzlich im Mandanten-Register abgelegt; "detect --registry"
+bewertet eine verdächtige Datei gegen alle registrierten Mandanten.
+"serve" startet einen langlebigen Erkennungsdienst (HTTP auf localhost oder Unix-Socket) mit warmem Zustand.
+Wird für "embed" ein Verzeichnis oder Glob-Muster angegeben, läuft die Einbettung parallel im Batch-Modus.
+Für "detect" kann zusätzlich ein Archiv (tar/zip) angegeben werden; die Ergebnisse werden als JSON Lines gestreamt.
+Mit "--timings" wird für "embed" die Laufzeit je Stufe ausgegeben, mit "--profile" je Datei ein cProfile-Profil geschrieben.
 Zusätzlich werden hier die Konfiguration geladen, der Key Vault initialisiert und der Plugin Manager genutzt.
 """
 
 import argparse
+import asyncio
 import yaml
 import os
 import ast
-import astor
-from watermark_embedder import WatermarkEmbedder, generate_watermark_bits
-from watermark_detector import WatermarkDetector
-from plugin_manager import PluginManager
-from key_vault import KeyVault
+import json
+import logging
+import random
+import sys
+from watermark_embedder import (WatermarkEmbedder, generate_watermark_bits, embed_streaming, render_output,
+                                OUTPUT_BACKENDS)
+from watermark_detector import (payload_is_reproducible, compare_watermark, decode_aligned_window,
+                                watermark_detected, extract_watermark_bits_from_file)
+from plugin_manager import PluginManager, check_output_backend, DEFAULT_PLUGINS_DIR
+from key_session import open_key_session
+from watermark_artifact import issue_artifact, write_artifact, load_artifact, DEFAULT_ARTIFACT_PATH
+from watermark_registry import WatermarkRegistry, DEFAULT_REGISTRY_PATH
+from detection_server import DetectionServer
+from error_correction import reed_solomon_params
+from embed_cache import EmbedCache, source_hash, context_hash, DEFAULT_CACHE_PATH, DEFAULT_MAX_ENTRIES
+from event_log import configure_logging, get_logger, log_event, log_file_changes
+from instrumentation import StageTimer, profiled
+from batch_processing import (is_batch_target, is_archive, collect_source_files, run_batch_embed,
+                              iter_detection_sources, run_batch_detect, run_sequential_detect)
+from sequential_test import SequentialTest
+from pipeline import run_pipeline, write_report
+
+_log = get_logger("main")
 
 def load_config(config_file: str = "config.yaml") -> dict:
     """Lädt die Konfiguration aus der YAML-Datei."""
@@ -23,91 +50,435 @@ def load_config(config_file: str = "config.yaml") -> dict:
         config = yaml.safe_load(f)
     return config
 
-def main():
-    parser = argparse.ArgumentParser(description="Erweitertes Wasserzeichen-System")
-    parser.add_argument("mode", choices=["embed", "detect"], help="Modus: 'embed' für Einbettung, 'detect' für Erkennung")
-    parser.add_argument("file", help="Pfad zur Eingabedatei (Python-Quelldatei)")
-    args = parser.parse_args()
+def load_whitelist(whitelist_file: str = "whitelist.json") -> tuple[list, list]:
+    """Lädt die Whitelist und gibt Variablen- und Codeabschnitts-Whitelist zurück."""
+    with open(whitelist_file, "r", encoding="utf-8") as f:
+        whitelist = json.load(f)
+    variable_whitelist = [var["name"] for var in whitelist.get("variables", [])]
+    code_section_whitelist = [section["type"] for section in whitelist.get("code_sections", [])]
+    return variable_whitelist, code_section_whitelist
 
-    config = load_config()
+def print_batch_summary(summary: dict) -> None:
+    """Gibt die aggregierte Zusammenfassung eines Batch-Laufs aus."""
+    print(f"\nBatch-Einbettung abgeschlossen in {summary['elapsed']:.2f}s:")
+    print(f" - Dateien verarbeitet: {summary['files']}")
+    print(f" - Erfolgreich: {summary['succeeded']}, Fehlgeschlagen: {summary['failed']}")
+    print(f" - Vorgenommene Änderungen: {summary['changes']}")
+    print(f" - Aus dem Cache übernommen: {summary['cache_hits']}")
+    print(f" - Ausgabeverzeichnis: {summary['output_dir']}")
+    for error in summary["errors"]:
+        print(f"   Fehler in '{error['file']}': {error['error']}")
 
-    # Initialisiere das Key Vault
-    try:
-        key_vault = KeyVault()
-    except Exception as e:
-        print(f"Key Vault Fehler: {e}")
-        key_vault = None
+def print_pipeline_report(report: dict, report_path: str) -> None:
+    """Gibt die Zusammenfassung eines Pipeline-Laufs aus."""
+    print(f"\nPipeline abgeschlossen in {report['elapsed']:.2f}s:")
+    print(f" - Dateien verarbeitet: {report['files']}")
+    print(f" - Erfolgreich: {report['succeeded']}, Fehlgeschlagen: {report['failed']}")
+    print(f" - Whitelist: {len(report['whitelist']['variables'])} Namen, Kapazität {report['capacity']} Bits")
+    print(f" - Vorgenommene Änderungen: {report['changes']}")
+    print(f" - Ausgabeverzeichnis: {report['output_dir']}")
+    for error in report["errors"]:
+        print(f"   Fehler in '{error['file']}': {error['error']}")
+    for source_file in report["unverified"]:
+        print(f"   Geschriebene Bits in '{source_file}' weichen von der eingebetteten Bitfolge ab")
+    corpus = report["corpus"]
+    verdict = "erkannt" if corpus["detected"] else "nicht erkannt"
+    print(f"Prüfung: Wasserzeichen {verdict} ({corpus['confidence']:.2f}% Übereinstimmung, "
+          f"p-Wert {corpus['p_value']:.3g}); Bericht in '{report_path}' gespeichert.")
 
-    if args.mode == "embed":
-        # Wasserzeicheneinbettung
-        if key_vault:
-            config["encryption_key_embedder"] = key_vault.get_key("embedder")
-        # Generiere Wasserzeichen-Bits (inklusive Fehlerkorrektur und Verschlüsselung)
-        watermark_bits = generate_watermark_bits(config)
-        print("Erzeugte Wasserzeichen-Bits:", watermark_bits)
+def print_plugin_report(plugin_manager: PluginManager) -> None:
+    """Importiert alle Plugins und gibt ihre Ladezeiten absteigend sortiert aus."""
+    plugin_manager.load_all()
+    print("\nPlugin-Ladezeiten:")
+    for entry in plugin_manager.load_report():
+        seconds = "nicht geladen" if entry["seconds"] is None else f"{entry['seconds'] * 1000:8.1f} ms"
+        node_types = ", ".join(entry["node_types"]) or "-"
+        print(f" - {entry['name']:<24} {seconds:>13}  {entry['entry'] or 'ungültig'} ({node_types})")
+
+def print_tenant_ranking(result: dict) -> None:
+    """Gibt die besten Mandanten-Kandidaten einer Register-Suche und das Urteil aus."""
+    print(f"\nBeste Kandidaten aus {result['tenants']} registrierten Mandanten:")
+    for rank, candidate in enumerate(result["candidates"], start=1):
+        print(f" {rank}. {candidate['tenant']}: {candidate['confidence']:.2f}% "
+              f"({candidate['matches']}/{candidate['compared']} Bits, Verschiebung {candidate['offset']}, "
+              f"p = {candidate['p_value']:.2e}, "
+              f"Fehlerkorrektur {'dekodiert' if candidate['ecc_decoded'] else 'nicht dekodierbar'})")
+    if result["tenant"]:
+        print(f"Mandant identifiziert: {result['tenant']} (Vorsprung {result['margin']} Bits).")
+    elif result["ambiguous"]:
+        print("Nicht eindeutig: Die Bits passen signifikant zu mehreren Mandanten.")
+    else:
+        print("Kein Mandant signifikant.")
+
+def print_corpus_verdict(verdict: dict) -> None:
+    """Gibt das Gesamturteil einer Batch-Erkennung auf stderr aus (stdout bleibt reines JSON Lines)."""
+    print(f"\nBatch-Erkennung abgeschlossen in {verdict['elapsed']:.2f}s: {verdict['files']} Dateien, "
+          f"{verdict['files_with_bits']} mit Wasserzeichen-Bits, {verdict['failed']} fehlgeschlagen.", file=sys.stderr)
+    if verdict["detected"]:
+        print("Korpus-Urteil: Wasserzeichen erkannt.", file=sys.stderr)
+    else:
+        print(f"Korpus-Urteil: {verdict['confidence']:.2f}% der kombinierten Bits stimmen überein "
+              f"(Verschiebung {verdict['offset']}, p-Wert {verdict['p_value']:.3g}).", file=sys.stderr)
+
+def print_sequential_verdict(verdict: dict, seed: int) -> None:
+    """Gibt das Ergebnis einer sequentiellen Erkennung auf stderr aus."""
+    print(f"\nSequentielle Erkennung abgeschlossen in {verdict['elapsed']:.2f}s: {verdict['files']} Dateien geprüft, "
+          f"{verdict['files_with_bits']} mit Wasserzeichen-Bits, {verdict['failed']} fehlgeschlagen (Seed {seed}).",
+          file=sys.stderr)
+    if verdict["files_needed"] is None:
+        print(f"Keine Entscheidung: Log-Likelihood-Verhältnis {verdict['llr']} liegt nach allen Dateien zwischen "
+              f"{verdict['lower']} und {verdict['upper']}.", file=sys.stderr)
+    elif verdict["detected"]:
+        print(f"Korpus-Urteil: Wasserzeichen erkannt nach {verdict['files_needed']} Dateien "
+              f"(alpha {verdict['alpha']}, beta {verdict['beta']}).", file=sys.stderr)
+    else:
+        print(f"Korpus-Urteil: kein Wasserzeichen nach {verdict['files_needed']} Dateien "
+              f"(alpha {verdict['alpha']}, beta {verdict['beta']}).", file=sys.stderr)
+
+def report_timings(timer: StageTimer) -> None:
+    """Gibt die Laufzeit je Stufe auf stderr aus und protokolliert sie als Ereignis "timings"."""
+    print("\n" + timer.report(), file=sys.stderr)
+    log_event(_log, logging.INFO, "timings", "Laufzeit je Stufe", **timer.to_dict())
+
+def profile_path(profile_dir: str | None, source_file: str) -> str | None:
+    """Pfad der pstats-Datei einer einzelnen Eingabedatei (None ohne --profile)."""
+    return os.path.join(profile_dir, os.path.basename(source_file) + ".pstats") if profile_dir else None
+
+def embed_command(args, config: dict, artifact, key_session, timer: StageTimer) -> None:
+    """Wasserzeicheneinbettung (einzelne Datei, Streaming oder Batch) mit Messung der Stufen."""
+    # Wasserzeichen-Bits aus dem Artefakt oder neu generiert (inklusive Fehlerkorrektur und Verschlüsselung)
+    with timer.stage("watermark"):
+        watermark_bits = artifact.payload if artifact else generate_watermark_bits(
+            config, key_session, shuffle_seed=config.get("shuffle_seed"))
+    print("Erzeugte Wasserzeichen-Bits:", watermark_bits)
+    # Lade die Whitelist (Liste kritischer Variablen/Funktionen) aus der JSON-Datei
+    with timer.stage("whitelist"):
+        variable_whitelist, code_section_whitelist = load_whitelist()
+    cache_config = config.get("embed_cache") or {}
+    cache_path = None if args.no_cache else cache_config.get("path", DEFAULT_CACHE_PATH)
+    if cache_path and not artifact and not payload_is_reproducible(config, key_session):
+        # Neue Bits bei jedem Lauf ergäben nie einen Treffer; der Cache würde nur wachsen
+        print("Einbettungs-Cache deaktiviert: Die Wasserzeichen-Bits ändern sich bei jedem Lauf (Verschlüsselung "
+              "bzw. zufällige Bit-Zuordnung ohne shuffle_seed). Ein Artefakt (--artifact) macht sie stabil.",
+              file=sys.stderr)
+        cache_path = None
+    cache_max_entries = int(cache_config.get("max_entries", DEFAULT_MAX_ENTRIES))
+    plugins_dir = None if args.no_plugins else DEFAULT_PLUGINS_DIR
+    if is_batch_target(args.file):
+        # Batch-Modus: Bits und Whitelist werden einmalig berechnet und an alle Worker verteilt
+        root, files = collect_source_files(args.file)
+        if not files:
+            print(f"Keine Python-Dateien gefunden für '{args.file}'.")
+            return
+        output_dir = args.output_dir or os.path.normpath(root) + "_transformed"
+        summary = run_batch_embed(files, root, output_dir, watermark_bits, variable_whitelist,
+                                  code_section_whitelist, alternate_naming=config.get("alternate_naming", False),
+                                  plugins_dir=plugins_dir, workers=args.workers, stream=args.stream, backend=args.backend,
+                                  cache_path=cache_path, cache_max_entries=cache_max_entries,
+                                  timings=timer.enabled, profile_dir=args.profile)
+        if summary["timings"]:
+            # Stufen der Worker (summiert über alle Dateien) zu den Stufen des Hauptprozesses
+            timer.merge(summary["timings"])
+        print_batch_summary(summary)
+        return
+    with profiled(profile_path(args.profile, args.file)):
+        if args.stream:
+            # Streaming-Modus: kein Gesamt-AST im Speicher, daher ohne interaktives Review
+            with timer.stage("plugins"):
+                plugin_manager = PluginManager(plugins_dir) if plugins_dir else None
+                node_hooks = plugin_manager.node_hooks if plugin_manager else None
+            embedder = WatermarkEmbedder(watermark_bits, variable_whitelist, code_section_whitelist,
+                                         alternate_naming=config.get("alternate_naming", False),
+                                         node_hooks=node_hooks)
+            with timer.stage("stream"):
+                chunks = embed_streaming(args.file, "file_transformed.py", embedder, plugin_manager,
+                                         backend=args.backend)
+            timer.count_embedder(embedder)
+            log_file_changes(_log, args.file, embedder.changes)
+            print(f"{chunks} Abschnitte verarbeitet, {len(embedder.changes)} Änderungen vorgenommen.")
+            print("Transformierter Code wurde in 'file_transformed.py' gespeichert.")
+            return
         # Lese den zu transformierenden Code ein
-        with open(args.file, "r", encoding="utf-8") as f:
-            code = f.read()
-        tree = ast.parse(code)
-        # Lade die Whitelist (Liste kritischer Variablen/Funktionen) aus der JSON-Datei
-        import json
-        with open("whitelist.json", "r", encoding="utf-8") as f:
-            whitelist = json.load(f)
-        variable_whitelist = [var["name"] for var in whitelist.get("variables", [])]
-        code_section_whitelist = [section["type"] for section in whitelist.get("code_sections", [])]
-        # Plugin Manager initialisieren und Plugins anwenden
-        plugin_manager = PluginManager()
-        tree = plugin_manager.apply_plugins(tree)
-        # Wasserzeichen-Embedder instanziieren und AST transformieren
+        with timer.stage("read"):
+            with open(args.file, "rb") as f:
+                raw = f.read()
         embedder = WatermarkEmbedder(watermark_bits, variable_whitelist, code_section_whitelist,
                                       review_mode=True, alternate_naming=config.get("alternate_naming", False))
-        new_tree = embedder.visit(tree)
-        new_code = astor.to_source(new_tree)
-        if embedder.review_mode:
-            print("Die folgenden Änderungen wurden vorgenommen:")
-            for change in embedder.changes:
-                print(" -", change)
-            confirmation = input("Möchtest Du die Änderungen übernehmen? (j/n): ")
-            if confirmation.lower() != 'j':
-                print("Keine Änderungen übernommen.")
-                return
+        with timer.stage("cache"):
+            cache = EmbedCache(cache_path, cache_max_entries) if cache_path else None
+            if cache:
+                cache_key = EmbedCache.make_key(source_hash(raw), context_hash(
+                    variable_whitelist, code_section_whitelist, watermark_bits, plugins_dir,
+                    {"alternate_naming": config.get("alternate_naming", False), "backend": args.backend}))
+            cached = cache.get(cache_key) if cache else None
+        if cached:
+            # Cache-Treffer: Parsen, Plugins, Embedder und Serialisierung entfallen
+            new_code, embedder.changes = cached
+            timer.count("cache_hits")
+            print("Unveränderte Datei: Ergebnis aus dem Einbettungs-Cache übernommen.")
+        else:
+            with timer.stage("parse"):
+                code = raw.decode("utf-8")
+                tree = ast.parse(code)
+            if plugins_dir:
+                # Plugin Manager initialisieren: Legacy-Plugins laufen vorab, die Hooks im Durchlauf des Embedders
+                with timer.stage("plugins"):
+                    plugin_manager = PluginManager(plugins_dir)
+                    tree = plugin_manager.apply_plugins(tree)
+                    embedder.node_hooks = plugin_manager.node_hooks
+            # Wasserzeichen-Embedder instanziieren und AST transformieren
+            with timer.stage("embed"):
+                new_tree = embedder.visit(tree)
+            with timer.stage("serialize"):
+                new_code = render_output(code, new_tree, embedder, args.backend)
+            timer.count_embedder(embedder, new_tree)
+            if cache:
+                with timer.stage("cache"):
+                    cache.put(cache_key, new_code, embedder.changes)
+        if cache:
+            cache.close()
+    log_file_changes(_log, args.file, embedder.changes, cached=bool(cached))
+    if embedder.review_mode:
+        print("Die folgenden Änderungen wurden vorgenommen:")
+        for change in embedder.changes:
+            print(" -", change)
+        confirmation = input("Möchtest Du die Änderungen übernehmen? (j/n): ")
+        if confirmation.lower() != 'j':
+            print("Keine Änderungen übernommen.")
+            return
+    with timer.stage("write"):
         with open("file_transformed.py", "w", encoding="utf-8") as f:
             f.write(new_code)
-        print("Transformierter Code wurde in 'file_transformed.py' gespeichert.")
-    elif args.mode == "detect":
-        # Wasserzeichenerkennung
-        if key_vault:
-            config["encryption_key_detector"] = key_vault.get_key("detector")
-        with open(args.file, "r", encoding="utf-8") as f:
-            code = f.read()
-        tree = ast.parse(code)
-        import json
-        with open("whitelist.json", "r", encoding="utf-8") as f:
-            whitelist = json.load(f)
-        variable_whitelist = [var["name"] for var in whitelist.get("variables", [])]
-        detector = WatermarkDetector(variable_whitelist)
-        detector.visit(tree)
-        extracted_bits = "".join(detector.detected_bits)
-        from error_correction import decode_error_correction
-        error_method = config.get("error_correction", "hamming")
-        extracted_bits = decode_error_correction(extracted_bits, method=error_method)
+    print("Transformierter Code wurde in 'file_transformed.py' gespeichert.")
+
+def pipeline_command(args, config: dict, artifact, key_session, timer: StageTimer) -> dict:
+    """Whitelist-Generierung, Einbettung und Prüfung in einem Durchlauf (siehe pipeline)."""
+    if is_batch_target(args.file):
+        root, files = collect_source_files(args.file)
+    else:
+        root, files = os.path.dirname(os.path.abspath(args.file)), [args.file]
+    with timer.stage("watermark"):
+        if artifact:
+            watermark_bits, error_method, rs_params = artifact.payload, artifact.error_method, artifact.rs_params
+        else:
+            # Eingebettet und geprüft wird dieselbe Bitfolge, sie muss daher nicht reproduzierbar sein
+            watermark_bits = generate_watermark_bits(config, key_session, shuffle_seed=config.get("shuffle_seed"))
+            error_method, rs_params = config.get("error_correction", "hamming"), reed_solomon_params(config)
+    # Codeabschnitte werden nicht generiert; sie stammen weiterhin aus whitelist.json, sofern vorhanden
+    code_section_whitelist = load_whitelist()[1] if os.path.exists("whitelist.json") else []
+    output_dir = args.output_dir or os.path.normpath(root) + "_transformed"
+    report = run_pipeline(files, root, output_dir, watermark_bits, error_method, rs_params,
+                          code_section_whitelist, alternate_naming=config.get("alternate_naming", False),
+                          plugins_dir=None if args.no_plugins else DEFAULT_PLUGINS_DIR, backend=args.backend,
+                          exclude=args.exclude, min_count=args.min_count, limit=args.limit, timer=timer)
+    with timer.stage("write"):
+        write_report(args.report, report)
+    print_pipeline_report(report, args.report)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Erweitertes Wasserzeichen-System")
+    parser.add_argument("mode", choices=["embed", "detect", "issue", "serve", "pipeline"],
+                        help="Modus: 'embed' für Einbettung, 'detect' für Erkennung, 'issue' für das Wasserzeichen-Artefakt, "
+                             "'serve' für den Erkennungsdienst, 'pipeline' für Whitelist, Einbettung und Prüfung "
+                             "in einem Durchlauf")
+    parser.add_argument("file", nargs="?",
+                        help="Pfad zur Eingabedatei (Python-Quelldatei), einem Verzeichnis oder Glob-Muster; "
+                             f"bei 'issue' der Zielpfad des Artefakts (Standard: {DEFAULT_ARTIFACT_PATH})")
+    parser.add_argument("-o", "--output-dir", help="Ausgabeverzeichnis im Batch-Modus (gespiegelter Verzeichnisbaum)")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="Anzahl der Worker-Prozesse im Batch-Modus (Standard: alle CPU-Kerne)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Große Dateien abschnittsweise (je Top-Level-Anweisung) einbetten und direkt schreiben")
+    parser.add_argument("--backend", choices=OUTPUT_BACKENDS, default="astor",
+                        help="Ausgabe-Backend: 'astor' erzeugt den Code neu, 'tokens' patcht nur die geänderten Stellen "
+                             "(Kommentare und Formatierung bleiben erhalten; nur ohne Plugins, siehe --no-plugins)")
+    parser.add_argument("--no-plugins", action="store_true",
+                        help=f"Keine Plugins aus '{DEFAULT_PLUGINS_DIR}' anwenden (Voraussetzung für '--backend tokens', "
+                             "solange dort Plugins liegen)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Einbettungs-Cache ignorieren (weder lesen noch schreiben). Ohne Artefakt ist der Cache "
+                             "ohnehin nur aktiv, wenn die Bits reproduzierbar sind (keine Verschlüsselung, "
+                             "shuffle_seed bei zufälliger Bit-Zuordnung)")
+    parser.add_argument("--plugin-report", action="store_true",
+                        help="Ladezeit je Plugin ausgeben (importiert dazu alle Plugins)")
+    parser.add_argument("--artifact",
+                        help="Vorberechnetes Wasserzeichen-Artefakt für embed/detect (Standard: watermark_artifact aus config.yaml)")
+    parser.add_argument("-c", "--config", default="config.yaml", help="Konfigurationsdatei (z. B. je Mandant)")
+    parser.add_argument("--tenant", help="Bei 'issue': Artefakt unter diesem Mandanten im Register ablegen")
+    parser.add_argument("--registry",
+                        help="Mandanten-Register (SQLite); bei 'detect' wird gegen alle Mandanten bewertet "
+                             f"(Standard für 'issue': watermark_registry aus config.yaml bzw. {DEFAULT_REGISTRY_PATH})")
+    parser.add_argument("--top-k", type=int, default=5, help="Anzahl der ausgegebenen Kandidaten bei 'detect --registry'")
+    parser.add_argument("--host", default="127.0.0.1", help="Bei 'serve': Adresse des HTTP-Dienstes")
+    parser.add_argument("--port", type=int, default=8765, help="Bei 'serve': Port des HTTP-Dienstes")
+    parser.add_argument("--socket", help="Bei 'serve': Unix-Socket statt TCP verwenden")
+    parser.add_argument("-v", "--verbose", action="count", default=0,
+                        help="Ausführlichere Protokollierung: -v Änderungen je Datei, -vv jede Umbenennung/jedes Bit")
+    parser.add_argument("--log-jsonl", help="Protokoll-Ereignisse zusätzlich als JSON Lines an diese Datei anhängen")
+    parser.add_argument("--timings", action="store_true",
+                        help="Laufzeit je Stufe (YAML, Key Vault, Parsen, Plugins, Embedder, Serialisierung, I/O) "
+                             "und Zähler ausgeben; im Batch-Modus über alle Worker summiert")
+    parser.add_argument("--profile", metavar="VERZEICHNIS",
+                        help="cProfile-Daten je Datei als .pstats in dieses Verzeichnis schreiben")
+    parser.add_argument("--jsonl", help="Zieldatei für die JSON-Lines-Ergebnisse der Batch-Erkennung (Standard: stdout)")
+    parser.add_argument("--sequential", action="store_true",
+                        help="Batch-Erkennung sequentiell (SPRT): Dateien in zufälliger Reihenfolge prüfen und "
+                             "abbrechen, sobald entschieden werden kann")
+    parser.add_argument("--alpha", type=float, default=0.001,
+                        help="Bei '--sequential': maximale Falsch-positiv-Rate (Standard: 0.001)")
+    parser.add_argument("--beta", type=float, default=0.001,
+                        help="Bei '--sequential': maximale Falsch-negativ-Rate (Standard: 0.001)")
+    parser.add_argument("--match-rate", type=float, default=0.9,
+                        help="Bei '--sequential': erwartete Bit-Trefferrate markierter Dateien (Standard: 0.9)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Bei '--sequential': Seed für die Reihenfolge der Dateien (Standard: zufällig, wird ausgegeben)")
+    parser.add_argument("--report", default="pipeline_report.json",
+                        help="Bei 'pipeline': Zieldatei des Prüfberichts (Standard: pipeline_report.json)")
+    parser.add_argument("--exclude", default=None,
+                        help="Bei 'pipeline': Regulärer Ausdruck für Namen, die nicht in die Whitelist aufgenommen werden")
+    parser.add_argument("--min-count", type=int, default=1, help="Bei 'pipeline': Mindestkapazität eines Namens")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="Bei 'pipeline': Nur die N Namen mit der höchsten Kapazität in die Whitelist aufnehmen")
+    args = parser.parse_args()
+    configure_logging(args.verbose, args.log_jsonl)
+    timer = StageTimer(args.timings)
+    if args.file is None and args.mode in ("embed", "detect", "pipeline"):
+        parser.error(f"Für '{args.mode}' wird eine Eingabedatei benötigt.")
+    if args.mode in ("embed", "pipeline"):
+        # Das Backend "tokens" würde die Änderungen der Plugins stillschweigend verwerfen
+        try:
+            check_output_backend(args.backend, None if args.no_plugins else DEFAULT_PLUGINS_DIR)
+        except ValueError as e:
+            parser.error(str(e))
+
+    with timer.stage("config"):
+        config = load_config(args.config)
+
+    if args.mode == "detect" and args.registry:
+        # Mandanten-Suche: Bits einmal extrahieren und gegen alle registrierten Muster bewerten
+        if is_batch_target(args.file) or is_archive(args.file):
+            parser.error("Die Mandanten-Suche erwartet eine einzelne Datei.")
+        variable_whitelist, _ = load_whitelist()
+        with open(args.file, "rb") as f:
+            raw_bits = extract_watermark_bits_from_file(args.file, f.read(), variable_whitelist)
+        registry = WatermarkRegistry(args.registry)
+        index = registry.build_index()
+        registry.close()
+        print_tenant_ranking(index.identify(raw_bits, args.top_k))
+        return
+
+    artifact_path = args.artifact or config.get("watermark_artifact")
+    with timer.stage("artifact"):
+        artifact = load_artifact(artifact_path) if artifact_path and args.mode != "issue" else None
+    # Schlüssel-Session: Agent, Key Vault (einmal entschlüsselt) oder Schlüssel aus der Konfiguration;
+    # mit Artefakt wird kein Schlüssel benötigt
+    with timer.stage("key_session"):
+        key_session = open_key_session(config) if artifact is None else None
+
+    if args.plugin_report:
+        print_plugin_report(PluginManager(DEFAULT_PLUGINS_DIR))
+
+    if args.mode == "issue":
+        # Wasserzeichen einmalig berechnen; ein fester shuffle_seed in der Konfiguration macht das Artefakt reproduzierbar
+        artifact = issue_artifact(config, key_session, shuffle_seed=config.get("shuffle_seed"))
+        output_path = args.file or DEFAULT_ARTIFACT_PATH
+        write_artifact(output_path, artifact)
+        print(f"Wasserzeichen-Artefakt '{output_path}' geschrieben: {len(artifact.payload)} Nutzbits, "
+              f"Fehlerkorrektur {artifact.error_method}.")
+        if args.tenant:
+            registry_path = args.registry or config.get("watermark_registry", DEFAULT_REGISTRY_PATH)
+            registry = WatermarkRegistry(registry_path)
+            registry.add(args.tenant, artifact)
+            print(f"Mandant '{args.tenant}' im Register '{registry_path}' abgelegt ({len(registry)} Mandanten).")
+            registry.close()
+        return
+
+    if args.mode == "pipeline":
+        try:
+            pipeline_command(args, config, artifact, key_session, timer)
+        finally:
+            if timer.enabled:
+                report_timings(timer)
+        return
+
+    if args.mode == "embed":
+        try:
+            embed_command(args, config, artifact, key_session, timer)
+        finally:
+            if timer.enabled:
+                report_timings(timer)
+    else:
+        # Wasserzeichenerkennung: Eingebettete Bitfolge aus dem Artefakt oder einmalig aus der Konfiguration
+        if artifact:
+            payload_bits, error_method, rs_params = artifact.payload, artifact.error_method, artifact.rs_params
+        else:
+            if not payload_is_reproducible(config, key_session):
+                print("Hinweis: Ohne Artefakt ist die eingebettete Bitfolge nicht reproduzierbar (Verschlüsselung "
+                      "oder zufällige Bit-Zuordnung ohne shuffle_seed); bitte mit 'issue' ein Artefakt ausstellen "
+                      "und für embed und detect verwenden.", file=sys.stderr)
+            payload_bits = generate_watermark_bits(config, key_session, shuffle_seed=config.get("shuffle_seed"))
+            error_method = config.get("error_correction", "hamming")
+            rs_params = reed_solomon_params(config)
+        if args.mode == "serve":
+            # Erkennungsdienst: Zustand bleibt im Speicher, Anfragen werden im Worker-Pool bearbeitet
+            variable_whitelist, _ = load_whitelist()
+            server = DetectionServer(variable_whitelist, payload_bits, error_method, rs_params, workers=args.workers)
+            try:
+                asyncio.run(server.serve(args.host, args.port, args.socket))
+            except KeyboardInterrupt:
+                print("Erkennungsdienst beendet.")
+            finally:
+                server.close()
+            return
+        if is_batch_target(args.file) or is_archive(args.file):
+            # Batch-Erkennung: Bitfolge und Whitelist werden einmalig berechnet
+            variable_whitelist, _ = load_whitelist()
+            if args.sequential:
+                try:
+                    test = SequentialTest(args.alpha, args.beta, args.match_rate)
+                except ValueError as e:
+                    parser.error(str(e))
+                seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+                sources = iter_detection_sources(args.file, shuffle_seed=seed)
+                if args.jsonl:
+                    with open(args.jsonl, "w", encoding="utf-8") as sink:
+                        verdict = run_sequential_detect(sources, variable_whitelist, payload_bits, error_method,
+                                                        sink, workers=args.workers, rs_params=rs_params, test=test)
+                else:
+                    verdict = run_sequential_detect(sources, variable_whitelist, payload_bits, error_method,
+                                                    sys.stdout, workers=args.workers, rs_params=rs_params, test=test)
+                print_sequential_verdict(verdict, seed)
+                return
+            sources = iter_detection_sources(args.file)
+            if args.jsonl:
+                with open(args.jsonl, "w", encoding="utf-8") as sink:
+                    verdict = run_batch_detect(sources, variable_whitelist, payload_bits, error_method,
+                                               sink, workers=args.workers, rs_params=rs_params)
+            else:
+                verdict = run_batch_detect(sources, variable_whitelist, payload_bits, error_method,
+                                           sys.stdout, workers=args.workers, rs_params=rs_params)
+            print_corpus_verdict(verdict)
+            return
+        with open(args.file, "rb") as f:
+            data = f.read()
+        variable_whitelist, _ = load_whitelist()
+        raw_bits = extract_watermark_bits_from_file(args.file, data, variable_whitelist, verbose=True)
         print("\nExtrahierte Wasserzeichen-Bits aus dem Code:")
-        print(extracted_bits)
-        full_watermark_bits = generate_watermark_bits(config)
-        if key_vault or config.get("encryption_key_detector"):
-            # Entschlüsseln, falls Schlüssel vorhanden sind
-            from watermark_detector import decrypt_watermark
-            full_watermark_bits = decrypt_watermark(full_watermark_bits, config.get("encryption_key_detector", ""))
-        full_watermark_bits = decode_error_correction(full_watermark_bits, method=error_method)
-        print("\nErwartetes Wasserzeichen (Prefix des vollständigen Musters):")
-        expected_bits = full_watermark_bits[:len(extracted_bits)]
-        print(expected_bits)
-        match_count = len([b for b, e in zip(extracted_bits, expected_bits) if b == e])
-        confidence = (match_count / len(expected_bits) * 100) if expected_bits else 0
-        if extracted_bits == expected_bits:
+        print(raw_bits)
+        # Ausrichtung auf den Rohbits; dekodiert wird nur das ausgerichtete Fenster
+        alignment = compare_watermark(raw_bits, payload_bits)
+        decoded_bits, ecc_decoded = decode_aligned_window(raw_bits, alignment, len(payload_bits), error_method,
+                                                          **rs_params)
+        if ecc_decoded:
+            print("\nDekodiertes Wasserzeichen (ausgerichtetes Fenster):")
+            print(decoded_bits)
+        print(f"\nBeste Ausrichtung: Verschiebung {alignment.offset} von {alignment.offsets}, "
+              f"{alignment.matches}/{alignment.compared} Bits, p-Wert {alignment.p_value:.3g}")
+        if watermark_detected(alignment):
             print("\nWasserzeichen erkannt: Der Code enthält dein eingebettetes Wasserzeichen.")
         else:
-            print(f"\nWasserzeichen teilweise erkannt: {confidence:.2f}% der Bits stimmen überein.")
+            print(f"\nWasserzeichen teilweise erkannt: {alignment.confidence:.2f}% der Bits stimmen überein.")
             print("Wasserzeichen NICHT vollständig erkannt oder unvollständig.")
 
 if __name__ == "__main__":
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+pipeline.py
+-----------
+Dieses Modul implementiert den Release-Ablauf in einem Prozess: Whitelist generieren, Wasserzeichen einbetten
+und das Ergebnis prüfen. Statt generate_whitelist.py, "main.py embed" und "main.py detect" nacheinander
+auszuführen (dreimal Parsen, dreimal Konfiguration und Whitelist laden), wird jede Datei genau einmal geparst:
+1. Whitelist: Der WhitelistGenerator läuft auf den ASTs aller Dateien, build_whitelist wendet die
+   dateiübergreifenden Regeln an (öffentliche API-Namen bleiben unverändert).
+2. Einbettung: Plugins und WatermarkEmbedder transformieren denselben AST.
+3. Prüfung: Die Bits werden wie bei der Erkennung aus dem erzeugten Quelltext gelesen, also nach der
+   Serialisierung (astor bzw. tokens) und genau so, wie sie geschrieben werden. Jede Datei muss die
+   eingebettete Bitfolge ab ihrem Anfang exakt wiedergeben; zusätzlich wird wie bei der Erkennung der
+   p-Wert der besten Verschiebung berichtet.
+Geschrieben werden nur die transformierten Dateien (gespiegelter Verzeichnisbaum) und der Prüfbericht.
+Da die Whitelist alle Dateien kennen muss, bevor die erste eingebettet wird, liegen die ASTs aller Dateien
+gleichzeitig im Speicher und der Ablauf bleibt in einem Prozess (ASTs lassen sich nicht ohne Serialisierung
+an Worker-Prozesse übergeben). Für sehr große Repositories bleiben die Batch-Befehle die bessere Wahl.
+"""
+
+import ast
+import json
+import os
+import time
+import tokenize
+
+from watermark_embedder import WatermarkEmbedder, render_output
+from watermark_detector import (build_name_index, extract_watermark_bits_from_source, decode_aligned_window,
+                                compare_watermark, watermark_detected)
+from alignment import cyclic_matches
+from generate_whitelist import WhitelistGenerator, build_whitelist
+from batch_processing import mirror_output_path, combine_corpus_bits
+from plugin_manager import PluginManager, check_output_backend
+from bitvector import BitVector
+from event_log import get_logger, log_file_changes
+from instrumentation import StageTimer
+
+_log = get_logger("pipeline")
+
+def parse_sources(files: list[str], timer: StageTimer) -> tuple[list, list[dict]]:
+    """Liest und parst jede Datei einmal; liefert (Datei, Quelltext, AST) und die Fehler."""
+    parsed = []
+    errors = []
+    for source_file in files:
+        try:
+            with timer.stage("read"):
+                with open(source_file, "rb") as f:
+                    raw = f.read()
+            with timer.stage("parse"):
+                code = raw.decode("utf-8")
+                parsed.append((source_file, code, ast.parse(code, filename=source_file)))
+        except (OSError, SyntaxError, UnicodeDecodeError, ValueError) as e:
+            errors.append({"file": source_file, "status": "error", "error": str(e)})
+    return parsed, errors
+
+def run_pipeline(files: list[str], root: str, output_dir: str, watermark_bits: BitVector,
+                 error_method: str, rs_params: dict | None = None,
+                 code_section_whitelist: list | None = None, alternate_naming: bool = False,
+                 plugins_dir: str | None = "plugins", backend: str = "astor", exclude: str | None = None,
+                 min_count: int = 1, limit: int | None = None, timer: StageTimer | None = None) -> dict:
+    """
+    Führt Whitelist-Generierung, Einbettung und Prüfung für alle Dateien durch und schreibt die Ausgabe
+    nach output_dir. Zurückgegeben wird der Prüfbericht: die generierte Whitelist, je Datei die Anzahl der
+    Änderungen und das Ergebnis der Erkennung sowie das Gesamturteil über alle Dateien.
+    exclude, min_count und limit entsprechen den Optionen von generate_whitelist.py.
+    Das Backend "tokens" setzt voraus, dass keine Plugins vorhanden sind (sonst ValueError).
+    """
+    check_output_backend(backend, plugins_dir)
+    start = time.perf_counter()
+    timer = timer or StageTimer(False)
+    parsed, errors = parse_sources(files, timer)
+
+    with timer.stage("whitelist"):
+        scans = []
+        for source_file, _, tree in parsed:
+            generator = WhitelistGenerator()
+            generator.visit(tree)
+            scans.append(generator.result(source_file))
+        whitelist = build_whitelist(scans, root, exclude, min_count, limit)
+        variable_whitelist = [entry["name"] for entry in whitelist["variables"]]
+        name_index = build_name_index(variable_whitelist)
+
+    with timer.stage("plugins"):
+        plugin_manager = PluginManager(plugins_dir) if plugins_dir else None
+
+    results = []
+    bit_sequences = []
+    for source_file, code, tree in parsed:
+        output_file = mirror_output_path(source_file, root, output_dir)
+        embedder = WatermarkEmbedder(watermark_bits, variable_whitelist, code_section_whitelist or [],
+                                     review_mode=False, alternate_naming=alternate_naming)
+        try:
+            if plugin_manager:
+                with timer.stage("plugins"):
+                    tree = plugin_manager.apply_plugins(tree)
+                    embedder.node_hooks = plugin_manager.node_hooks
+            with timer.stage("embed"):
+                new_tree = embedder.visit(tree)
+            with timer.stage("serialize"):
+                new_code = render_output(code, new_tree, embedder, backend)
+            timer.count_embedder(embedder, new_tree)
+            # Prüfung auf dem erzeugten Quelltext, damit auch Fehler der Serialisierung auffallen
+            with timer.stage("verify"):
+                raw_bits = extract_watermark_bits_from_source(new_code, variable_whitelist, name_index=name_index,
+                                                              filename=output_file)
+                exact = cyclic_matches(raw_bits, watermark_bits) == len(raw_bits)
+                alignment = compare_watermark(raw_bits, watermark_bits)
+                _, ecc_decoded = decode_aligned_window(raw_bits, alignment, len(watermark_bits), error_method,
+                                                       **(rs_params or {}))
+            with timer.stage("write"):
+                os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+                with open(output_file, "w", encoding="utf-8") as f:
+                    f.write(new_code)
+        except (OSError, SyntaxError, ValueError, tokenize.TokenError) as e:
+            errors.append({"file": source_file, "status": "error", "error": str(e)})
+            continue
+        log_file_changes(_log, source_file, embedder.changes)
+        if raw_bits:
+            bit_sequences.append(raw_bits)
+        results.append({"file": source_file, "output": output_file, "status": "ok",
+                        "changes": len(embedder.changes), "bits_found": len(raw_bits), "exact": exact,
+                        "ecc_decoded": ecc_decoded, "matches": alignment.matches,
+                        "confidence": round(alignment.confidence, 2), "offset": alignment.offset,
+                        "p_value": alignment.p_value, "detected": watermark_detected(alignment)})
+
+    corpus = compare_watermark(combine_corpus_bits(bit_sequences), watermark_bits)
+    return {
+        "type": "pipeline",
+        "files": len(files),
+        "succeeded": len(results),
+        "failed": len(errors),
+        "output_dir": output_dir,
+        "whitelist": whitelist,
+        "capacity": sum(entry["capacity"] for entry in whitelist["variables"]),
+        "changes": sum(r["changes"] for r in results),
+        # Dateien, deren geschriebene Bits von der eingebetteten Bitfolge abweichen
+        "unverified": [r["file"] for r in results if not r["exact"]],
+        "corpus": {**corpus.to_dict(), "detected": watermark_detected(corpus)},
+        "results": results,
+        "errors": errors,
+        "elapsed": round(time.perf_counter() - start, 3),
+        "timings": timer.to_dict() if timer.enabled else None,
+    }
+
+def write_report(path: str, report: dict) -> None:
+    """Schreibt den Prüfbericht als JSON."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
@@ -1,53 +1,272 @@
-#!usrbinenv python3
-
-    """plugin_manager.py
+#!/usr/bin/env python3
+"""
+plugin_manager.py
 -----------------
 Dieses Modul implementiert ein vollwertiges Plugin-System.
-Es lädt alle Plugins aus dem Verzeichnis plugins und wendet sie auf einen gegebenen AST an.
-Jedes Plugin muss eine Funktion apply(ast_tree ast.AST) - ast.AST implementieren.
+Es lädt alle Plugins aus dem Verzeichnis "plugins" und wendet sie auf einen gegebenen AST an.
+Ein Plugin stellt eine der beiden Schnittstellen bereit:
+- NODE_HOOKS: dict {Knotentyp (z. B. ast.FunctionDef): hook(node) -> node}. Die Hooks aller Plugins
+  laufen zusammen mit dem WatermarkEmbedder in einem einzigen Durchlauf (siehe HookDispatcher).
+  Ein Hook bearbeitet nur den übergebenen Knoten; die Kindknoten besucht der Dispatcher.
+- apply(ast_tree: ast.AST) -> ast.AST (Legacy): eigener Durchlauf je Plugin über apply_plugins.
+Plugins werden erst bei der ersten Verwendung importiert und pro Prozess zwischengespeichert.
+Welche Plugins existieren, welche Schnittstelle sie bereitstellen und für welche Knotentypen sie
+sich interessieren, ermittelt eine statische Analyse, deren Ergebnis im Manifest
+(.plugin_manifest.json im Plugin-Verzeichnis) abgelegt und nur für geänderte Dateien erneuert wird.
 """
 
 import os
 import importlib.util
 import ast
+import hashlib
+import json
+import time
+from event_log import get_logger
+
+_log = get_logger("plugins")
+
+# Standard-Verzeichnis der Plugins
+DEFAULT_PLUGINS_DIR = "plugins"
+
+# Dateiname des Manifests im Plugin-Verzeichnis
+MANIFEST_FILENAME = ".plugin_manifest.json"
+
+# Version des Manifest-Formats; ältere Manifeste werden vollständig neu erzeugt
+_MANIFEST_VERSION = 1
+
+# Prozessweiter Cache geladener Plugin-Module: (Pfad, SHA-256) -> (Modul, Ladezeit in Sekunden)
+_module_cache = {}
+
+def _analyze_plugin(source: bytes) -> dict:
+    """
+    Ermittelt Schnittstelle und Knotentypen eines Plugins statisch, ohne es auszuführen.
+    Erkannt werden eine Top-Level-Zuweisung NODE_HOOKS = {ast.Typ: ...} und eine Funktion apply.
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as e:
+        return {"entry": None, "node_types": [], "error": f"Syntaxfehler: {e}"}
+    hooks = None
+    has_apply = False
+    for statement in tree.body:
+        if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef)) and statement.name == "apply":
+            has_apply = True
+        targets = statement.targets if isinstance(statement, ast.Assign) else (
+            [statement.target] if isinstance(statement, ast.AnnAssign) else [])
+        for target in targets:
+            if isinstance(target, ast.Name):
+                if target.id == "NODE_HOOKS":
+                    hooks = statement.value
+                elif target.id == "apply":
+                    has_apply = True
+    if hooks is not None:
+        node_types = []
+        if isinstance(hooks, ast.Dict):
+            for key in hooks.keys:
+                name = key.attr if isinstance(key, ast.Attribute) else getattr(key, "id", None)
+                if name is not None:
+                    node_types.append(name)
+        return {"entry": "NODE_HOOKS", "node_types": node_types}
+    return {"entry": "apply" if has_apply else None, "node_types": []}
+
+def load_manifest(plugins_dir: str = "plugins") -> list[dict]:
+    """
+    Liefert das Manifest (ein Eintrag je Plugin-Datei, nach Namen sortiert).
+    Einträge, deren Datei sich laut Größe und Änderungszeit nicht verändert hat, werden übernommen;
+    nur neue oder geänderte Dateien werden gelesen, gehasht und analysiert. Das Manifest wird nur
+    zurückgeschrieben, wenn sich etwas geändert hat.
+    """
+    if not os.path.isdir(plugins_dir):
+        return []
+    manifest_path = os.path.join(plugins_dir, MANIFEST_FILENAME)
+    previous = {}
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") == _MANIFEST_VERSION:
+            previous = {entry["file"]: entry for entry in data["plugins"]}
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    entries = []
+    changed = False
+    for filename in sorted(os.listdir(plugins_dir)):
+        if not filename.endswith(".py"):
+            continue
+        stat = os.stat(os.path.join(plugins_dir, filename))
+        entry = previous.pop(filename, None)
+        if entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+            with open(os.path.join(plugins_dir, filename), "rb") as f:
+                source = f.read()
+            entry = {"name": os.path.splitext(filename)[0], "file": filename,
+                     "sha256": hashlib.sha256(source).hexdigest(),
+                     "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, **_analyze_plugin(source)}
+            changed = True
+        entries.append(entry)
+    if changed or previous:
+        try:
+            with open(manifest_path, "w", encoding="utf-8") as f:
+                json.dump({"version": _MANIFEST_VERSION, "plugins": entries}, f, indent=2)
+        except OSError:
+            # Schreibgeschütztes Plugin-Verzeichnis: Manifest nur im Speicher verwenden
+            pass
+    return entries
+
+def plugins_fingerprint(plugins_dir: str = "plugins") -> str:
+    """Berechnet einen Hash über Namen und Inhalt aller Plugin-Dateien (aus dem Manifest), ohne sie zu laden."""
+    digest = hashlib.sha256()
+    for entry in load_manifest(plugins_dir):
+        digest.update(entry["file"].encode("utf-8"))
+        digest.update(bytes.fromhex(entry["sha256"]))
+    return digest.hexdigest()
+
+def check_output_backend(backend: str, plugins_dir: str | None) -> None:
+    """
+    Das Backend "tokens" patcht nur die Edits des Embedders in den Originaltext, Änderungen der Plugins
+    am AST gingen dabei verloren. Sind im Plugin-Verzeichnis Plugins vorhanden, wird es abgelehnt.
+    """
+    if backend != "tokens" or not plugins_dir:
+        return
+    names = [entry["name"] for entry in load_manifest(plugins_dir) if entry["entry"]]
+    if names:
+        raise ValueError(f"Das Backend 'tokens' kann die Änderungen der Plugins ({', '.join(names)}) nicht "
+                         "übernehmen. Ohne Plugins einbetten (--no-plugins) oder das Backend 'astor' verwenden.")
 
-class PluginManager
-    def __init__(self, plugins_dir str = plugins)
+class HookDispatcher(ast.NodeTransformer):
+    """
+    NodeTransformer, der Plugin-Hooks und die eigenen visit_-Methoden in einem Durchlauf ausführt.
+    Statt pro Knoten die Methode über ihren Namen zu suchen, werden Hooks und Besuchermethoden
+    einmalig in Tabellen Knotentyp -> Handler vorberechnet. Für jeden Knoten laufen zuerst die
+    Hooks seines Typs (in Ladereihenfolge der Plugins), danach die Besuchermethode.
+    """
+    def __init__(self, node_hooks: dict | None = None):
+        self.node_hooks = node_hooks or {}
+        self._visitors = {}
+        for attribute in dir(type(self)):
+            node_type = getattr(ast, attribute[6:], None) if attribute.startswith("visit_") else None
+            if isinstance(node_type, type) and issubclass(node_type, ast.AST):
+                self._visitors[node_type] = getattr(self, attribute)
+
+    def visit(self, node: ast.AST):
+        hooks = self.node_hooks.get(type(node))
+        if hooks:
+            for hook in hooks:
+                node = hook(node)
+                if node is None:
+                    return None
+        return self._visitors.get(type(node), self.generic_visit)(node)
+
+class PluginManager:
+    def __init__(self, plugins_dir: str = "plugins"):
         # Das Verzeichnis, in dem die Plugins abgelegt sind
         self.plugins_dir = plugins_dir
-        self.plugins = self.load_plugins()
-
-    def load_plugins(self) - list
-        Lädt alle Plugins aus dem angegebenen Verzeichnis.
-        plugins = []
-        if not os.path.exists(self.plugins_dir)
-            print(fPlugin-Verzeichnis '{self.plugins_dir}' nicht gefunden. Keine Plugins geladen.)
-            return plugins
-        for filename in os.listdir(self.plugins_dir)
-            if filename.endswith(.py)
-                plugin_path = os.path.join(self.plugins_dir, filename)
-                module_name = os.path.splitext(filename)[0]
-                spec = importlib.util.spec_from_file_location(module_name, plugin_path)
-                if spec is None
+        # Nur das Manifest wird sofort gelesen; importiert wird bei der ersten Verwendung
+        self.manifest = load_manifest(plugins_dir)
+        if not os.path.exists(plugins_dir):
+            _log.info("Plugin-Verzeichnis '%s' nicht gefunden. Keine Plugins geladen.", plugins_dir)
+        # Knotentyp -> Tupel der Hooks aller Plugins mit NODE_HOOKS (für HookDispatcher)
+        self._node_hooks = {}
+        # Legacy-Plugins mit apply(), die weiterhin je einen eigenen Durchlauf benötigen
+        self._plugins = []
+        self._loaded_entries = set()
+        # Plugin-Name -> Ladezeit in Sekunden (für load_report)
+        self.load_times = {}
+
+    @property
+    def node_hooks(self) -> dict:
+        """Tabelle Knotentyp -> Hooks; importiert beim ersten Zugriff alle Hook-Plugins."""
+        self._load_entries("NODE_HOOKS")
+        return self._node_hooks
+
+    @property
+    def plugins(self) -> list:
+        """Legacy-Plugins (apply); werden beim ersten Zugriff importiert."""
+        self._load_entries("apply")
+        return self._plugins
+
+    def _import_plugin(self, entry: dict):
+        """
+        Importiert ein Plugin-Modul oder liefert es aus dem prozessweiten Cache.
+        Gibt (Modul, Ladezeit, frisch importiert?) zurück bzw. None, falls kein Import möglich ist.
+        """
+        plugin_path = os.path.abspath(os.path.join(self.plugins_dir, entry["file"]))
+        cache_key = (plugin_path, entry["sha256"])
+        if cache_key in _module_cache:
+            return _module_cache[cache_key] + (False,)
+        spec = importlib.util.spec_from_file_location(entry["name"], plugin_path)
+        if spec is None:
+            return None
+        module = importlib.util.module_from_spec(spec)
+        start = time.perf_counter()
+        spec.loader.exec_module(module)
+        _module_cache[cache_key] = (module, time.perf_counter() - start)
+        return _module_cache[cache_key] + (True,)
+
+    def _load_entries(self, entry_type: str) -> None:
+        """Importiert alle Plugins einer Schnittstelle (einmal pro Instanz)."""
+        if entry_type in self._loaded_entries:
+            return
+        self._loaded_entries.add(entry_type)
+        for entry in self.manifest:
+            module_name = entry["name"]
+            if entry["entry"] is None:
+                reason = entry.get("error") or "weder 'NODE_HOOKS' noch eine 'apply'-Funktion"
+                if entry_type == "apply":
+                    _log.warning("Plugin '%s' hat %s. Übersprungen.", module_name, reason)
+                continue
+            if entry["entry"] != entry_type:
+                continue
+            try:
+                loaded = self._import_plugin(entry)
+                if loaded is None:
                     continue
-                module = importlib.util.module_from_spec(spec)
-                try
-                    spec.loader.exec_module(module)
-                    if hasattr(module, apply)
-                        plugins.append(module)
-                        print(fPlugin '{module_name}' geladen.)
-                    else
-                        print(fPlugin '{module_name}' hat keine 'apply'-Funktion. Übersprungen.)
-                except Exception as e
-                    print(fFehler beim Laden von Plugin '{module_name}' {e})
-        return plugins
-
-    def apply_plugins(self, ast_tree ast.AST) - ast.AST
-        Wendet alle geladenen Plugins nacheinander auf den AST an.
-        for plugin in self.plugins
-            try
+                module, seconds, imported = loaded
+                self.load_times[module_name] = seconds
+                if entry_type == "NODE_HOOKS":
+                    self.register_hooks(module_name, module.NODE_HOOKS)
+                    details = f" (Hooks: {', '.join(t.__name__ for t in module.NODE_HOOKS)})"
+                else:
+                    self._plugins.append(module)
+                    details = ""
+                if imported:
+                    _log.info("Plugin '%s' geladen%s.", module_name, details)
+            except Exception as e:
+                _log.error("Fehler beim Laden von Plugin '%s': %s", module_name, e)
+
+    def load_all(self) -> None:
+        """Importiert alle Plugins sofort (z. B. für den Ladezeit-Bericht)."""
+        self._load_entries("apply")
+        self._load_entries("NODE_HOOKS")
+
+    def load_report(self) -> list[dict]:
+        """
+        Liefert je Plugin Name, Schnittstelle, Knotentypen (aus dem Manifest) und Importzeit in
+        Sekunden (None, falls nicht geladen), absteigend nach Importzeit sortiert.
+        """
+        report = [{"name": entry["name"], "entry": entry["entry"], "node_types": entry["node_types"],
+                   "seconds": self.load_times.get(entry["name"])} for entry in self.manifest]
+        return sorted(report, key=lambda r: -1 if r["seconds"] is None else r["seconds"], reverse=True)
+
+    def register_hooks(self, plugin_name: str, hooks: dict) -> None:
+        """Trägt die Hooks eines Plugins in die Tabelle Knotentyp -> Hooks ein."""
+        for node_type in hooks:
+            if not (isinstance(node_type, type) and issubclass(node_type, ast.AST)):
+                raise TypeError(f"Plugin '{plugin_name}': ungültiger Knotentyp {node_type!r} in NODE_HOOKS.")
+        for node_type, hook in hooks.items():
+            self._node_hooks[node_type] = self._node_hooks.get(node_type, ()) + (hook,)
+
+    def apply_hooks(self, ast_tree: ast.AST) -> ast.AST:
+        """Wendet nur die Hooks in einem eigenen Durchlauf an (ohne Embedder)."""
+        return HookDispatcher(self.node_hooks).visit(ast_tree) if self.node_hooks else ast_tree
+
+    def apply_plugins(self, ast_tree: ast.AST) -> ast.AST:
+        """
+        Wendet alle Legacy-Plugins (apply) nacheinander auf den AST an.
+        Die Hooks (NODE_HOOKS) laufen nicht hier, sondern im Durchlauf des Embedders.
+        """
+        for plugin in self.plugins:
+            try:
                 ast_tree = plugin.apply(ast_tree)
-                print(fPlugin '{plugin.__name__}' angewendet.)
-            except Exception as e
-                print(fFehler beim Anwenden von Plugin '{plugin.__name__}' {e})
+                _log.debug("Plugin '%s' angewendet.", plugin.__name__)
+            except Exception as e:
+                _log.error("Fehler beim Anwenden von Plugin '%s': %s", plugin.__name__, e)
         return ast_tree
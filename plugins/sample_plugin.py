@@ -5,19 +5,22 @@ plugins/sample_plugin.py
 Dieses Beispiel-Plugin demonstriert eine zusätzliche Transformation.
 Es fügt jedem Funktionsnamen ein Präfix "prod_" hinzu.
 Dadurch wird verdeutlicht, wie Du eigene Plugins zur Erweiterung einbinden kannst.
+Das Plugin registriert einen Hook je Knotentyp (NODE_HOOKS); der Plugin Manager führt ihn im
+selben AST-Durchlauf wie den Embedder aus, die Kindknoten besucht der Dispatcher.
+Meldungen gehen an einen Kind-Logger von "stegopy" (sichtbar mit -vv).
 """
 
 import ast
+import logging
 
-def apply(ast_tree: ast.AST) -> ast.AST:
-    class SamplePlugin(ast.NodeTransformer):
-        def visit_FunctionDef(self, node: ast.FunctionDef) -> ast.AST:
-            # Falls der Funktionsname nicht bereits mit "prod_" beginnt, wird das Präfix hinzugefügt.
-            if not node.name.startswith("prod_"):
-                original_name = node.name
-                node.name = "prod_" + node.name
-                print(f"Plugin: Funktion umbenannt: {original_name} -> {node.name}")
-            self.generic_visit(node)
-            return node
-    transformer = SamplePlugin()
-    return transformer.visit(ast_tree)
+_log = logging.getLogger("stegopy.plugins.sample_plugin")
+
+def prefix_function_name(node: ast.FunctionDef) -> ast.AST:
+    # Falls der Funktionsname nicht bereits mit "prod_" beginnt, wird das Präfix hinzugefügt.
+    if not node.name.startswith("prod_"):
+        original_name = node.name
+        node.name = "prod_" + node.name
+        _log.debug("Plugin: Funktion umbenannt: %s -> %s", original_name, node.name)
+    return node
+
+NODE_HOOKS = {ast.FunctionDef: prefix_function_name}
@@ -3,35 +3,274 @@
 robustness_tests.py
 -------------------
 Dieses Skript führt Robustheitstests für den Wasserzeicheneinbettungsprozess durch.
-Es simuliert verschiedene Code-Transformationen, darunter Minifizierung und Obfuskation,
-und überprüft anschließend, ob das Wasserzeichen noch erkannt wird.
-Zusätzlich können externe Tools wie pyminifier integriert werden.
+Ein Quelltext wird je Fehlerkorrektur-Methode einmal mit Wasserzeichen versehen und anschließend einer
+Matrix von Angriffen (je mit verschiedenen Raten) unterzogen. Die Erkennung läuft direkt im Prozess
+(Namensindex, Fehlerkorrektur, Vergleich wie in der Batch-Erkennung), verteilt auf einen Pool von
+Worker-Prozessen; ausgegeben werden Überlebensraten je Angriff, Rate und Fehlerkorrektur-Methode.
+Ein Versuch überlebt, wenn watermark_detected das Wasserzeichen nachweist (p-Wert der besten Verschiebung,
+wie bei "main.py detect"); die Konfidenz allein ist bei kurzen Bitfolgen auch zufällig hoch.
+
+Angriffe (Quelltext -> Quelltext, Rate = Anteil der betroffenen Elemente):
+  reformat             Neuerzeugung über astor und Entfernen von Leerzeilen (Rate > 0: immer vollständig)
+  strip_comments       Kommentare entfernen (je Kommentar mit Wahrscheinlichkeit Rate)
+  rename_identifiers   Definierte Namen durch neutrale Namen (v0, v1, ...) ersetzen
+  reorder_statements   Top-Level-Definitionen vertauschen
+  mutate_identifiers   Namen leicht verändern (Stil vereinheitlichen bzw. ein Zeichen ersetzen)
+
+Aufruf: python robustness_tests.py [DATEI ...] [--synthetic N] [--attacks ...] [--rates 0 0.1 0.5]
+                                   [--trials 50] [--methods hamming reed-solomon]
+                                   [--workers N] [--json ERGEBNIS.json]
 """
 
-import subprocess
+import argparse
+import ast
+import io
+import json
+import os
+import random
+import re
+import statistics
+import string
+import time
+import tokenize
+from concurrent.futures import ProcessPoolExecutor
+
+import astor
+import yaml
+from error_correction import reed_solomon_params
+from watermark_embedder import WatermarkEmbedder, generate_watermark_bits, iter_top_level_chunks
+from watermark_detector import (build_name_index, extract_watermark_bits_from_source, compare_watermark,
+                                watermark_detected, DETECTION_P_VALUE)
+
+DEFAULT_RATES = (0.0, 0.05, 0.1, 0.25, 0.5)
+DEFAULT_METHODS = ("hamming", "reed-solomon")
+
+_IDENTIFIER = re.compile(r"\b[A-Za-z_][A-Za-z0-9_]*\b")
+_TOP_LEVEL_DEFINITION = re.compile(r"(@|def |async def |class )")
+
+# Analyse je markiertem Quelltext (definierte Namen, Top-Level-Abschnitte, Neuformatierung), einmal pro
+# Worker berechnet: Die Angriffe arbeiten danach nur noch auf Text, ohne erneutes Parsen und Serialisieren
+_analysis_cache = {}
+
+def _analysis(source: str) -> dict:
+    analysis = _analysis_cache.get(source)
+    if analysis is None:
+        analysis = _analysis_cache[source] = {
+            "names": _defined_names(ast.parse(source)),
+            "chunks": list(iter_top_level_chunks(io.StringIO(source).readline)),
+            "comments": [token.start for token in tokenize.generate_tokens(io.StringIO(source).readline)
+                         if token.type == tokenize.COMMENT],
+        }
+    return analysis
+
+def _defined_names(tree: ast.AST) -> list[str]:
+    """Alle im Modul definierten Funktions- und Variablennamen (sortiert, für reproduzierbare Auswahl)."""
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            names.add(node.id)
+    return sorted(names)
+
+def _rename_selected(source: str, rate: float, rng: random.Random, new_name) -> str:
+    """
+    Benennt jeden definierten Namen mit Wahrscheinlichkeit rate per new_name(name, index) um.
+    Ersetzt werden alle Vorkommen des Bezeichners in einem Durchlauf über den Text.
+    """
+    mapping = {}
+    for name in _analysis(source)["names"]:
+        if rng.random() < rate:
+            mapping[name] = new_name(name, len(mapping))
+    if not mapping:
+        return source
+    return _IDENTIFIER.sub(lambda match: mapping.get(match.group(0), match.group(0)), source)
+
+def attack_reformat(source: str, rate: float, rng: random.Random) -> str:
+    """Formatiert den Code neu (astor) und entfernt Leerzeilen."""
+    if rate <= 0:
+        return source
+    analysis = _analysis(source)
+    if "reformatted" not in analysis:
+        lines = astor.to_source(ast.parse(source)).splitlines()
+        analysis["reformatted"] = "\n".join(line for line in lines if line.strip()) + "\n"
+    return analysis["reformatted"]
+
+def attack_strip_comments(source: str, rate: float, rng: random.Random) -> str:
+    """Entfernt Kommentare (jeden mit Wahrscheinlichkeit rate)."""
+    selected = [(row, col) for row, col in _analysis(source)["comments"] if rng.random() < rate]
+    if not selected:
+        return source
+    lines = source.splitlines(keepends=True)
+    for row, col in selected:
+        lines[row - 1] = lines[row - 1][:col].rstrip() + "\n"
+    return "".join(lines)
+
+def attack_rename_identifiers(source: str, rate: float, rng: random.Random) -> str:
+    """Ersetzt definierte Namen durch neutrale Namen (wie ein Obfuskator)."""
+    return _rename_selected(source, rate, rng, lambda name, index: f"v{index}")
 
-def minify_code(input_file, output_file):
-    with open(input_file, "r", encoding="utf-8") as f:
-        code = f.read()
-    minified = "\n".join(line for line in code.splitlines() if line.strip() != "")
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.write(minified)
-    print(f"Code minifiziert und in '{output_file}' gespeichert.")
+def attack_reorder_statements(source: str, rate: float, rng: random.Random) -> str:
+    """Vertauscht Top-Level-Definitionen (jede mit Wahrscheinlichkeit rate mit einer zufälligen anderen)."""
+    chunks = list(_analysis(source)["chunks"])
+    positions = [i for i, chunk in enumerate(chunks) if _TOP_LEVEL_DEFINITION.match(chunk.lstrip())]
+    swapped = False
+    for i in positions:
+        if len(positions) > 1 and rng.random() < rate:
+            j = rng.choice(positions)
+            chunks[i], chunks[j] = chunks[j], chunks[i]
+            swapped = True
+    return "".join(chunks) if swapped else source
 
-def run_detector(file_to_check):
-    result = subprocess.run(["python", "watermark_detector.py", file_to_check],
-                            capture_output=True, text=True)
-    print("Detector Output:")
-    print(result.stdout)
-    return result.stdout
+def _mutate_name(name: str, rng: random.Random) -> str:
+    """Vereinheitlicht den Namensstil (camelCase/Präfixe -> snake_case) oder ersetzt ein Zeichen."""
+    normalized = re.sub(r"(?<=[a-z0-9])([A-Z])", r"_\1", re.sub(r"^x_|_x$", "", name)).lower()
+    if normalized != name and rng.random() < 0.5:
+        return normalized
+    position = rng.randrange(len(name))
+    return name[:position] + rng.choice(string.ascii_lowercase) + name[position + 1:]
+
+def attack_mutate_identifiers(source: str, rate: float, rng: random.Random) -> str:
+    """Verändert definierte Namen leicht (Stil vereinheitlichen oder Tippfehler)."""
+    return _rename_selected(source, rate, rng, lambda name, index: _mutate_name(name, rng))
+
+ATTACKS = {
+    "reformat": attack_reformat,
+    "strip_comments": attack_strip_comments,
+    "rename_identifiers": attack_rename_identifiers,
+    "reorder_statements": attack_reorder_statements,
+    "mutate_identifiers": attack_mutate_identifiers,
+}
+
+def prepare_samples(source: str, config: dict, variable_whitelist: list, methods=DEFAULT_METHODS,
+                    seed: int = 0) -> dict:
+    """
+    Bettet das Wasserzeichen je Fehlerkorrektur-Methode einmal ein.
+    Gibt je Methode (markierter Quelltext, eingebettete Bitfolge, RS-Parameter) zurück.
+    """
+    samples = {}
+    for method in methods:
+        method_config = dict(config, error_correction=method)
+        payload = generate_watermark_bits(method_config, shuffle_seed=seed)
+        embedder = WatermarkEmbedder(payload, variable_whitelist, [],
+                                     alternate_naming=method_config.get("alternate_naming", False),
+                                     rng=random.Random(seed))
+        marked = astor.to_source(embedder.visit(ast.parse(source)))
+        samples[method] = (marked, payload, reed_solomon_params(method_config))
+    return samples
+
+_worker_state = {}
+_verdict_cache = {}
+
+def _init_trial_worker(samples: dict, variable_whitelist: list) -> None:
+    """Initialisiert einen Worker einmalig mit den markierten Quelltexten und dem Namensindex."""
+    _worker_state["samples"] = samples
+    _worker_state["name_index"] = build_name_index(variable_whitelist)
+    _worker_state["variable_whitelist"] = variable_whitelist
+
+def run_trial(method: str, attack: str, rate: float, seed: int) -> tuple[bool, float, float]:
+    """Greift den markierten Quelltext an und prüft die Erkennung (überlebt?, Konfidenz in %, p-Wert)."""
+    source, payload, _ = _worker_state["samples"][method]
+    attacked = ATTACKS[attack](source, rate, random.Random(seed))
+    # Deterministische Ergebnisse (unveränderter bzw. neu formatierter Text) nur einmal bewerten
+    deterministic = attacked is source or attack == "reformat"
+    if deterministic and (method, attacked) in _verdict_cache:
+        return _verdict_cache[(method, attacked)]
+    try:
+        raw_bits = extract_watermark_bits_from_source(attacked, _worker_state["variable_whitelist"],
+                                                      name_index=_worker_state["name_index"])
+    except SyntaxError:
+        return False, 0.0, 1.0
+    # Abgleich der Rohbits mit der Payload (verschiebungstolerant); Urteil wie bei der Erkennung
+    alignment = compare_watermark(raw_bits, payload)
+    verdict = (watermark_detected(alignment), alignment.confidence, alignment.p_value)
+    if deterministic:
+        _verdict_cache[(method, attacked)] = verdict
+    return verdict
+
+def _run_trials(chunk: list[tuple[str, str, float, int]]) -> list[tuple[str, str, float, bool, float, float]]:
+    """Führt einen Block von Versuchen in einem Worker-Prozess aus."""
+    return [(method, attack, rate) + run_trial(method, attack, rate, seed) for method, attack, rate, seed in chunk]
+
+def run_matrix(samples: dict, variable_whitelist: list, attacks=tuple(ATTACKS), rates=DEFAULT_RATES,
+               trials: int = 50, workers: int | None = None, seed: int = 0) -> dict:
+    """
+    Führt alle Versuche (Methode x Angriff x Rate x trials) im Worker-Pool aus.
+    Ergebnis: {Methode: {Angriff: {Rate: {"survival": Anteil, "confidence": mittlere Konfidenz,
+    "p_value": Median der p-Werte}}}}.
+    """
+    tasks = [(method, attack, rate, seed * 1_000_003 + trial)
+             for method in samples for attack in attacks for rate in rates for trial in range(trials)]
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(tasks) // (workers * 4))
+    chunks = [tasks[i:i + chunksize] for i in range(0, len(tasks), chunksize)]
+    totals = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_trial_worker,
+                             initargs=(samples, variable_whitelist)) as executor:
+        for chunk in executor.map(_run_trials, chunks):
+            for method, attack, rate, survived, confidence, p_value in chunk:
+                cell = totals.setdefault(method, {}).setdefault(attack, {}).setdefault(rate, [0, 0.0, []])
+                cell[0] += survived
+                cell[1] += confidence
+                cell[2].append(p_value)
+    return {method: {attack: {rate: {"survival": survived / len(p_values),
+                                     "confidence": round(confidence / len(p_values), 2),
+                                     "p_value": statistics.median(p_values)}
+                              for rate, (survived, confidence, p_values) in by_rate.items()}
+                     for attack, by_rate in by_attack.items()}
+            for method, by_attack in totals.items()}
+
+def print_survival_curves(results: dict, rates) -> None:
+    """Gibt je Fehlerkorrektur-Methode eine Tabelle Angriff x Rate (Überlebensrate in %) aus."""
+    for method, by_attack in results.items():
+        print(f"\nFehlerkorrektur {method}: Überlebensrate in % (mittlere Konfidenz, Median des p-Werts)")
+        print(f"  {'Angriff':<20}" + "".join(f"{rate:>25.0%}" for rate in rates))
+        for attack, by_rate in by_attack.items():
+            cells = "".join(f"{by_rate[rate]['survival'] * 100:>8.0f} ({by_rate[rate]['confidence']:>5.1f}, "
+                            f"{by_rate[rate]['p_value']:>7.1e})" for rate in rates)
+            print(f"  {attack:<20}{cells}")
 
 def main():
-    input_file = "file_transformed.py"
-    output_file = "file_transformed_min.py"
-    minify_code(input_file, output_file)
-    print("Ergebnisse nach Minifizierung:")
-    run_detector(output_file)
-    # Hier könnten weitere Transformationen (z.B. Obfuskation) integriert werden.
+    parser = argparse.ArgumentParser(description="Robustheitstests des Wasserzeichens gegen Quelltext-Angriffe")
+    parser.add_argument("files", nargs="*", help="Quelldateien (Standard: synthetischer Korpus)")
+    parser.add_argument("--synthetic", type=int, default=200, help="Funktionen im synthetischen Korpus (ohne Dateien)")
+    parser.add_argument("--attacks", nargs="+", choices=list(ATTACKS), default=list(ATTACKS))
+    parser.add_argument("--rates", nargs="+", type=float, default=list(DEFAULT_RATES))
+    parser.add_argument("--trials", type=int, default=50, help="Versuche je Angriff und Rate")
+    parser.add_argument("--methods", nargs="+", choices=list(DEFAULT_METHODS), default=list(DEFAULT_METHODS))
+    parser.add_argument("-c", "--config", default="config.yaml", help="Konfigurationsdatei")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Anzahl Worker-Prozesse")
+    parser.add_argument("--seed", type=int, default=0, help="Seed für Einbettung und Angriffe")
+    parser.add_argument("--json", help="Ergebnisse zusätzlich als JSON in diese Datei schreiben")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    if args.files:
+        source = ""
+        for path in args.files:
+            with open(path, "r", encoding="utf-8") as f:
+                source += f.read() + "\n"
+        with open("whitelist.json", "r", encoding="utf-8") as f:
+            variable_whitelist = [var["name"] for var in json.load(f).get("variables", [])]
+    else:
+        from benchmarks.run_benchmarks import generate_corpus
+        source, variable_whitelist = generate_corpus(args.synthetic, hit_ratio=1.0, loops=1, seed=args.seed)
+
+    start = time.perf_counter()
+    samples = prepare_samples(source, config, variable_whitelist, args.methods, args.seed)
+    results = run_matrix(samples, variable_whitelist, args.attacks, args.rates, args.trials, args.workers, args.seed)
+    trials = len(args.methods) * len(args.attacks) * len(args.rates) * args.trials
+    print(f"{trials} Versuche in {time.perf_counter() - start:.2f}s "
+          f"(Nachweis ab p <= {DETECTION_P_VALUE}, {len(variable_whitelist)} Whitelist-Namen).")
+    print_survival_curves(results, args.rates)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"params": {key: getattr(args, key) for key in ("attacks", "rates", "trials", "methods",
+                                                                      "seed")},
+                       "results": {method: {attack: {str(rate): cell for rate, cell in by_rate.items()}
+                                            for attack, by_rate in by_attack.items()}
+                                   for method, by_attack in results.items()}}, f, indent=2)
 
 if __name__ == "__main__":
     main()
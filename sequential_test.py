@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+sequential_test.py
+------------------
+Dieses Modul implementiert den sequentiellen Wahrscheinlichkeitsquotiententest (SPRT nach Wald) für die
+Korpus-Erkennung. Statt alle Dateien eines Leaks zu prüfen, werden die Dateien in zufälliger Reihenfolge
+ausgewertet; jede Datei aktualisiert das laufende Log-Likelihood-Verhältnis ihrer Rohbits gegenüber der
+eingebetteten Payload:
+
+  H0: Die Bits sind unabhängig von der Payload (Trefferrate p0, siehe null_match_rate)
+  H1: Die Bits stammen von der Payload, bis auf Störungen (Trefferrate match_rate)
+
+p0 ist nur bei einer ausgeglichenen Payload 1/2. Überwiegen in der Payload die Einsen (Anteil b) und in
+der Datei die Nullen oder Einsen (Anteil q), stimmen auch unabhängige Bits mit q * b + (1 - q) * (1 - b)
+überein; dieser Wert wird je Datei aus beiden Anteilen geschätzt.
+Gelöschte oder umsortierte Anweisungen verschieben die Bits einer Datei gegenüber der Payload. Statt nur
+ab dem Anfang zu vergleichen, mittelt der Test das Likelihood-Verhältnis über alle zyklischen
+Verschiebungen (Gewicht OFFSET_ZERO_WEIGHT für den Anfang, der Rest gleichmäßig). Die beste Verschiebung
+allein wäre unter H0 systematisch zu gut; der Mittelwert hat unter H0 wie jedes einzelne Verhältnis den
+Erwartungswert 1, sodass die Schranken gültig bleiben.
+Der Test endet, sobald das Verhältnis die Schranken log((1 - beta) / alpha) oder log(beta / (1 - alpha))
+erreicht; alpha begrenzt die Falsch-positiv-, beta die Falsch-negativ-Rate.
+"""
+
+import math
+from bitvector import BitVector
+
+# Mögliche Ergebnisse des Tests
+DETECTED = "detected"
+NOT_DETECTED = "not_detected"
+UNDECIDED = "undecided"
+
+# Gewicht der Verschiebung 0 in der Mischung über alle Verschiebungen (der Embedder beginnt jede Datei am
+# Anfang der Payload, Verschiebungen entstehen nur durch Löschen oder Umsortieren)
+OFFSET_ZERO_WEIGHT = 0.5
+
+def null_match_rate(bits: BitVector, pattern: BitVector) -> float:
+    """Erwartete Trefferrate unabhängiger Bits mit dem Einsen-Anteil von bits gegenüber pattern (H0)."""
+    if not bits or not pattern:
+        return 0.5
+    ones = bits.count(1) / len(bits)
+    pattern_ones = pattern.count(1) / len(pattern)
+    return ones * pattern_ones + (1 - ones) * (1 - pattern_ones)
+
+def _log_mean_exp(values: list[float], weights: list[float]) -> float:
+    """log(sum(w * exp(v))), numerisch stabil."""
+    peak = max(values)
+    return peak + math.log(sum(weight * math.exp(value - peak) for value, weight in zip(values, weights)))
+
+class SequentialTest:
+    """Laufender SPRT über die Bit-Übereinstimmungen der bisher ausgewerteten Dateien."""
+    __slots__ = ("alpha", "beta", "match_rate", "upper", "lower", "llr", "matches", "compared", "observations",
+                 "skipped")
+
+    def __init__(self, alpha: float = 0.001, beta: float = 0.001, match_rate: float = 0.9):
+        if not 0 < alpha < 1 or not 0 < beta < 1:
+            raise ValueError("alpha und beta müssen zwischen 0 und 1 liegen.")
+        if not 0.5 < match_rate < 1:
+            raise ValueError("Die Trefferrate unter H1 muss zwischen 0,5 und 1 liegen.")
+        self.alpha = alpha
+        self.beta = beta
+        self.match_rate = match_rate
+        self.upper = math.log((1 - beta) / alpha)
+        self.lower = math.log(beta / (1 - alpha))
+        self.llr = 0.0
+        self.matches = 0
+        self.compared = 0
+        self.observations = 0
+        self.skipped = 0
+
+    @property
+    def decision(self) -> str:
+        if self.llr >= self.upper:
+            return DETECTED
+        if self.llr <= self.lower:
+            return NOT_DETECTED
+        return UNDECIDED
+
+    def update(self, counts: list[int], compared: int, null_rate: float = 0.5) -> str:
+        """
+        Berücksichtigt eine Datei und liefert die aktuelle Entscheidung. counts[k] ist die Trefferzahl der
+        compared Bits bei Verschiebung k (siehe alignment.match_counts), null_rate die Trefferrate unter H0.
+        Liegt null_rate nicht zwischen 1 - match_rate und match_rate (fast nur Nullen oder Einsen bei
+        einseitiger Payload), unterscheidet die Datei die Hypothesen nicht und wird übersprungen.
+        """
+        self.observations += 1
+        if not counts or not compared:
+            return self.decision
+        if not 1 - self.match_rate < null_rate < self.match_rate:
+            self.skipped += 1
+            return self.decision
+        self.matches += max(counts)
+        self.compared += compared
+        # Beitrag eines Treffers bzw. Fehltreffers zum Log-Likelihood-Verhältnis
+        hit = math.log(self.match_rate / null_rate)
+        miss = math.log((1 - self.match_rate) / (1 - null_rate))
+        ratios = [matches * hit + (compared - matches) * miss for matches in counts]
+        if len(ratios) == 1:
+            self.llr += ratios[0]
+        else:
+            shifted = (1 - OFFSET_ZERO_WEIGHT) / (len(ratios) - 1)
+            self.llr += _log_mean_exp(ratios, [OFFSET_ZERO_WEIGHT] + [shifted] * (len(ratios) - 1))
+        return self.decision
+
+    def to_dict(self) -> dict:
+        return {"decision": self.decision, "llr": round(self.llr, 3), "upper": round(self.upper, 3),
+                "lower": round(self.lower, 3), "alpha": self.alpha, "beta": self.beta,
+                "match_rate": self.match_rate, "matches": self.matches, "compared": self.compared,
+                "skipped": self.skipped}
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+source_patcher.py
+-----------------
+Dieses Modul implementiert das alternative Ausgabe-Backend "tokens".
+Statt den gesamten AST mit astor.to_source neu zu erzeugen, zeichnet der WatermarkEmbedder
+während des Besuchs Änderungsbereiche (Edits) auf, die hier in einem einzigen Durchlauf auf den
+Originaltext angewendet werden. Unveränderte Bereiche (inkl. Kommentare und Formatierung) werden
+unverändert übernommen; der Aufwand wächst mit der Anzahl der Änderungen.
+
+Ein Edit ist ein Tupel (lineno, col_offset, end_lineno, end_col_offset, replacement, anchor):
+- Positionen wie im AST (Zeilen ab 1, Spalten als UTF-8-Byte-Offsets).
+- Ist end_lineno None, wird der Bereich über anchor bestimmt: das erste NAME-Token anchor, das ab der
+  Startzeile direkt auf das Schlüsselwort "def" folgt (für Funktionsnamen, deren Position der AST nicht
+  direkt liefert). Über tokenize werden Vorkommen in Kommentaren und Strings nicht mitgezählt.
+"""
+
+import io
+import tokenize
+
+def _line_offsets(source: bytes) -> list[int]:
+    """Berechnet die Byte-Offsets der Zeilenanfänge (Index 0 entspricht Zeile 1)."""
+    offsets = [0]
+    position = source.find(b"\n")
+    while position != -1:
+        offsets.append(position + 1)
+        position = source.find(b"\n", position + 1)
+    return offsets
+
+def _resolve_span(source: bytes, offsets: list[int], edit: tuple) -> tuple[int, int]:
+    """Bestimmt den absoluten Byte-Bereich (start, end) eines Edits."""
+    lineno, col_offset, end_lineno, end_col_offset, _, anchor = edit
+    if end_lineno is None:
+        return _find_def_name(source, offsets, lineno, anchor)
+    return offsets[lineno - 1] + col_offset, offsets[end_lineno - 1] + end_col_offset
+
+def _find_def_name(source: bytes, offsets: list[int], lineno: int, anchor: str) -> tuple[int, int]:
+    """Byte-Bereich des Funktionsnamens anchor hinter "def", ab Zeile lineno per tokenize gesucht."""
+    readline = io.BytesIO(source[offsets[lineno - 1]:]).readline
+    previous = None
+    try:
+        for token in tokenize.tokenize(readline):
+            if (token.type == tokenize.NAME and token.string == anchor
+                    and previous is not None and previous.string == "def"):
+                row, col = token.start
+                # tokenize zählt Spalten in Zeichen, die Edits in UTF-8-Bytes
+                start = offsets[lineno + row - 2] + len(token.line[:col].encode("utf-8"))
+                return start, start + len(anchor.encode("utf-8"))
+            if token.type not in (tokenize.NL, tokenize.COMMENT):
+                previous = token
+    except (tokenize.TokenError, SyntaxError):
+        # Der Ausschnitt ab der Startzeile muss nicht vollständig tokenisierbar sein (z. B. Einrückung)
+        pass
+    raise ValueError(f"Bezeichner '{anchor}' ab Zeile {lineno} nicht gefunden.")
+
+def apply_edits(source: str, edits: list[tuple]) -> str:
+    """
+    Wendet die aufgezeichneten Edits in einem Durchlauf auf den Quelltext an.
+    Edits, die mit einem bereits angewendeten Bereich überlappen, werden übersprungen.
+    """
+    if not edits:
+        return source
+    data = source.encode("utf-8")
+    offsets = _line_offsets(data)
+    spans = sorted((_resolve_span(data, offsets, edit) + (edit[4],) for edit in edits), key=lambda s: s[0])
+    parts = []
+    position = 0
+    for start, end, replacement in spans:
+        if start < position:
+            continue
+        parts.append(data[position:start])
+        parts.append(replacement.encode("utf-8"))
+        position = end
+    parts.append(data[position:])
+    return b"".join(parts).decode("utf-8")
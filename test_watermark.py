@@ -8,9 +8,62 @@ des Quellcodes und die Ausführbarkeit des transformierten Codes getestet.
 
 import unittest
 import ast
-from watermark_embedder import WatermarkEmbedder, generate_watermark_bits
+import os
+import tempfile
+import io
+import json
+import zipfile
+import math
+import random
+import threading
+import asyncio
+import py_compile
+import uuid
+import hashlib
+import struct
+import contextlib
+from unittest import mock
+from watermark_embedder import (WatermarkEmbedder, generate_watermark_bits, encrypt_watermark,
+                                iter_top_level_chunks, embed_streaming, render_output, transform_to_camel,
+                                transform_name)
+from source_patcher import apply_edits
+import astor
+from bitvector import BitVector
+from error_correction import (encode_error_correction, decode_error_correction, hamming_encode, hamming_decode,
+                              _hamming_encode_block, _hamming_decode_block, np, get_rs_codec,
+                              reed_solomon_encode, reed_solomon_decode, reed_solomon_params)
+from watermark_detector import (WatermarkDetector, build_name_index, decrypt_watermark,
+                                extract_watermark_bits_from_source, extract_watermark_bits_from_bytecode,
+                                compare_watermark, watermark_detected, decode_aligned_window, payload_is_reproducible,
+                                DETECTION_P_VALUE)
+from alignment import _match_counts_popcount, _match_counts_fft, binomial_tail, cyclic_matches
+from sequential_test import SequentialTest, null_match_rate, DETECTED, NOT_DETECTED, UNDECIDED
+from fast_scanner import scan_definitions
+from bytecode_scanner import scan_code_object, load_pyc
+from embed_cache import EmbedCache
+from watermark_artifact import WatermarkArtifact, issue_artifact, write_artifact, load_artifact
+from watermark_registry import WatermarkRegistry, RegistryIndex
+from key_session import KeySession, KeyAgentServer, derive_aes_key, open_key_session
+from plugin_manager import PluginManager, load_manifest, check_output_backend, MANIFEST_FILENAME
+from detection_server import DetectionServer, MAX_BODY_SIZE, MAX_HEADER_LINES
+from pipeline import run_pipeline, write_report
+from robustness_tests import prepare_samples, run_matrix, attack_rename_identifiers
+from generate_whitelist import scan_files, build_whitelist
+from event_log import configure_logging, get_logger, log_file_changes
+from batch_processing import (collect_source_files, mirror_output_path, run_batch_embed,
+                              iter_detection_sources, run_batch_detect, combine_corpus_bits,
+                              run_sequential_detect)
 import yaml
 
+# Gemeinsame Testdaten der Erkennung: 16 Datenbits, Hamming-kodiert zu 28 eingebetteten Bits
+MARK_DATA = BitVector.from_str("0110100111000101")
+MARK_PAYLOAD = hamming_encode(MARK_DATA)
+
+def marked_source(payload: BitVector = MARK_PAYLOAD, name: str = "example_var") -> str:
+    """Quelltext, dessen Zuweisungen die Payload über die Schreibweise des Whitelist-Namens name tragen."""
+    marked = transform_to_camel(name)
+    return "".join(f"{marked if bit else name} = {index}\n" for index, bit in enumerate(payload))
+
 class TestWatermarkEmbedder(unittest.TestCase):
     def setUp(self):
         self.config = {
@@ -30,8 +83,8 @@ class TestWatermarkEmbedder(unittest.TestCase):
 
     def test_generate_watermark_bits(self):
         bits = generate_watermark_bits(self.config)
-        self.assertIsInstance(bits, str)
-        self.assertTrue(all(c in "01" for c in bits))
+        self.assertIsInstance(bits, BitVector)
+        self.assertTrue(all(b in (0, 1) for b in bits))
 
     def test_transform_function(self):
         code = """
@@ -48,5 +101,1006 @@ def example_function():
         exec(compiled, {})
         self.assertTrue(True)
 
+class TestStreamingEmbed(unittest.TestCase):
+    code = """import os
+
+@decorator
+def example_function():
+    example_var = 1
+    return example_var
+if example_var:
+    example_var = 2
+else:
+    example_var = 3
+class Example:
+    def method(self):
+        example_var = 4
+"""
+
+    def test_chunks_split_top_level_statements(self):
+        chunks = list(iter_top_level_chunks(io.StringIO(self.code).readline))
+        self.assertEqual("".join(chunks), self.code)
+        self.assertEqual(len(chunks), 4)
+        self.assertTrue(chunks[1].lstrip().startswith("@decorator"))
+
+    def test_streaming_matches_full_embedding(self):
+        whitelist = ["example_function", "example_var"]
+        full_embedder = WatermarkEmbedder("0110", whitelist, [])
+        expected = astor.to_source(full_embedder.visit(ast.parse(self.code)))
+        with tempfile.TemporaryDirectory() as tmp:
+            source_file = os.path.join(tmp, "big.py")
+            output_file = os.path.join(tmp, "big_transformed.py")
+            with open(source_file, "w", encoding="utf-8") as f:
+                f.write(self.code)
+            stream_embedder = WatermarkEmbedder("0110", whitelist, [])
+            embed_streaming(source_file, output_file, stream_embedder)
+            with open(output_file, "r", encoding="utf-8") as f:
+                streamed = f.read()
+        self.assertEqual(stream_embedder.bit_index, full_embedder.bit_index)
+        self.assertEqual(len(streamed.splitlines()), len(expected.splitlines()))
+        self.assertEqual(len(stream_embedder.changes), len(full_embedder.changes))
+
+class TestTokenBackend(unittest.TestCase):
+    def test_patch_preserves_comments_and_formatting(self):
+        code = ("# Kopf\n"
+                "def example_function():  # Kommentar\n"
+                "    s = 'äöü'; example_var = 42   # Zuweisung\n"
+                "    for i in range(5):\n"
+                "        print(i)\n"
+                "    return example_var\n")
+        embedder = WatermarkEmbedder("111", ["example_function", "example_var"], ["for_loop"])
+        tree = embedder.visit(ast.parse(code))
+        output = render_output(code, tree, embedder, "tokens")
+        lines = output.splitlines()
+        self.assertEqual(lines[0], "# Kopf")
+        self.assertTrue(lines[1].endswith("():  # Kommentar"))
+        self.assertNotIn("example_function", lines[1])
+        self.assertTrue(lines[2].startswith("    s = 'äöü'; ") and lines[2].endswith(" = 42   # Zuweisung"))
+        self.assertEqual(lines[3], "    [i_ for i_ in range(5)]")
+        ast.parse(output)
+
+    def test_apply_edits_skips_overlaps(self):
+        source = "abc = 1\n"
+        edits = [(1, 0, 1, 7, "x = 2", None), (1, 0, 1, 3, "y", None)]
+        self.assertIn(apply_edits(source, edits), ("x = 2\n", "y = 1\n"))
+
+    def test_function_rename_uses_name_token(self):
+        # Zeilenfortsetzung nach "def", danach "def größe" in String und Kommentar (Mehrbyte-Zeichen)
+        source = 'maß = 1\ndef \\\n    größe(text="def größe"):  # def größe\n    return text\n'
+        function = ast.parse(source).body[1]
+        edits = [(function.lineno, function.col_offset, None, None, "gross", "größe")]
+        self.assertEqual(apply_edits(source, edits),
+                         'maß = 1\ndef \\\n    gross(text="def größe"):  # def größe\n    return text\n')
+        with self.assertRaises(ValueError):
+            apply_edits("x = 'def größe'\n", [(1, 0, None, None, "gross", "größe")])
+
+    def test_rejects_configured_plugins(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            check_output_backend("tokens", tmp)
+            with open(os.path.join(tmp, "hooks.py"), "w", encoding="utf-8") as f:
+                f.write(TestPluginHooks.hook_plugin)
+            check_output_backend("astor", tmp)
+            check_output_backend("tokens", None)
+            with self.assertRaisesRegex(ValueError, "hooks"):
+                check_output_backend("tokens", tmp)
+            source_file = os.path.join(tmp, "source.py")
+            with open(source_file, "w", encoding="utf-8") as f:
+                f.write(TestPluginHooks.code)
+            # Auch der Streaming-Pfad verwirft die Plugin-Änderungen nicht stillschweigend
+            with self.assertRaises(ValueError):
+                embed_streaming(source_file, os.path.join(tmp, "out.py"), WatermarkEmbedder("1", [], []),
+                                PluginManager(tmp), backend="tokens")
+
+class TestPluginHooks(unittest.TestCase):
+    hook_plugin = """import ast
+
+def rename(node):
+    node.name = "prod_" + node.name
+    return node
+
+NODE_HOOKS = {ast.FunctionDef: rename}
+"""
+    legacy_plugin = """import ast
+
+def apply(tree):
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and node.value == 1:
+            node.value = 2
+    return tree
+"""
+    code = "def example_function():\n    example_var = 1\n    def inner():\n        return example_var\n"
+
+    def test_fused_pass_matches_multi_pass(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, source in (("a_hooks.py", self.hook_plugin), ("b_legacy.py", self.legacy_plugin)):
+                with open(os.path.join(tmp, name), "w", encoding="utf-8") as f:
+                    f.write(source)
+            manager = PluginManager(tmp)
+            self.assertEqual(len(manager.plugins), 1)
+            self.assertEqual(list(manager.node_hooks), [ast.FunctionDef])
+        whitelist = ["prod_example_function", "example_var", "prod_inner"]
+        # Bisheriges Verhalten: jedes Plugin in eigenem Durchlauf, danach der Embedder
+        multi_tree = manager.apply_hooks(manager.apply_plugins(ast.parse(self.code)))
+        random.seed(7)
+        multi = WatermarkEmbedder("101", whitelist, [])
+        multi_code = astor.to_source(multi.visit(multi_tree))
+        random.seed(7)
+        fused = WatermarkEmbedder("101", whitelist, [], node_hooks=manager.node_hooks)
+        fused_code = astor.to_source(fused.visit(manager.apply_plugins(ast.parse(self.code))))
+        self.assertEqual(fused_code, multi_code)
+        self.assertEqual(fused.changes, multi.changes)
+        self.assertIn("prodExampleFunction", fused_code)
+        self.assertIn("example_var = 2", fused_code)
+
+    def test_manifest_and_lazy_loading(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            plugin_path = os.path.join(tmp, "a_hooks.py")
+            with open(plugin_path, "w", encoding="utf-8") as f:
+                f.write(self.hook_plugin)
+            with open(os.path.join(tmp, "notes.py"), "w", encoding="utf-8") as f:
+                f.write("VALUE = 1\n")
+            manager = PluginManager(tmp)
+            self.assertTrue(os.path.isfile(os.path.join(tmp, MANIFEST_FILENAME)))
+            entries = {entry["name"]: entry for entry in manager.manifest}
+            self.assertEqual((entries["a_hooks"]["entry"], entries["a_hooks"]["node_types"]),
+                             ("NODE_HOOKS", ["FunctionDef"]))
+            self.assertIsNone(entries["notes"]["entry"])
+            # Vor der ersten Verwendung wird nichts importiert
+            self.assertEqual(manager.load_times, {})
+            hook = manager.node_hooks[ast.FunctionDef][0]
+            self.assertIn("a_hooks", manager.load_times)
+            # Zweite Instanz im selben Prozess: Modul aus dem Cache
+            self.assertIs(PluginManager(tmp).node_hooks[ast.FunctionDef][0], hook)
+            self.assertEqual(manager.load_report()[0]["name"], "a_hooks")
+            # Nur geänderte Dateien werden neu analysiert
+            with open(plugin_path, "w", encoding="utf-8") as f:
+                f.write(self.legacy_plugin)
+            os.utime(plugin_path, ns=(0, 0))
+            updated = {entry["name"]: entry for entry in load_manifest(tmp)}
+            self.assertEqual(updated["a_hooks"]["entry"], "apply")
+            self.assertEqual(updated["notes"], entries["notes"])
+
+    def test_rejects_invalid_hook_types(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            manager = PluginManager(tmp)
+        with self.assertRaises(TypeError):
+            manager.register_hooks("broken", {"FunctionDef": lambda node: node})
+        self.assertEqual(manager.node_hooks, {})
+
+class TestWatermarkArtifact(unittest.TestCase):
+    config = {
+        'projektname': "TestProject",
+        'copyright': {'jahr': 2023},
+        'uuid': "12345678-1234-5678-1234-567812345678",
+        'error_correction': "reed-solomon",
+        'encryption_key_embedder': "",
+        'random_bit_assignment': True,
+    }
+
+    def test_seeded_shuffle_is_reproducible(self):
+        first = generate_watermark_bits(self.config, shuffle_seed=42)
+        self.assertEqual(generate_watermark_bits(self.config, shuffle_seed=42), first)
+        self.assertNotEqual(generate_watermark_bits(self.config, shuffle_seed=43), first)
+
+    def test_reproducible_payload(self):
+        # Entscheidet, ob embed den Cache nutzt: Nur stabile Bits ergeben Treffer
+        self.assertFalse(payload_is_reproducible(self.config))
+        self.assertTrue(payload_is_reproducible({**self.config, 'shuffle_seed': 42}))
+        self.assertFalse(payload_is_reproducible({**self.config, 'shuffle_seed': 42, 'encryption_key_embedder': "k"}))
+
+    def test_roundtrip_via_mmap_and_checksum(self):
+        artifact = issue_artifact(self.config, shuffle_seed=42)
+        self.assertEqual(artifact.payload, generate_watermark_bits(self.config, shuffle_seed=42))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "watermark.swm")
+            write_artifact(path, artifact)
+            loaded = load_artifact(path)
+        self.assertEqual(loaded.payload, artifact.payload)
+        self.assertEqual((loaded.error_method, loaded.rs_params, loaded.shuffle_seed, loaded.shuffled),
+                         ("reed-solomon", {"nsym": 10, "nsize": 255, "fcr": 0}, 42, True))
+
+    def test_reads_version_1_with_expected_pattern(self):
+        # Version 1 trug nach den Nutzbits ein Erwartungsmuster; es wird übersprungen
+        payload = BitVector.from_str("1100110001")
+        body = (struct.pack(">4sBBHHHBQII", b"SWMK", 1, 0, 10, 255, 0, 1, 42, len(payload), 7)
+                + payload.to_bytes() + BitVector.from_str("0110011").to_bytes())
+        loaded = WatermarkArtifact.from_buffer(body + hashlib.sha256(body).digest())
+        self.assertEqual((loaded.payload, loaded.shuffle_seed, loaded.shuffled), (payload, 42, True))
+        # Version 2: Kopf, Nutzbits und Prüfsumme
+        artifact = issue_artifact(self.config, shuffle_seed=42)
+        self.assertEqual(len(artifact.to_bytes()), 25 + len(artifact.payload.to_bytes()) + 32)
+
+    def test_tampered_file_is_rejected(self):
+        artifact = issue_artifact(self.config, shuffle_seed=42)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "watermark.swm")
+            write_artifact(path, artifact)
+            # Ein Bit im ersten Payload-Byte der Datei kippen (Kopf: 25 Bytes)
+            with open(path, "r+b") as f:
+                f.seek(25)
+                byte = f.read(1)[0]
+                f.seek(25)
+                f.write(bytes([byte ^ 1]))
+            with self.assertRaisesRegex(ValueError, "Prüfsumme"):
+                load_artifact(path)
+            with open(path, "r+b") as f:
+                f.truncate(os.path.getsize(path) - 1)
+            with self.assertRaisesRegex(ValueError, "Länge"):
+                load_artifact(path)
+
+class TestWatermarkRegistry(unittest.TestCase):
+    def tenant_config(self, uuid: str, method: str = "reed-solomon") -> dict:
+        return {'projektname': "TestProject", 'copyright': {'jahr': 2023}, 'uuid': uuid,
+                'error_correction': method, 'encryption_key_embedder': ""}
+
+    def test_ranks_leaking_tenant_first(self):
+        rng = random.Random(5)
+        uuids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(6)]
+        artifacts = {f"kunde-{i}": issue_artifact(self.tenant_config(tenant_uuid, "hamming" if i % 2 else "reed-solomon"))
+                     for i, tenant_uuid in enumerate(uuids)}
+        with tempfile.TemporaryDirectory() as tmp:
+            registry = WatermarkRegistry(os.path.join(tmp, "registry.sqlite"))
+            for tenant, artifact in artifacts.items():
+                registry.add(tenant, artifact)
+            self.assertEqual(len(registry), 6)
+            self.assertEqual(registry.get("kunde-3").payload, artifacts["kunde-3"].payload)
+            index = registry.build_index()
+            registry.close()
+        for leaked in ("kunde-2", "kunde-3"):
+            payload = artifacts[leaked].payload
+            # Die geleakte Datei beginnt mitten im zyklisch fortgesetzten Muster
+            raw_bits = (payload + payload)[17:17 + len(payload)]
+            result = index.identify(raw_bits, top_k=3)
+            self.assertEqual(result["tenant"], leaked)
+            self.assertEqual(result["candidates"][0]["offset"], 17)
+            self.assertEqual(result["candidates"][0]["confidence"], 100.0)
+            self.assertLess(result["candidates"][0]["p_value"], 1e-3)
+            # Unverschlüsselte Mandanten unterscheiden sich nur im UUID: auch der Zweite ist signifikant,
+            # entscheidend ist der Vorsprung auf den abweichenden Bits
+            self.assertEqual(result["margin"], len(payload) - result["candidates"][1]["matches"])
+            self.assertLess(result["margin_p_value"], 1e-3)
+
+    def test_rejects_ambiguous_top_candidate(self):
+        artifact = issue_artifact(self.tenant_config("12345678-1234-5678-1234-567812345678"))
+        other = issue_artifact(self.tenant_config("87654321-1234-5678-1234-567812345678"))
+        index = RegistryIndex([("kunde-a", artifact), ("kunde-b", artifact), ("kunde-c", other)])
+        result = index.identify(artifact.payload)
+        self.assertTrue(result["ambiguous"])
+        self.assertIsNone(result["tenant"])
+        self.assertEqual(result["margin"], 0)
+        # Zu wenige Bits: kein Mandant signifikant, aber auch nicht mehrdeutig
+        result = index.identify(artifact.payload[:8])
+        self.assertEqual((result["tenant"], result["ambiguous"]), (None, False))
+
+    @unittest.skipIf(np is None, "NumPy nicht installiert")
+    def test_matrix_scan_matches_popcount_scan(self):
+        rng = random.Random(3)
+        entries = [(f"t{i}", WatermarkArtifact("hamming", reed_solomon_params({}), 0, False,
+                                               BitVector.from_bits(rng.randint(0, 1) for _ in range(56))))
+                   for i in range(40)]
+        group = RegistryIndex(entries).groups[0]
+        # Anfragen kürzer und länger als die Nutzbits
+        queries = [BitVector.from_bits(rng.randint(0, 1) for _ in range(length)) for length in (1, 37, 150)]
+        vectorized = [[a.to_dict() for a in group.score(query)] for query in queries]
+        group.spectra = None
+        self.assertEqual(vectorized, [[a.to_dict() for a in group.score(query)] for query in queries])
+
+class TestKeySession(unittest.TestCase):
+    def test_derives_once_per_role(self):
+        calls = []
+        def fetch(role):
+            calls.append(role)
+            return derive_aes_key("geheim") if role == "embedder" else None
+        session = KeySession(fetch=fetch)
+        factory = session.cipher_factory("embedder")
+        self.assertIs(session.key("embedder"), session.key("embedder"))
+        self.assertIsNone(session.cipher_factory("detector"))
+        self.assertEqual(calls, ["embedder", "detector"])
+        bits = BitVector.from_str("1011001")
+        # Cipher-Fabrik und Schlüssel-String sind austauschbar
+        self.assertEqual(decrypt_watermark(encrypt_watermark(bits, factory), "geheim"), bits)
+
+    def test_vault_error_is_logged_not_printed(self):
+        environ = {"KEY_VAULT_MASTER": "kein-fernet-schluessel", "ENCRYPTION_KEY": "geheim"}
+        stdout = io.StringIO()
+        with mock.patch.dict(os.environ, environ), contextlib.redirect_stdout(stdout), \
+                self.assertLogs("stegopy.key_session", "WARNING") as logs:
+            os.environ.pop("STEGOPY_KEY_AGENT", None)
+            session = open_key_session({})
+        self.assertEqual(stdout.getvalue(), "")
+        self.assertIn("Key Vault Fehler", logs.output[0])
+        # Rückfall auf den Schlüssel aus der Umgebung
+        self.assertEqual(session.key("embedder"), derive_aes_key("geheim"))
+
+    def test_agent_serves_derived_keys(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            socket_path = os.path.join(tmp, "agent.sock")
+            server = KeyAgentServer(socket_path, KeySession({"embedder": "geheim"}))
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                self.assertEqual(os.stat(socket_path).st_mode & 0o777, 0o600)
+                client = KeySession.from_agent(socket_path)
+                self.assertEqual(client.key("embedder"), derive_aes_key("geheim"))
+                self.assertIsNone(client.key("detector"))
+            finally:
+                server.shutdown()
+                server.server_close()
+            self.assertFalse(os.path.exists(socket_path))
+
+class TestEventLog(unittest.TestCase):
+    def tearDown(self):
+        configure_logging(0, stream=io.StringIO())
+
+    def test_quiet_by_default_and_jsonl_sink(self):
+        code = "def example_function():\n    example_var = 1\n    return example_var\n"
+        configure_logging(0, stream=io.StringIO())
+        self.assertFalse(WatermarkEmbedder("11", ["example_function", "example_var"], [])._trace)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "events.jsonl")
+            console = io.StringIO()
+            configure_logging(2, path, stream=console)
+            embedder = WatermarkEmbedder("11", ["example_function", "example_var"], [])
+            random.seed(7)
+            embedder.visit(ast.parse(code))
+            log_file_changes(get_logger("test"), "a.py", embedder.changes)
+            configure_logging(0, stream=io.StringIO())
+            with open(path, encoding="utf-8") as f:
+                events = [json.loads(line) for line in f]
+        self.assertEqual([e["event"] for e in events], ["rename", "rename", "file_changes"])
+        self.assertEqual((events[0]["kind"], events[0]["original"]), ("function", "example_function"))
+        self.assertEqual(events[-1]["changes"], embedder.changes)
+        self.assertIn("Variable umbenannt", console.getvalue())
+
+class TestRobustnessHarness(unittest.TestCase):
+    def test_survival_matrix(self):
+        source = "".join(f"def func_{i}():\n    value_{i} = {i}\n    return value_{i}\n\n" for i in range(12))
+        whitelist = [name for i in range(12) for name in (f"func_{i}", f"value_{i}")]
+        config = {"projektname": "Robust", "copyright": {"jahr": 2024}, "uuid": "0000",
+                  "random_bit_assignment": False, "alternate_naming": False}
+        samples = prepare_samples(source, config, whitelist, methods=("hamming",))
+        results = run_matrix(samples, whitelist, attacks=("reformat", "rename_identifiers"), rates=(0.0, 1.0),
+                             trials=2, workers=1)
+        by_attack = results["hamming"]
+        self.assertEqual(by_attack["reformat"][0.0]["survival"], 1.0)
+        self.assertEqual(by_attack["reformat"][1.0]["survival"], 1.0)
+        self.assertEqual(by_attack["rename_identifiers"][1.0]["survival"], 0.0)
+        self.assertLessEqual(by_attack["reformat"][0.0]["p_value"], DETECTION_P_VALUE)
+
+    def test_short_stream_does_not_survive_on_confidence(self):
+        # Sechs fehlerfreie Bits: volle Konfidenz, aber kein signifikanter p-Wert (wie bei detect)
+        source = "".join(f"def func_{i}():\n    value_{i} = {i}\n    return value_{i}\n\n" for i in range(3))
+        whitelist = [name for i in range(3) for name in (f"func_{i}", f"value_{i}")]
+        config = {"projektname": "Robust", "copyright": {"jahr": 2024}, "uuid": "0000",
+                  "random_bit_assignment": False, "alternate_naming": True}
+        state = random.getstate()
+        samples = prepare_samples(source, config, whitelist, methods=("hamming",), seed=3)
+        # Die Einbettung nutzt einen eigenen Zufallsgenerator und ist reproduzierbar
+        self.assertEqual(random.getstate(), state)
+        self.assertEqual(prepare_samples(source, config, whitelist, methods=("hamming",), seed=3), samples)
+        cell = run_matrix(samples, whitelist, attacks=("reformat",), rates=(0.0,), trials=1, workers=1)["hamming"]
+        self.assertEqual((cell["reformat"][0.0]["survival"], cell["reformat"][0.0]["confidence"]), (0.0, 100.0))
+        self.assertGreater(cell["reformat"][0.0]["p_value"], DETECTION_P_VALUE)
+
+    def test_rename_attack_is_consistent(self):
+        renamed = attack_rename_identifiers("def f():\n    x = 1\n    return x\n", 1.0, random.Random(0))
+        namespace = {}
+        exec(renamed, namespace)
+        self.assertEqual(namespace["v0"](), 1)
+
+class TestWhitelistGeneration(unittest.TestCase):
+    def test_project_whitelist(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "helpers.py"), "w", encoding="utf-8") as f:
+                f.write("def shared_helper():\n    counter = 1\n    counter = 2\n    return counter\n\n"
+                        "async def fetch_data():\n    path = 1\n    return path\n")
+            with open(os.path.join(tmp, "app.py"), "w", encoding="utf-8") as f:
+                f.write("from helpers import shared_helper\nfrom os import path\nimport json\n\ndef run():\n"
+                        "    counter = shared_helper()\n    result = json.loads(counter)\n    return result\n")
+            files = collect_source_files(tmp)[1]
+            results = scan_files(files, workers=2)
+            whitelist = build_whitelist(results, tmp)
+        names = [entry["name"] for entry in whitelist["variables"]]
+        # Jeder Name genau einmal, absteigend nach Kapazität; aus Projektmodulen importierte Namen bleiben
+        # unverändert, gleichnamige Importe aus der Standardbibliothek (path) schließen nichts aus.
+        # Async-Funktionen benennt der Embedder nicht um, ihr Rumpf zählt trotzdem.
+        self.assertEqual(names, ["counter", "path", "result", "run"])
+        self.assertEqual((whitelist["variables"][0]["capacity"], whitelist["variables"][0]["files"]), (3, 2))
+        self.assertEqual(whitelist["excluded_public"], 1)
+        self.assertEqual(build_whitelist(results, tmp, limit=1)["variables"][0]["name"], "counter")
+
+class TestBitVector(unittest.TestCase):
+    def test_slicing_iteration_and_debug_view(self):
+        bits = BitVector.from_str("1011001110")
+        self.assertEqual(len(bits), 10)
+        self.assertEqual(list(bits), [1, 0, 1, 1, 0, 0, 1, 1, 1, 0])
+        self.assertEqual(str(bits[3:9]), "100111")
+        self.assertEqual(bits[-1], 0)
+        self.assertEqual(str(bits[:4] + bits[4:]), "1011001110")
+        self.assertEqual(bits.matches(BitVector.from_str("1111")), 3)
+
+    def test_pipeline_roundtrip_without_strings(self):
+        payload = BitVector(b"StegoPy")
+        for method in ("hamming", "reed-solomon"):
+            encoded = encode_error_correction(payload, method=method)
+            decrypted = decrypt_watermark(encrypt_watermark(encoded, "testkey"), "testkey")
+            self.assertEqual(decrypted, encoded)
+        self.assertEqual(decode_error_correction(encoded, method="reed-solomon"), payload)
+
+class TestHammingCodec(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.samples = [BitVector.from_bits(rng.getrandbits(1) for _ in range(n)) for n in (0, 3, 4, 31, 64, 517)]
+
+    def test_matches_blockwise_reference(self):
+        for bits in self.samples:
+            padded = list(bits) + [0] * ((4 - len(bits) % 4) % 4)
+            expected = []
+            for i in range(0, len(padded), 4):
+                nibble = int("".join(map(str, padded[i:i+4])), 2)
+                expected.extend(int(b) for b in format(_hamming_encode_block(nibble), "07b"))
+            self.assertEqual(list(hamming_encode(bits)), expected)
+            decoded = []
+            for i in range(0, len(bits) - 6, 7):
+                codeword = bits[i:i+7].to_int()
+                decoded.extend(int(b) for b in format(_hamming_decode_block(codeword), "04b"))
+            self.assertEqual(list(hamming_decode(bits)), decoded)
+
+    def test_corrects_single_bit_errors(self):
+        for nibble in range(16):
+            codeword = _hamming_encode_block(nibble)
+            self.assertEqual(_hamming_decode_block(codeword), nibble)
+            for position in range(7):
+                self.assertEqual(_hamming_decode_block(codeword ^ (1 << position)), nibble)
+
+    @unittest.skipUnless(np is not None, "NumPy nicht installiert")
+    def test_numpy_arrays_match_bitvector(self):
+        for bits in self.samples:
+            array = np.array(list(bits), dtype=np.uint8)
+            self.assertEqual(list(hamming_encode(array)), list(hamming_encode(bits)))
+            self.assertEqual(list(hamming_decode(array)), list(hamming_decode(bits)))
+
+class TestReedSolomon(unittest.TestCase):
+    def test_codec_cache_and_params(self):
+        self.assertIs(get_rs_codec(16), get_rs_codec(16))
+        self.assertIsNot(get_rs_codec(16), get_rs_codec(10))
+        self.assertEqual(reed_solomon_params({"reed_solomon": {"nsym": 32}})["nsym"], 32)
+        self.assertEqual(reed_solomon_params({})["nsym"], 10)
+
+    def test_chunked_payload_and_byte_input(self):
+        payload = BitVector(bytes(range(256)) * 2)
+        encoded = reed_solomon_encode(payload, nsym=20)
+        # 512 Bytes Nutzdaten verteilen sich auf 3 Blöcke mit je 20 Korrektursymbolen
+        self.assertEqual(len(encoded.to_bytes()), 512 + 3 * 20)
+        corrupted = bytearray(encoded.to_bytes())
+        for block in range(3):
+            corrupted[block * 255 + 5] ^= 0xFF
+        self.assertEqual(reed_solomon_decode(bytes(corrupted), nsym=20), payload)
+
+class TestWatermarkDetector(unittest.TestCase):
+    def test_name_index_covers_embedder_forms(self):
+        whitelist = ["example_var", "other_name", "data", "example_var"]
+        index = build_name_index(whitelist)
+        rng = random.Random(1)
+        # Jede Form, die transform_name erzeugen kann, führt auf Originalname und Bit zurück
+        for original in whitelist:
+            for bit in (0, 1):
+                for _ in range(8):
+                    for alternate in (False, True):
+                        self.assertEqual(index[transform_name(original, bit, alternate, rng)], (original, bit))
+        self.assertEqual(index["exampleVar"], ("example_var", 1))
+        self.assertNotIn("unknown", index)
+
+    def test_detects_alternate_naming(self):
+        code = "def example_function():\n    example_var = 1\n    other_var = 2\n"
+        tree = ast.parse(code)
+        embedder = WatermarkEmbedder("111", ["example_function", "example_var", "other_var"], [],
+                                     alternate_naming=True)
+        new_tree = embedder.visit(tree)
+        detector = WatermarkDetector(["example_function", "example_var", "other_var"], verbose=False)
+        detector.visit(new_tree)
+        self.assertEqual(str(detector.bits), "111")
+
+class TestFastScanner(unittest.TestCase):
+    SOURCE = (
+        "import os as example_var\n"
+        "class Example(Base, metaclass=Meta):\n"
+        "    limit: int = 10\n"
+        "    def example_function(self, a=1, *args, **kw) -> dict:\n"
+        "        example_var, (other, *rest) = self.data[0], (1, 2, 3)\n"
+        "        self.value = values[idx] = total = 0\n"
+        "        total += sum(x for x in range(3) if x)  # example_var = 2\n"
+        "        text = '''a = 1\n"
+        "def fake(): pass'''\n"
+        "        for i, (j, k) in enumerate(items): pass\n"
+        "        with open(a) as fh, ctx() as (p, q):\n"
+        "            handler = lambda y=2: y\n"
+        "        result = {k: v for k, v in pairs}; flag = \\\n"
+        "            True\n"
+        "        return f(key=1)\n"
+        "    async def skipped(self):\n"
+        "        async for item in stream: pass\n"
+    )
+
+    def ast_definitions(self, source):
+        found = []
+        class Collector(ast.NodeVisitor):
+            def visit_FunctionDef(self, node):
+                found.append(("function", node.name, node.lineno))
+                self.generic_visit(node)
+            def visit_Name(self, node):
+                if isinstance(node.ctx, ast.Store):
+                    found.append(("variable", node.id, node.lineno))
+        Collector().visit(ast.parse(source))
+        return found
+
+    def test_matches_ast_order(self):
+        definitions, exact = scan_definitions(self.SOURCE)
+        self.assertTrue(exact)
+        self.assertEqual(definitions, self.ast_definitions(self.SOURCE))
+
+    def test_ambiguous_constructs_fall_back_to_ast(self):
+        for source in ("if (example_var := 1):\n    pass\n",
+                       "@register([x for x in y])\ndef example_function():\n    pass\n",
+                       "value = f(a=[i for i in r], *[j for j in s])\n"):
+            self.assertFalse(scan_definitions(source)[1], source)
+        whitelist = ["example_var", "example_function"]
+        source = "exampleVar = [(example_var := i) for i in range(2)]\ndef example_function(): pass\n"
+        detector = WatermarkDetector(whitelist, verbose=False)
+        detector.visit(ast.parse(source))
+        self.assertEqual(extract_watermark_bits_from_source(source, whitelist), detector.bits)
+
+    def test_unparsable_source(self):
+        # Python-2-Code parst nicht, die Definitionen werden trotzdem gelesen
+        source = "def example_function():\n    print 'x'\n    exampleVar = 1\n"
+        bits = extract_watermark_bits_from_source(source, ["example_function", "example_var"])
+        self.assertEqual(str(bits), "01")
+        with self.assertRaises(SyntaxError):
+            extract_watermark_bits_from_source("def (:\n", ["example_var"])
+
+    def test_unterminated_strings_in_damaged_leaks(self):
+        # Abgeschnittene Strings: nur das erste Quote ist ein Token, die Zuweisungen davor bleiben erhalten
+        for quote in ("'''", '"', "'"):
+            source = "example_var = 1\ntext = " + quote + "a\\'b = 2\n" * 5000
+            definitions, exact = scan_definitions(source)
+            self.assertFalse(exact)
+            self.assertEqual(definitions[:2], [("variable", "example_var", 1), ("variable", "text", 2)])
+
+class TestBytecodeScanner(unittest.TestCase):
+    SOURCE = (
+        "import os as example_var\n"
+        "from sys import path\n"
+        "class Example:\n"
+        "    \"\"\"Doc.\"\"\"\n"
+        "    limit = 10\n"
+        "    def __private(self):\n"
+        "        self.__hidden = __other = 1\n"
+        "    def example_function(self, a=1):\n"
+        "        first, second = second, first\n"
+        "        values = [x for x in range(3) if x]\n"
+        "        try:\n"
+        "            total = 0\n"
+        "        except ValueError as error:\n"
+        "            total = 1\n"
+        "        finally:\n"
+        "            done = True\n"
+        "        for i, (j, k) in enumerate(items):\n"
+        "            pass\n"
+        "        with open(a) as fh:\n"
+        "            handler = lambda y=2: y\n"
+        "        def inner():\n"
+        "            nonlocal total\n"
+        "            total += 1\n"
+        "        return inner\n"
+        "    async def skipped(self):\n"
+        "        async for item in stream:\n"
+        "            pass\n"
+    )
+
+    def test_matches_ast_order(self):
+        expected = TestFastScanner.ast_definitions(self, self.SOURCE)
+        self.assertEqual(scan_code_object(compile(self.SOURCE, "<test>", "exec")), expected)
+
+    def test_nested_functions_and_comprehensions(self):
+        source = (
+            "def example_function(items):\n"
+            "    total = 0\n"
+            "    def inner(value):\n"
+            "        nonlocal total\n"
+            "        total = total + value\n"
+            "        return [example_var * 2 for example_var in range(value) if example_var]\n"
+            "    squares = {key: key * key for key in items}\n"
+            "    for key, value in squares.items():\n"
+            "        pairs = [(a, b) for a in range(key) for b in range(a)]\n"
+            "        inner(value)\n"
+            "    result = sum(x for x in pairs)\n"
+            "    return result\n"
+        )
+        expected = TestFastScanner.ast_definitions(self, source)
+        self.assertEqual(scan_code_object(compile(source, "<test>", "exec")), expected)
+
+    def test_decorator_comprehension_order_differs(self):
+        # Dokumentierte Grenze: Der AST besucht Dekoratoren erst nach dem Rumpf, der Bytecode davor
+        source = "@register([example_var for example_var in keys])\ndef example_function():\n    total = 1\n"
+        expected = TestFastScanner.ast_definitions(self, source)
+        scanned = scan_code_object(compile(source, "<test>", "exec"))
+        names = [name for _, name, _ in scanned]
+        self.assertEqual(names, ["example_function", "example_var", "total"])
+        self.assertNotEqual(names, [name for _, name, _ in expected])
+        self.assertEqual(sorted(names), sorted(name for _, name, _ in expected))
+
+    def test_pyc_detection(self):
+        code = "def example_function():\n    exampleVar = 1\n    example_var = 2\n"
+        with tempfile.TemporaryDirectory() as tmp:
+            source_path = os.path.join(tmp, "module.py")
+            with open(source_path, "w", encoding="utf-8") as f:
+                f.write(code)
+            with open(py_compile.compile(source_path, cfile=source_path + "c"), "rb") as f:
+                data = f.read()
+        whitelist = ["example_function", "example_var"]
+        self.assertEqual(str(extract_watermark_bits_from_bytecode(data, whitelist)), "010")
+        self.assertEqual(extract_watermark_bits_from_bytecode(data, whitelist),
+                         extract_watermark_bits_from_source(code, whitelist))
+        with self.assertRaises(ValueError):
+            load_pyc(b"\0\0\0\0" + data[4:])
+
+class TestAlignment(unittest.TestCase):
+    def test_match_counts_all_offsets(self):
+        rng = random.Random(3)
+        for n, m in ((5, 3), (40, 17), (300, 120)):
+            bits = BitVector.from_bits(rng.getrandbits(1) for _ in range(n))
+            pattern = BitVector.from_bits(rng.getrandbits(1) for _ in range(m))
+            brute = [sum(bits[i] == pattern[(k + i) % m] for i in range(n)) for k in range(m)]
+            self.assertEqual(_match_counts_popcount(bits, pattern), brute)
+            if np is not None:
+                self.assertEqual(_match_counts_fft(bits, pattern), brute)
+
+    def test_shifted_and_cyclic_bits_are_detected(self):
+        rng = random.Random(5)
+        pattern = BitVector.from_bits(rng.getrandbits(1) for _ in range(64))
+        # Beginnt mitten im Muster und läuft zyklisch über dessen Ende hinaus
+        shifted = (pattern + pattern)[21:21 + 80]
+        alignment = compare_watermark(shifted, pattern)
+        self.assertEqual((alignment.offset, alignment.matches, alignment.compared), (21, 80, 80))
+        self.assertLess(alignment.p_value, 1e-15)
+        self.assertTrue(watermark_detected(alignment))
+        noise = BitVector.from_bits(rng.getrandbits(1) for _ in range(80))
+        self.assertFalse(watermark_detected(compare_watermark(noise, pattern)))
+        # Kurze Folgen sind nicht signifikant, auch wenn sie ab dem Anfang vollständig übereinstimmen
+        self.assertFalse(watermark_detected(compare_watermark(pattern[30:34], pattern)))
+        self.assertFalse(watermark_detected(compare_watermark(pattern[:4], pattern)))
+        self.assertTrue(watermark_detected(compare_watermark(pattern[:20], pattern)))
+
+    def test_deleted_statements_shift_raw_bits(self):
+        # Gelöschte Anweisungen verschieben den Rohbitstrom um beliebig viele Bits, nicht nur um ganze Codewörter
+        rng = random.Random(9)
+        data = BitVector.from_bits(rng.getrandbits(1) for _ in range(40))
+        payload = hamming_encode(data)
+        for deleted in (1, 8, 33):
+            raw_bits = (payload + payload + payload)[deleted:deleted + 140]
+            alignment = compare_watermark(raw_bits, payload)
+            self.assertEqual((alignment.offset, alignment.matches), (deleted, 140))
+            self.assertTrue(watermark_detected(alignment))
+            decoded, ecc_decoded = decode_aligned_window(raw_bits, alignment, len(payload), "hamming")
+            self.assertTrue(ecc_decoded)
+            self.assertEqual(decoded, data)
+
+    def test_binomial_tail(self):
+        self.assertEqual(binomial_tail(10, 0), 1.0)
+        self.assertAlmostEqual(binomial_tail(10, 7), 176 / 1024)
+        self.assertEqual(binomial_tail(3, 4), 0.0)
+        # Normalapproximation: P(X >= n/2) = 1/2 + P(X = n/2) / 2
+        self.assertAlmostEqual(binomial_tail(4000, 2000), 0.5063, places=3)
+
+    def test_cyclic_matches(self):
+        pattern = BitVector.from_str("0110")
+        self.assertEqual(cyclic_matches(BitVector.from_str("0110011"), pattern), 7)
+        self.assertEqual(cyclic_matches(BitVector.from_str("1111"), pattern), 2)
+        self.assertEqual(cyclic_matches(BitVector.from_str(""), pattern), 0)
+
+class TestSequentialTest(unittest.TestCase):
+    def test_decisions(self):
+        test = SequentialTest(alpha=0.001, beta=0.001, match_rate=0.9)
+        self.assertEqual(test.update([4], 4), UNDECIDED)
+        self.assertEqual(test.update([4], 4), UNDECIDED)
+        # Drei Dateien mit je vier Treffern: 12 * log(1,8) > log(999)
+        self.assertEqual(test.update([4], 4), DETECTED)
+        test = SequentialTest(alpha=0.001, beta=0.001, match_rate=0.9)
+        # Zufällige Bits (Hälfte Treffer): je Datei 2 * log(1,8 * 0,2), nach vier Dateien unter log(1 / 999)
+        for _ in range(3):
+            self.assertEqual(test.update([2], 4), UNDECIDED)
+        self.assertEqual(test.update([2], 4), NOT_DETECTED)
+        self.assertEqual(test.to_dict()["compared"], 16)
+
+    def test_shifted_file_counts_with_offset_weight(self):
+        # Alle 28 Bits passen erst bei Verschiebung 3: Gewicht 0,5 / 27, die übrigen Verschiebungen tragen kaum bei
+        counts = [0] * 28
+        counts[3] = 28
+        test = SequentialTest(alpha=0.001, beta=0.001, match_rate=0.9)
+        self.assertEqual(test.update(counts, 28), DETECTED)
+        self.assertAlmostEqual(test.llr, 28 * math.log(1.8) + math.log(0.5 / 27), places=6)
+
+    def test_null_rate_from_bit_bias(self):
+        # Payload zu drei Vierteln Einsen, Datei nur Einsen: auch unabhängige Bits treffen zu 75 %
+        self.assertEqual(null_match_rate(BitVector.from_str("1111"), BitVector.from_str("1110")), 0.75)
+        self.assertEqual(null_match_rate(BitVector.from_str("1010"), BitVector.from_str("1110")), 0.5)
+        test = SequentialTest(match_rate=0.9)
+        test.update([3], 4, null_rate=0.75)
+        # Treffer zählen nur log(0,9 / 0,75), Fehltreffer log(0,1 / 0,25)
+        self.assertAlmostEqual(test.llr, 3 * math.log(0.9 / 0.75) + math.log(0.1 / 0.25), places=6)
+        # Fast nur Nullen bzw. Einsen bei einseitiger Payload: keine Aussage, Datei wird übersprungen
+        test.update([4], 4, null_rate=0.95)
+        self.assertEqual(test.to_dict()["skipped"], 1)
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(ValueError):
+            SequentialTest(alpha=0)
+        with self.assertRaises(ValueError):
+            SequentialTest(match_rate=0.5)
+
+class TestBatchProcessing(unittest.TestCase):
+    def test_batch_embed_mirrors_tree(self):
+        code = "def example_function():\n    example_var = 1\n    return example_var\n"
+        with tempfile.TemporaryDirectory() as tmp:
+            source_dir = os.path.join(tmp, "src")
+            os.makedirs(os.path.join(source_dir, "pkg"))
+            for name in ("a.py", os.path.join("pkg", "b.py")):
+                with open(os.path.join(source_dir, name), "w", encoding="utf-8") as f:
+                    f.write(code)
+            root, files = collect_source_files(source_dir)
+            self.assertEqual(len(files), 2)
+            output_dir = os.path.join(tmp, "out")
+            summary = run_batch_embed(files, root, output_dir, "10", ["example_function", "example_var"], [],
+                                      plugins_dir=None, workers=1)
+            self.assertEqual(summary["succeeded"], 2)
+            self.assertEqual(summary["changes"], 4)
+            expected_output = mirror_output_path(os.path.join(source_dir, "pkg", "b.py"), root, output_dir)
+            self.assertTrue(os.path.isfile(expected_output))
+
+    def test_batch_embed_cache_hits_on_rerun(self):
+        code = "def example_function():\n    example_var = 1\n    return example_var\n"
+        with tempfile.TemporaryDirectory() as tmp:
+            source_file = os.path.join(tmp, "a.py")
+            with open(source_file, "w", encoding="utf-8") as f:
+                f.write(code)
+            cache_path = os.path.join(tmp, "cache.sqlite")
+            output_dir = os.path.join(tmp, "out")
+            args = ([source_file], tmp, output_dir, "10", ["example_function", "example_var"], [])
+            first = run_batch_embed(*args, plugins_dir=None, workers=1, cache_path=cache_path)
+            output_file = mirror_output_path(source_file, tmp, output_dir)
+            with open(output_file, encoding="utf-8") as f:
+                first_output = f.read()
+            second = run_batch_embed(*args, plugins_dir=None, workers=1, cache_path=cache_path)
+            with open(output_file, encoding="utf-8") as f:
+                second_output = f.read()
+            # Andere Bits ergeben einen anderen Kontext-Hash und damit keinen Treffer
+            third = run_batch_embed([source_file], tmp, output_dir, "01", ["example_function", "example_var"], [],
+                                    plugins_dir=None, workers=1, cache_path=cache_path)
+        self.assertEqual((first["cache_hits"], second["cache_hits"], third["cache_hits"]), (0, 1, 0))
+        self.assertEqual(first_output, second_output)
+        self.assertEqual(second["changes"], first["changes"])
+
+    def test_batch_embed_timings_and_profile(self):
+        code = "def example_function():\n    example_var = 1\n    return example_var\n"
+        with tempfile.TemporaryDirectory() as tmp:
+            source_file = os.path.join(tmp, "src", "a.py")
+            os.makedirs(os.path.dirname(source_file))
+            with open(source_file, "w", encoding="utf-8") as f:
+                f.write(code)
+            summary = run_batch_embed([source_file], os.path.join(tmp, "src"), os.path.join(tmp, "out"), "11",
+                                      ["example_function", "example_var"], [], plugins_dir=None, workers=1,
+                                      timings=True, profile_dir=os.path.join(tmp, "prof"))
+            profile_written = os.path.isfile(os.path.join(tmp, "prof", "a.py.pstats"))
+        timings = summary["timings"]
+        self.assertTrue(profile_written)
+        self.assertEqual(timings["files"], 1)
+        self.assertTrue({"read", "parse", "embed", "serialize", "write"} <= set(timings["stages"]))
+        self.assertEqual((timings["counters"]["bits_consumed"], timings["counters"]["renames"]), (2, 2))
+        self.assertGreater(timings["counters"]["nodes_visited"], 0)
+
+    def test_embed_cache_lru_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = EmbedCache(os.path.join(tmp, "cache.sqlite"), max_entries=2)
+            for key in ("a", "b", "c"):
+                cache.put(key, f"code_{key}", [key])
+            cache.get("a")
+            self.assertEqual(cache.evict(), 1)
+            self.assertIsNone(cache.get("b"))
+            self.assertEqual(cache.get("a"), ("code_a", ["a"]))
+            cache.close()
+
+    def test_combine_corpus_bits_majority(self):
+        sequences = [BitVector.from_str(bits) for bits in ("101", "100", "0011")]
+        self.assertEqual(str(combine_corpus_bits(sequences)), "1011")
+
+    def test_batch_detect_archive(self):
+        code = marked_source()
+        with tempfile.TemporaryDirectory() as tmp:
+            archive_path = os.path.join(tmp, "leak.zip")
+            with zipfile.ZipFile(archive_path, "w") as archive:
+                archive.writestr("a.py", code)
+                archive.writestr("b.py", code)
+                archive.writestr("broken.py", "def (:")
+            sink = io.StringIO()
+            verdict = run_batch_detect(iter_detection_sources(archive_path), ["example_var"],
+                                       MARK_PAYLOAD, "hamming", sink, workers=1)
+        records = [json.loads(line) for line in sink.getvalue().splitlines()]
+        self.assertEqual(len(records), 4)
+        self.assertEqual(records[-1]["type"], "corpus")
+        self.assertEqual(verdict["files"], 3)
+        self.assertEqual(verdict["failed"], 1)
+        self.assertEqual(verdict["combined_bits"], str(MARK_PAYLOAD))
+        self.assertTrue(verdict["detected"])
+
+    def test_batch_detect_pycache(self):
+        # Quelltext verdrängt seine eigene pyc-Datei, auch wenn diese veraltet ist und noch markierten Code
+        # enthält; pyc-Dateien ohne Quelltext werden ausgewertet
+        code = marked_source()
+        with tempfile.TemporaryDirectory() as tmp:
+            for module in ("a", "b", "c"):
+                source_path = os.path.join(tmp, f"{module}.py")
+                with open(source_path, "w", encoding="utf-8") as f:
+                    f.write(code)
+                py_compile.compile(source_path)
+            with open(os.path.join(tmp, "a.py"), "w", encoding="utf-8") as f:
+                f.write(marked_source(BitVector.from_str("0" * 28)))
+            os.remove(os.path.join(tmp, "b.py"))
+            os.remove(os.path.join(tmp, "c.py"))
+            sink = io.StringIO()
+            verdict = run_batch_detect(iter_detection_sources(tmp), ["example_var"],
+                                       MARK_PAYLOAD, "hamming", sink, workers=1)
+        records = sorted((json.loads(line) for line in sink.getvalue().splitlines()[:-1]),
+                         key=lambda record: os.path.basename(record["file"]))
+        files = [os.path.basename(record["file"]) for record in records]
+        self.assertEqual(files[0], "a.py")
+        self.assertEqual((records[0]["source"], records[0]["bits"]), ("source", "0" * 28))
+        for name, record in zip(files[1:], records[1:]):
+            self.assertTrue(name.endswith(".pyc"))
+            self.assertEqual((record["source"], record["bits"]), ("bytecode", str(MARK_PAYLOAD)))
+        self.assertEqual(verdict["combined_bits"], str(MARK_PAYLOAD))
+        self.assertTrue(verdict["detected"])
+
+    def test_sequential_detect_stops_early(self):
+        # Nur die ersten sechs Payload-Bits je Datei
+        code = marked_source(BitVector.from_str(str(MARK_PAYLOAD)[:6]))
+        with tempfile.TemporaryDirectory() as tmp:
+            for index in range(20):
+                with open(os.path.join(tmp, f"mod{index}.py"), "w", encoding="utf-8") as f:
+                    f.write(code)
+            first = [name for name, _, _ in iter_detection_sources(tmp, shuffle_seed=7)]
+            self.assertEqual(first, [name for name, _, _ in iter_detection_sources(tmp, shuffle_seed=7)])
+            self.assertEqual(sorted(first), [name for name, _, _ in iter_detection_sources(tmp)])
+            sink = io.StringIO()
+            verdict = run_sequential_detect(iter_detection_sources(tmp, shuffle_seed=7), ["example_var"],
+                                            MARK_PAYLOAD, "hamming", sink, workers=1)
+        records = [json.loads(line) for line in sink.getvalue().splitlines()]
+        # Je Datei sechs Treffer ab dem Anfang: knapp log(0,5 * 1,8^6) = 2,83 plus die übrigen Verschiebungen,
+        # zusammen 2,85; nach zwei Dateien 5,71 < log(999) = 6,91, nach drei Dateien 8,56
+        self.assertEqual([record["file"] for record in records[:-1]], first[:3])
+        self.assertEqual([record["llr"] for record in records[:-1]], [2.853, 5.705, 8.558])
+        self.assertEqual((verdict["files_needed"], verdict["compared"], verdict["matches"]), (3, 18, 18))
+        self.assertEqual(verdict["decision"], DETECTED)
+        self.assertTrue(verdict["detected"])
+
+class TestPipeline(unittest.TestCase):
+    def test_whitelist_embed_and_verify_in_one_pass(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source_dir = os.path.join(tmp, "src")
+            os.makedirs(os.path.join(source_dir, "pkg"))
+            files = []
+            for name in ("a.py", os.path.join("pkg", "b.py")):
+                files.append(os.path.join(source_dir, name))
+                with open(files[-1], "w", encoding="utf-8") as f:
+                    f.write(marked_source(BitVector.from_str("0" * 28)))
+            with open(os.path.join(source_dir, "broken.py"), "w", encoding="utf-8") as f:
+                f.write("def broken(:\n")
+            files.append(os.path.join(source_dir, "broken.py"))
+            output_dir = os.path.join(tmp, "out")
+            report = run_pipeline(files, source_dir, output_dir, MARK_PAYLOAD, "hamming", plugins_dir=None)
+            write_report(os.path.join(tmp, "report", "pipeline.json"), report)
+            written = {}
+            for root, _, names in os.walk(output_dir):
+                for name in names:
+                    with open(os.path.join(root, name), encoding="utf-8") as f:
+                        written[os.path.relpath(os.path.join(root, name), output_dir)] = f.read()
+            with open(os.path.join(tmp, "report", "pipeline.json"), encoding="utf-8") as f:
+                stored = json.load(f)
+        # Nur die transformierten Dateien landen im gespiegelten Baum, die fehlerhafte Datei nicht
+        self.assertEqual(sorted(written), ["a.py", os.path.join("pkg", "b.py")])
+        for code in written.values():
+            self.assertEqual(extract_watermark_bits_from_source(code, ["example_var"]), MARK_PAYLOAD)
+        self.assertEqual([entry["name"] for entry in report["whitelist"]["variables"]], ["example_var"])
+        # Jede der 28 Zuweisungen beider Dateien trägt ein Bit und wird umbenannt
+        self.assertEqual((report["succeeded"], report["failed"], report["changes"]), (2, 1, 56))
+        self.assertTrue(all(result["exact"] and result["detected"] for result in report["results"]))
+        self.assertEqual(report["unverified"], [])
+        self.assertTrue(report["corpus"]["detected"])
+        self.assertEqual(stored["results"], report["results"])
+
+    def test_verifies_serialised_tokens_output(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source_file = os.path.join(tmp, "src", "a.py")
+            os.makedirs(os.path.dirname(source_file))
+            with open(source_file, "w", encoding="utf-8") as f:
+                f.write("# Kopf\n" + marked_source(BitVector.from_str("0" * 28)))
+            report = run_pipeline([source_file], os.path.dirname(source_file), os.path.join(tmp, "out"),
+                                  MARK_PAYLOAD, "hamming", plugins_dir=None, backend="tokens")
+        result = report["results"][0]
+        self.assertEqual((result["bits_found"], result["exact"], result["detected"]), (28, True, True))
+        self.assertEqual(report["unverified"], [])
+
+class TestDetectionServer(unittest.TestCase):
+    def test_detect_and_health_over_unix_socket(self):
+        code = marked_source()
+        server = DetectionServer(["example_var"], MARK_PAYLOAD, "hamming", {}, workers=1)
+
+        async def request(path, method, target, payload=None):
+            reader, writer = await asyncio.open_unix_connection(path)
+            body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+            writer.write(f"{method} {target} HTTP/1.1\r\nContent-Length: {len(body)}\r\n"
+                         "Connection: close\r\n\r\n".encode("latin-1") + body)
+            status = int((await reader.readline()).split()[1])
+            response = json.loads((await reader.read()).split(b"\r\n\r\n", 1)[1])
+            writer.close()
+            return status, response
+
+        async def scenario(path, leak_path):
+            listener = await asyncio.start_unix_server(server.handle_connection, path)
+            async with listener:
+                return (await request(path, "POST", "/detect", {"source": code, "name": "leak.py"}),
+                        await request(path, "POST", "/detect", {"path": leak_path}),
+                        await request(path, "GET", "/health"),
+                        await request(path, "POST", "/detect", {}),
+                        await request(path, "GET", "/unknown"))
+
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                leak_path = os.path.join(tmp, "unmarked.py")
+                with open(leak_path, "w", encoding="utf-8") as f:
+                    f.write(marked_source(BitVector.from_str("0" * 28)))
+                detected, from_path, health, invalid, unknown = asyncio.run(
+                    scenario(os.path.join(tmp, "detect.sock"), leak_path))
+        finally:
+            server.close()
+        self.assertEqual(detected[0], 200)
+        self.assertEqual((detected[1]["file"], detected[1]["bits"]), ("leak.py", str(MARK_PAYLOAD)))
+        self.assertTrue(detected[1]["detected"])
+        # Dateipfade liest der Worker selbst; ungezeichneter Code wird nicht erkannt
+        self.assertEqual((from_path[0], from_path[1]["file"], from_path[1]["bits"]), (200, leak_path, "0" * 28))
+        self.assertFalse(from_path[1]["detected"])
+        # Beide Anfragen liefen über denselben vorbereiteten Zustand
+        self.assertEqual((health[0], health[1]["requests"], health[1]["payload_bits"]), (200, 2, 28))
+        self.assertEqual((invalid[0], unknown[0]), (400, 404))
+
+    def test_oversized_requests_close_the_connection(self):
+        server = DetectionServer(["example_var"], MARK_PAYLOAD, "hamming", {}, workers=1)
+
+        async def exchange(path, request):
+            reader, writer = await asyncio.open_unix_connection(path)
+            # Nach der Fehlerantwort folgt eine zweite Anfrage auf derselben Verbindung
+            writer.write(request + b"GET /health HTTP/1.1\r\n\r\n")
+            # Ohne Schließen der Verbindung käme hier kein Ende des Datenstroms
+            response = await asyncio.wait_for(reader.read(), 10)
+            writer.close()
+            return response
+
+        async def scenario(path):
+            listener = await asyncio.start_unix_server(server.handle_connection, path)
+            async with listener:
+                too_large = (f"POST /detect HTTP/1.1\r\nContent-Length: {MAX_BODY_SIZE + 1}\r\n\r\n"
+                             .encode("latin-1") + b"{")
+                too_many = b"GET /health HTTP/1.1\r\n" + b"X-Header: 1\r\n" * (MAX_HEADER_LINES + 1) + b"\r\n"
+                return await exchange(path, too_large), await exchange(path, too_many)
+
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                responses = asyncio.run(scenario(os.path.join(tmp, "detect.sock")))
+        finally:
+            server.close()
+        for response, status in zip(responses, (b"413", b"431")):
+            self.assertTrue(response.startswith(b"HTTP/1.1 " + status))
+            self.assertIn(b"Connection: close", response)
+            self.assertEqual(response.count(b"HTTP/1.1 "), 1)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+watermark_artifact.py
+---------------------
+Dieses Modul implementiert das vorberechnete Wasserzeichen-Artefakt (Befehl "issue").
+Das Wasserzeichen wird einmalig erzeugt (Fehlerkorrektur, Verschlüsselung, Bit-Zuordnung mit
+festem Seed) und in einer kompakten Binärdatei abgelegt. Einbettung und Erkennung lesen die Bits per
+mmap; die Erkennung vergleicht die extrahierten Rohbits direkt mit den Nutzbits und dekodiert nur das
+ausgerichtete Fenster (siehe watermark_detector), ohne Schlüssel oder erneute Erzeugung.
+
+Dateiformat (big-endian, Version 2):
+  Kopf     ">4sBBHHHBQI": Magic b"SWMK", Formatversion, Fehlerkorrektur (0 = Hamming,
+           1 = Reed-Solomon), nsym, nsize, fcr, Flags (Bit 0: Bits gemischt), Seed der
+           Bit-Zuordnung, Länge der Nutzbits (in Bits)
+  Nutzbits       gepackt (BitVector), wie sie der Embedder einbettet
+  Prüfsumme      SHA-256 über alle vorangehenden Bytes
+Version 1 enthielt zusätzlich ein entschlüsseltes und dekodiertes Erwartungsmuster (Länge im Kopf, Bits nach
+den Nutzbits), das seit dem Vergleich auf Rohbits keine Erkennung mehr liest. Es wird beim Lesen
+übersprungen, damit bestehende Artefakte und Register gültig bleiben.
+"""
+
+import hashlib
+import mmap
+import secrets
+import struct
+from bitvector import BitVector
+from error_correction import reed_solomon_params
+from watermark_embedder import generate_watermark_bits
+
+ARTIFACT_MAGIC = b"SWMK"
+ARTIFACT_VERSION = 2
+DEFAULT_ARTIFACT_PATH = "watermark.swm"
+
+# Kopf je lesbarer Formatversion; Version 1 trägt zusätzlich die Länge des Erwartungsmusters
+_HEADERS = {1: struct.Struct(">4sBBHHHBQII"), 2: struct.Struct(">4sBBHHHBQI")}
+_CHECKSUM_SIZE = hashlib.sha256().digest_size
+_ERROR_METHODS = ("hamming", "reed-solomon")
+_FLAG_SHUFFLED = 0x01
+
+class WatermarkArtifact:
+    """Inhalt eines Wasserzeichen-Artefakts."""
+    __slots__ = ("error_method", "rs_params", "shuffle_seed", "shuffled", "payload")
+
+    def __init__(self, error_method: str, rs_params: dict, shuffle_seed: int, shuffled: bool, payload: BitVector):
+        self.error_method = error_method
+        self.rs_params = rs_params
+        self.shuffle_seed = shuffle_seed
+        self.shuffled = shuffled
+        self.payload = payload
+
+    def to_bytes(self) -> bytes:
+        """Serialisiert das Artefakt inklusive Prüfsumme."""
+        header = _HEADERS[ARTIFACT_VERSION].pack(
+            ARTIFACT_MAGIC, ARTIFACT_VERSION, _ERROR_METHODS.index(self.error_method), self.rs_params["nsym"],
+            self.rs_params["nsize"], self.rs_params["fcr"], _FLAG_SHUFFLED if self.shuffled else 0,
+            self.shuffle_seed, len(self.payload))
+        body = header + self.payload.to_bytes()
+        return body + hashlib.sha256(body).digest()
+
+    @classmethod
+    def from_buffer(cls, buffer) -> "WatermarkArtifact":
+        """Liest ein Artefakt aus einem Puffer (bytes oder mmap) und prüft Format und Prüfsumme."""
+        header = _HEADERS.get(buffer[4]) if len(buffer) > 4 else None
+        if header is not None and len(buffer) < header.size + _CHECKSUM_SIZE:
+            raise ValueError("Wasserzeichen-Artefakt ist zu kurz.")
+        if header is None or buffer[:4] != ARTIFACT_MAGIC:
+            raise ValueError("Unbekanntes Format des Wasserzeichen-Artefakts.")
+        (_, _, method, nsym, nsize, fcr, flags, seed,
+         payload_length, *legacy_lengths) = header.unpack_from(buffer, 0)
+        if method >= len(_ERROR_METHODS):
+            raise ValueError("Unbekanntes Format des Wasserzeichen-Artefakts.")
+        payload_end = header.size + (payload_length + 7) // 8
+        # Version 1: Erwartungsmuster nach den Nutzbits, nur für die Prüfsumme relevant
+        end = payload_end + sum((length + 7) // 8 for length in legacy_lengths)
+        if len(buffer) != end + _CHECKSUM_SIZE:
+            raise ValueError("Wasserzeichen-Artefakt hat eine ungültige Länge.")
+        if hashlib.sha256(buffer[:end]).digest() != buffer[end:]:
+            raise ValueError("Prüfsumme des Wasserzeichen-Artefakts stimmt nicht.")
+        return cls(_ERROR_METHODS[method], {"nsym": nsym, "nsize": nsize, "fcr": fcr}, seed,
+                   bool(flags & _FLAG_SHUFFLED), BitVector(buffer[header.size:payload_end], payload_length))
+
+def issue_artifact(config: dict, key_session=None, shuffle_seed: int | None = None) -> WatermarkArtifact:
+    """
+    Erzeugt das Wasserzeichen einmalig.
+    Ohne shuffle_seed wird ein zufälliger Seed gezogen und im Artefakt festgehalten.
+    """
+    if shuffle_seed is None:
+        shuffle_seed = secrets.randbits(64)
+    payload = generate_watermark_bits(config, key_session, shuffle_seed=shuffle_seed)
+    return WatermarkArtifact(config.get("error_correction", "hamming"), reed_solomon_params(config), shuffle_seed,
+                             bool(config.get("random_bit_assignment", False)), payload)
+
+def write_artifact(path: str, artifact: WatermarkArtifact) -> None:
+    """Schreibt das Artefakt in eine Datei."""
+    with open(path, "wb") as f:
+        f.write(artifact.to_bytes())
+
+def load_artifact(path: str) -> WatermarkArtifact:
+    """Liest das Artefakt per mmap ein und prüft die Prüfsumme."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        return WatermarkArtifact.from_buffer(buffer)
@@ -5,6 +5,15 @@ watermark_detector.py
 Dieses Skript überprüft einen Python-Quellcode auf das eingebettete Wasserzeichen.
 Es extrahiert mittels AST die Wasserzeichen-Bits, wendet die Fehlerkorrektur (Hamming oder Reed-Solomon)
 an und berechnet Robustheitsmetriken. Ist das Wasserzeichen verschlüsselt, erfolgt zuvor die Entschlüsselung.
+Die Bits werden durchgängig als gepackter BitVector verarbeitet.
+Gefundene Bits werden als DEBUG-Ereignisse protokolliert (siehe event_log).
+Für Quelltexte liest extract_watermark_bits_from_source die Namen mit dem schnellen Scanner (fast_scanner)
+und fällt nur bei mehrdeutigen Konstrukten auf ast.parse und den AST-Durchlauf zurück.
+Kompilierte Dateien (.pyc) wertet extract_watermark_bits_from_bytecode ohne Parsen über die Code-Objekte aus
+(siehe bytecode_scanner).
+Verglichen werden die rohen Bits mit der eingebetteten Bitfolge (Payload): Gelöschte oder umsortierte Anweisungen
+verschieben den Bitstrom um beliebig viele Bits, was nach der Fehlerkorrektur jedes Codewort zerstören würde.
+Erst das ausgerichtete Fenster wird dekodiert.
 Verwendete Python-Version: 3.12
 """
 
@@ -12,84 +21,201 @@ import ast
 import sys
 import yaml
 import json
+import logging
 import os
-from watermark_embedder import generate_watermark_bits
+from watermark_embedder import generate_watermark_bits, transform_to_camel, transform_to_pascal
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import unpad
-from error_correction import decode_error_correction
+from error_correction import decode_error_correction, reed_solomon_params, DECODING_ERRORS
+from bitvector import BitVector
+from key_session import AesEaxCipherFactory
+from event_log import get_logger, log_event
+from fast_scanner import scan_definitions
+from bytecode_scanner import scan_pyc, is_bytecode_file
+from alignment import WatermarkAlignment, align_watermark
 
-def decrypt_watermark(encrypted_bitstring: str, key: str) -> str:
+_log = get_logger("detector")
+
+# p-Wert, ab dem eine (ggf. verschobene) Übereinstimmung als Nachweis gilt
+DETECTION_P_VALUE = 1e-3
+
+def decrypt_watermark(encrypted_bits: BitVector, key: str | AesEaxCipherFactory) -> BitVector:
     """
-    Entschlüsselt den verschlüsselten Bitstring mit AES (EAX-Modus).
-    Dabei wird der Binärstring in Bytes umgewandelt, entschlüsselt und als Klartext zurückgegeben.
+    Entschlüsselt den verschlüsselten Bitvektor mit AES (EAX-Modus).
+    Die gepackten Bytes werden direkt entschlüsselt; der Klartext enthält die Bitlänge und die Bits.
+    key ist eine Cipher-Fabrik (siehe key_session) oder ein Schlüssel-String, der per HKDF abgeleitet wird.
     """
-    byte_array = []
-    for i in range(0, len(encrypted_bitstring), 8):
-        byte_array.append(int(encrypted_bitstring[i:i+8], 2))
-    combined = bytes(byte_array)
+    combined = encrypted_bits.to_bytes()
     nonce = combined[:16]
     tag = combined[16:32]
     ciphertext = combined[32:]
-    key_bytes = key.encode('utf-8')
-    if len(key_bytes) < 16:
-        key_bytes = key_bytes.ljust(16, b'0')
-    else:
-        key_bytes = key_bytes[:16]
-    cipher = AES.new(key_bytes, AES.MODE_EAX, nonce=nonce)
+    cipher = AesEaxCipherFactory.coerce(key).new(nonce)
     data = unpad(cipher.decrypt(ciphertext), AES.block_size)
-    return data.decode('utf-8')
-
-def transform_name_candidate(original: str, bit: str) -> str:
-    """Erstellt einen Kandidaten-Namen basierend auf der Transformation (camelCase) für Bit '1'."""
-    if bit == '1':
-        parts = original.split('_')
-        return parts[0] + ''.join(word.capitalize() for word in parts[1:])
-    else:
-        return original
+    length = int.from_bytes(data[:4], "big")
+    return BitVector(data[4:], length)
 
-def detect_transformation(original: str, candidate: str) -> str | None:
+def build_name_index(variable_whitelist: list) -> dict[str, tuple[str, int]]:
     """
-    Vergleicht den Originalnamen mit dem Kandidaten-Namen, um festzustellen,
-    ob eine Transformation stattgefunden hat und gibt das entsprechende Bit zurück.
+    Erstellt einmalig einen Index von jeder zulässigen (transformierten) Namensform auf (Originalname, Bit).
+    Abgedeckt sind der unveränderte Name (Bit 0) sowie alle Formen, die transform_name für Bit 1
+    erzeugen kann: camelCase und PascalCase jeweils mit Präfix "x_" bzw. Suffix "_x",
+    zusätzlich das reine camelCase (ältere Einbettungen).
+    Bei Kollisionen gewinnt der frühere Whitelist-Eintrag.
     """
-    if candidate == original:
-        return '0'
-    camel = transform_name_candidate(original, '1')
-    if candidate == camel:
-        return '1'
-    return None
+    index = {}
+    for original in variable_whitelist:
+        index.setdefault(original, (original, 0))
+        camel = transform_to_camel(original)
+        pascal = transform_to_pascal(original)
+        for candidate in (camel, "x_" + camel, camel + "_x", "x_" + pascal, pascal + "_x"):
+            index.setdefault(candidate, (original, 1))
+    return index
 
 class WatermarkDetector(ast.NodeVisitor):
     """
     Diese Klasse besucht den AST und extrahiert Wasserzeichen-Bits,
-    indem sie Funktions- und Variablennamen vergleicht.
+    indem sie Funktions- und Variablennamen im vorberechneten Namensindex nachschlägt.
+    Mit verbose werden gefundene Bits als DEBUG-Ereignisse protokolliert, sofern der Level aktiv ist.
     """
-    def __init__(self, variable_whitelist: list):
+    def __init__(self, variable_whitelist: list, verbose: bool = True, name_index: dict | None = None):
         self.variable_whitelist = variable_whitelist
+        self.verbose = verbose and _log.isEnabledFor(logging.DEBUG)
+        self.name_index = name_index if name_index is not None else build_name_index(variable_whitelist)
         self.detected_bits = []
 
+    @property
+    def bits(self) -> BitVector:
+        """Die bisher extrahierten Bits als Bitvektor."""
+        return BitVector.from_bits(self.detected_bits)
+
+    def record(self, kind: str, name: str, line: int) -> None:
+        """Wertet einen Funktions- ("function") oder Variablennamen ("variable") an einer Definitionsstelle aus."""
+        entry = self.name_index.get(name)
+        if entry is not None:
+            original, bit = entry
+            self.detected_bits.append(bit)
+            if self.verbose:
+                label = "Funktion" if kind == "function" else "Variable"
+                log_event(_log, logging.DEBUG, "bit_detected",
+                          f"Erkannt in {label} '{original}': Bit {bit} (gefunden: {name})",
+                          kind=kind, original=original, found=name, bit=bit, line=line)
+
     def visit_FunctionDef(self, node: ast.FunctionDef):
-        for original in self.variable_whitelist:
-            bit = detect_transformation(original, node.name)
-            if bit is not None:
-                self.detected_bits.append(bit)
-                print(f"Erkannt in Funktion '{original}': Bit {bit} (gefunden: {node.name})")
-                break
+        self.record("function", node.name, node.lineno)
         self.generic_visit(node)
 
     def visit_Name(self, node: ast.Name):
         if isinstance(node.ctx, ast.Store):
-            for original in self.variable_whitelist:
-                bit = detect_transformation(original, node.id)
-                if bit is not None:
-                    self.detected_bits.append(bit)
-                    print(f"Erkannt in Variable '{original}': Bit {bit} (gefunden: {node.id})")
-                    break
+            self.record("variable", node.id, node.lineno)
         self.generic_visit(node)
 
+def extract_watermark_bits(tree: ast.AST, variable_whitelist: list, verbose: bool = False,
+                           name_index: dict | None = None) -> BitVector:
+    """Extrahiert die rohen (noch fehlerkorrekturkodierten) Wasserzeichen-Bits aus einem AST."""
+    detector = WatermarkDetector(variable_whitelist, verbose=verbose, name_index=name_index)
+    detector.visit(tree)
+    return detector.bits
+
+def extract_watermark_bits_from_source(source: str | bytes, variable_whitelist: list, verbose: bool = False,
+                                       name_index: dict | None = None, filename: str = "<unknown>") -> BitVector:
+    """
+    Extrahiert die rohen Wasserzeichen-Bits direkt aus dem Quelltext (siehe fast_scanner).
+    Meldet der Scanner ein mehrdeutiges Konstrukt, entscheidet der AST; parst die Datei nicht (z. B. andere
+    Python-Version, beschädigter Leak), gilt das Ergebnis des Scanners. Liefert auch dieser nichts, wird der
+    SyntaxError weitergereicht.
+    """
+    definitions, exact = scan_definitions(source)
+    if not exact:
+        try:
+            tree = ast.parse(source, filename=filename)
+        except SyntaxError:
+            if not definitions:
+                raise
+        else:
+            return extract_watermark_bits(tree, variable_whitelist, verbose=verbose, name_index=name_index)
+    detector = WatermarkDetector(variable_whitelist, verbose=verbose, name_index=name_index)
+    for kind, name, line in definitions:
+        detector.record(kind, name, line)
+    return detector.bits
+
+def extract_watermark_bits_from_bytecode(data: bytes, variable_whitelist: list, verbose: bool = False,
+                                         name_index: dict | None = None) -> BitVector:
+    """
+    Extrahiert die rohen Wasserzeichen-Bits aus dem Inhalt einer pyc-Datei (siehe bytecode_scanner).
+    pyc-Dateien anderer Python-Versionen lösen einen ValueError aus.
+    """
+    detector = WatermarkDetector(variable_whitelist, verbose=verbose, name_index=name_index)
+    for kind, name, line in scan_pyc(data):
+        detector.record(kind, name, line)
+    return detector.bits
+
+def extract_watermark_bits_from_file(filename: str, data: bytes, variable_whitelist: list, verbose: bool = False,
+                                     name_index: dict | None = None) -> BitVector:
+    """Wählt anhand des Dateinamens zwischen Quelltext- und Bytecode-Pfad (.pyc)."""
+    if is_bytecode_file(filename):
+        return extract_watermark_bits_from_bytecode(data, variable_whitelist, verbose=verbose, name_index=name_index)
+    return extract_watermark_bits_from_source(data.decode("utf-8"), variable_whitelist, verbose=verbose,
+                                              name_index=name_index, filename=filename)
+
+def try_decode_error_correction(bits: BitVector, method: str, **rs_params) -> tuple[BitVector, bool]:
+    """
+    Dekodiert den Bitvektor mit der gewählten Fehlerkorrektur (rs_params siehe reed_solomon_params).
+    Ist die Bitfolge nicht dekodierbar, werden die Rohbits zurückgegeben (zweiter Rückgabewert False).
+    """
+    try:
+        return decode_error_correction(bits, method=method, **rs_params), True
+    except DECODING_ERRORS:
+        return bits, False
+
+def payload_is_reproducible(config: dict, key_session=None) -> bool:
+    """
+    Prüft, ob generate_watermark_bits bei jedem Lauf dieselben Bits liefert. Verschlüsselung (zufällige Nonce)
+    und eine zufällige Bit-Zuordnung ohne festen shuffle_seed ergeben bei jedem Aufruf eine andere Bitfolge;
+    die Erkennung benötigt dann das Artefakt, mit dem eingebettet wurde (siehe watermark_artifact).
+    """
+    if key_session is not None:
+        key = key_session.cipher_factory("embedder")
+    else:
+        key = config.get("encryption_key_embedder", os.environ.get("ENCRYPTION_KEY"))
+    if key:
+        return False
+    return not config.get("random_bit_assignment", False) or config.get("shuffle_seed") is not None
+
+def compare_watermark(raw_bits: BitVector, payload_bits: BitVector) -> WatermarkAlignment:
+    """
+    Vergleicht die rohen (nicht dekodierten) extrahierten Bits mit der eingebetteten Bitfolge bei jeder
+    zyklischen Verschiebung (siehe alignment) und liefert die beste Verschiebung mit Treffern, Konfidenz in %
+    und p-Wert.
+    """
+    return align_watermark(raw_bits, payload_bits)
+
+def decode_aligned_window(raw_bits: BitVector, alignment: WatermarkAlignment, payload_length: int, method: str,
+                          **rs_params) -> tuple[BitVector, bool]:
+    """
+    Dekodiert das ausgerichtete Fenster: Ab der ersten Position, die auf den Anfang der Payload fällt, wird eine
+    Payload-Länge an Rohbits genommen, sodass die Codewörter wieder an ihren Grenzen beginnen. Ist die Payload
+    verschlüsselt oder gemischt oder das Fenster unvollständig, schlägt die Dekodierung in der Regel fehl
+    (zweiter Rückgabewert False); das Urteil hängt davon nicht ab.
+    """
+    if not alignment.compared or not payload_length:
+        return BitVector(), False
+    start = (payload_length - alignment.offset) % payload_length
+    window = raw_bits[start:start + payload_length]
+    if not window:
+        return window, False
+    return try_decode_error_correction(window, method, **rs_params)
+
+def watermark_detected(alignment: WatermarkAlignment) -> bool:
+    """
+    Nachweis: Die beste Verschiebung ist nach Korrektur für alle geprüften Verschiebungen signifikant
+    (p-Wert höchstens DETECTION_P_VALUE). Auch eine vollständige Übereinstimmung zählt nur, wenn sie lang
+    genug ist; vier passende Bits hätte jede vierte zufällige Datei.
+    """
+    return alignment.compared > 0 and alignment.p_value <= DETECTION_P_VALUE
+
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python watermark_detector.py <python_file>")
+        print("Usage: python watermark_detector.py <python_file|pyc_file> [watermark_artifact]")
         sys.exit(1)
     file_to_check = sys.argv[1]
     with open('config.yaml', 'r', encoding='utf-8') as f:
@@ -97,34 +223,40 @@ def main():
     with open('whitelist.json', 'r', encoding='utf-8') as f:
         whitelist = json.load(f)
     variable_whitelist = [var['name'] for var in whitelist.get('variables', [])]
-    # Generiere das erwartete Wasserzeichen
-    full_watermark_bits = generate_watermark_bits(config)
-    key = config.get("encryption_key_detector", os.environ.get("ENCRYPTION_KEY"))
-    if key:
-        full_watermark_bits = decrypt_watermark(full_watermark_bits, key)
-    # Wähle die Fehlerkorrektur-Methode (Standard: "hamming")
-    error_method = config.get("error_correction", "hamming")
-    full_watermark_bits = decode_error_correction(full_watermark_bits, method=error_method)
-    print("Vollständiges Wasserzeichen (als Binärstring):")
-    print(full_watermark_bits)
-    with open(file_to_check, 'r', encoding='utf-8') as f:
-        code = f.read()
-    tree = ast.parse(code)
-    detector = WatermarkDetector(variable_whitelist)
-    detector.visit(tree)
-    extracted_bits = "".join(detector.detected_bits)
-    extracted_bits = decode_error_correction(extracted_bits, method=error_method)
+    artifact_path = sys.argv[2] if len(sys.argv) > 2 else config.get("watermark_artifact")
+    if artifact_path:
+        # Vorberechnetes Artefakt: die eingebettete Bitfolge liegt bereits vor
+        from watermark_artifact import load_artifact
+        artifact = load_artifact(artifact_path)
+        payload_bits, error_method, rs_params = artifact.payload, artifact.error_method, artifact.rs_params
+    else:
+        # Erzeuge die eingebettete Bitfolge erneut (nur bei reproduzierbarer Payload aussagekräftig)
+        if not payload_is_reproducible(config):
+            print("Hinweis: Ohne Artefakt ist die Payload nicht reproduzierbar (Verschlüsselung oder zufällige "
+                  "Bit-Zuordnung ohne shuffle_seed).", file=sys.stderr)
+        payload_bits = generate_watermark_bits(config, shuffle_seed=config.get("shuffle_seed"))
+        # Wähle die Fehlerkorrektur-Methode (Standard: "hamming")
+        error_method = config.get("error_correction", "hamming")
+        rs_params = reed_solomon_params(config)
+    print("Eingebettete Bitfolge (Debug-Ansicht als Binärstring):")
+    print(payload_bits)
+    with open(file_to_check, 'rb') as f:
+        data = f.read()
+    raw_bits = extract_watermark_bits_from_file(file_to_check, data, variable_whitelist, verbose=True)
     print("\nExtrahierte Wasserzeichen-Bits aus dem Code:")
-    print(extracted_bits)
-    expected_bits = full_watermark_bits[:len(extracted_bits)]
-    print("\nErwartete Wasserzeichen-Bits (Prefix des vollständigen Musters):")
-    print(expected_bits)
-    match_count = len([b for b, e in zip(extracted_bits, expected_bits) if b == e])
-    confidence = (match_count / len(expected_bits) * 100) if expected_bits else 0
-    if extracted_bits == expected_bits:
+    print(raw_bits)
+    alignment = compare_watermark(raw_bits, payload_bits)
+    decoded_bits, ecc_decoded = decode_aligned_window(raw_bits, alignment, len(payload_bits), error_method,
+                                                      **rs_params)
+    if ecc_decoded:
+        print("\nDekodiertes Wasserzeichen (ausgerichtetes Fenster):")
+        print(decoded_bits)
+    print(f"\nBeste Ausrichtung: Verschiebung {alignment.offset} von {alignment.offsets}, "
+          f"{alignment.matches}/{alignment.compared} Bits, p-Wert {alignment.p_value:.3g}")
+    if watermark_detected(alignment):
         print("\nWasserzeichen erkannt: Der Code enthält dein eingebettetes Wasserzeichen.")
     else:
-        print(f"\nWasserzeichen teilweise erkannt: {confidence:.2f}% der Bits stimmen überein.")
+        print(f"\nWasserzeichen teilweise erkannt: {alignment.confidence:.2f}% der Bits stimmen überein.")
         print("Wasserzeichen NICHT vollständig erkannt oder unvollständig.")
 
 if __name__ == "__main__":
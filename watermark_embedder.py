@@ -7,8 +7,13 @@ Erweiterungen in dieser Version:
 - Interaktiver Review-Modus.
 - Fehlerkorrektur: Auswahl zwischen Hamming(7,4) und Reed-Solomon (konfigurierbar).
 - Verschlüsselung: AES-Verschlüsselung (EAX-Modus) mit separaten Schlüsseln.
-- Plugin-System: Externe Plugins (z. B. aus dem Verzeichnis "plugins") können zusätzliche Transformationen durchführen.
+- Plugin-System: Externe Plugins (z. B. aus dem Verzeichnis "plugins") können zusätzliche Transformationen durchführen;
+  ihre Knoten-Hooks laufen im selben AST-Durchlauf wie der Embedder.
 - Erweiterte Transformationen: Namensänderungen (camelCase, PascalCase, Random Prefix/Suffix).
+- Kompakte Bitdarstellung: Das Wasserzeichen wird durchgängig als gepackter BitVector weitergereicht.
+- Streaming-Modus: Sehr große Dateien werden Top-Level-Anweisung für Top-Level-Anweisung verarbeitet.
+- Ausgabe-Backends: "astor" (vollständige Neuerzeugung) oder "tokens" (Patch der aufgezeichneten Edits).
+- Protokollierung über event_log: Umbenennungen als DEBUG-Ereignisse, standardmäßig still.
 Verwendete Python-Version: 3.12
 """
 
@@ -16,49 +21,69 @@ import ast
 import astor
 import yaml
 import json
+import logging
 import random
 import os
+import tokenize
+from typing import Iterator
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad
-from error_correction import encode_error_correction
+from error_correction import encode_error_correction, reed_solomon_params
+from bitvector import BitVector
+from source_patcher import apply_edits
+from plugin_manager import HookDispatcher, check_output_backend
+from key_session import AesEaxCipherFactory
+from event_log import get_logger, log_event
+
+_log = get_logger("embedder")
+
+# Verfügbare Ausgabe-Backends
+OUTPUT_BACKENDS = ("astor", "tokens")
+
+# Version der Transformationslogik; bei jeder Änderung der Ausgabe erhöhen (Teil des Cache-Schlüssels)
+EMBEDDER_VERSION = "2"
 
 # Verschlüsselung mit AES
-def encrypt_watermark(bitstring: str, key: str) -> str:
-    """Verschlüsselt den Bitstring mit AES (EAX-Modus) und gibt den verschlüsselten Binärstring zurück."""
-    data = bitstring.encode('utf-8')
-    key_bytes = key.encode('utf-8')
-    if len(key_bytes) < 16:
-        key_bytes = key_bytes.ljust(16, b'0')
-    else:
-        key_bytes = key_bytes[:16]
-    cipher = AES.new(key_bytes, AES.MODE_EAX)
+def encrypt_watermark(bits: BitVector, key: str | AesEaxCipherFactory) -> BitVector:
+    """
+    Verschlüsselt den Bitvektor mit AES (EAX-Modus) und gibt den verschlüsselten Bitvektor zurück.
+    Der Klartext besteht aus der Bitlänge (4 Bytes, big-endian) und den gepackten Bits.
+    key ist eine Cipher-Fabrik (siehe key_session) oder ein Schlüssel-String, der per HKDF abgeleitet wird.
+    """
+    data = len(bits).to_bytes(4, "big") + bits.to_bytes()
+    cipher = AesEaxCipherFactory.coerce(key).new()
     ciphertext, tag = cipher.encrypt_and_digest(pad(data, AES.block_size))
     combined = cipher.nonce + tag + ciphertext
-    return ''.join(format(b, '08b') for b in combined)
+    return BitVector(combined)
 
-def generate_watermark_bits(config: dict) -> str:
+def generate_watermark_bits(config: dict, key_session=None, shuffle_seed: int | None = None) -> BitVector:
     """
-    Generiert den Wasserzeichen-Binärstring basierend auf der Konfiguration.
+    Generiert den Wasserzeichen-Bitvektor basierend auf der Konfiguration.
+    Mit key_session (siehe key_session.KeySession) stammt der Schlüssel aus der Session (Rolle 'embedder').
+    Mit shuffle_seed ist die zufällige Bit-Zuordnung reproduzierbar (siehe watermark_artifact).
     Dabei werden folgende Schritte durchgeführt:
       1. Erzeugung eines Master-Strings (Projektname, Jahr, UUID).
-      2. Umwandlung in einen Binärstring.
+      2. Umwandlung in einen gepackten Bitvektor (UTF-8-Bytes).
       3. Anwendung eines Fehlerkorrekturcodes (Hamming oder Reed-Solomon, wählbar).
-      4. Verschlüsselung des Bitstrings, falls ein Schlüssel vorhanden ist.
+      4. Verschlüsselung des Bitvektors, falls ein Schlüssel vorhanden ist.
       5. Optionale zufällige Bit-Zuordnung.
     """
     master_str = config['projektname'] + str(config['copyright']['jahr']) + config['uuid']
-    bits = ''.join(format(ord(c), '08b') for c in master_str)
+    bits = BitVector(master_str.encode('utf-8'))
     # Fehlerkorrektur: Methode wird aus der Konfiguration ausgelesen (Standard: "hamming")
     error_method = config.get("error_correction", "hamming")
-    bits = encode_error_correction(bits, method=error_method)
-    # Verschlüsselung: Nutze embedder-spezifischen Schlüssel aus Konfiguration oder ENV.
-    key = config.get("encryption_key_embedder", os.environ.get("ENCRYPTION_KEY"))
+    bits = encode_error_correction(bits, method=error_method, **reed_solomon_params(config))
+    # Verschlüsselung: Nutze die Session bzw. den embedder-spezifischen Schlüssel aus Konfiguration oder ENV.
+    if key_session is not None:
+        key = key_session.cipher_factory("embedder")
+    else:
+        key = config.get("encryption_key_embedder", os.environ.get("ENCRYPTION_KEY"))
     if key:
         bits = encrypt_watermark(bits, key)
     if config.get("random_bit_assignment", False):
         bit_list = list(bits)
-        random.shuffle(bit_list)
-        bits = "".join(bit_list)
+        random.Random(shuffle_seed).shuffle(bit_list)
+        bits = BitVector.from_bits(bit_list)
     return bits
 
 def transform_to_camel(name: str) -> str:
@@ -71,23 +96,23 @@ def transform_to_pascal(name: str) -> str:
     parts = name.split('_')
     return ''.join(word.capitalize() for word in parts)
 
-def transform_name(name: str, bit: str, alternate: bool) -> str:
+def transform_name(name: str, bit: int, alternate: bool, rng=random) -> str:
     """
     Transformiert einen Namen basierend auf dem Bit-Wert.
-    Bei Bit '1' wird entweder camelCase oder PascalCase verwendet, ggf. mit zufälligem Präfix/Suffix.
-    Bei Bit '0' bleibt der Name unverändert.
+    Bei Bit 1 wird entweder camelCase oder PascalCase verwendet, ggf. mit zufälligem Präfix/Suffix.
+    Bei Bit 0 bleibt der Name unverändert. rng liefert die Zufallsentscheidungen (Standard: Modul random).
     """
-    if bit == '1':
-        if alternate and random.choice([True, False]):
+    if int(bit) == 1:
+        if alternate and rng.choice([True, False]):
             new_name = transform_to_pascal(name)
-            if random.random() < 0.5:
+            if rng.random() < 0.5:
                 new_name = "x_" + new_name
             else:
                 new_name = new_name + "_x"
             return new_name
         else:
             new_name = transform_to_camel(name)
-            if random.random() < 0.5:
+            if rng.random() < 0.5:
                 new_name = "x_" + new_name
             else:
                 new_name = new_name + "_x"
@@ -95,28 +120,43 @@ def transform_name(name: str, bit: str, alternate: bool) -> str:
     else:
         return name
 
-class WatermarkEmbedder(ast.NodeTransformer):
+class WatermarkEmbedder(HookDispatcher):
     """
     Diese Klasse transformiert den AST, um Wasserzeichen in den Code einzubetten.
     Funktions- und Variablennamen werden anhand von Wasserzeichen-Bits angepasst.
+    Jede Änderung wird zusätzlich als Edit (siehe source_patcher) aufgezeichnet,
+    sodass das Backend "tokens" den Originaltext gezielt patchen kann.
+    Übergebene Plugin-Hooks (node_hooks, siehe PluginManager.node_hooks) laufen im selben Durchlauf,
+    jeweils vor der Besuchermethode des Embedders.
+    Mit rng (z. B. random.Random(seed)) sind Präfix/Suffix und Schreibweise reproduzierbar, ohne den
+    globalen Zustand des Moduls random zu verändern.
     """
-    def __init__(self, watermark_bits: str, variable_whitelist: list, code_section_whitelist: list,
-                 review_mode=False, alternate_naming=False):
-        self.watermark_bits = watermark_bits
+    def __init__(self, watermark_bits: BitVector, variable_whitelist: list, code_section_whitelist: list,
+                 review_mode=False, alternate_naming=False, node_hooks: dict | None = None, rng=None):
+        super().__init__(node_hooks)
+        self.watermark_bits = BitVector.coerce(watermark_bits)
         self.bit_index = 0
         self.variable_whitelist = variable_whitelist
         self.code_section_whitelist = code_section_whitelist
         self.review_mode = review_mode
         self.alternate_naming = alternate_naming
+        self.rng = rng or random
         self.changes = []
+        self.edits = []
+        # Zähler für --timings (verbrauchte Bits, tatsächlich geänderte Namen)
+        self.bits_consumed = 0
+        self.renames = 0
+        # Level einmal prüfen: Bei abgeschaltetem DEBUG entstehen im Durchlauf keine Log-Kosten
+        self._trace = _log.isEnabledFor(logging.DEBUG)
 
-    def next_bit(self) -> str:
+    def next_bit(self) -> int:
         """Gibt das nächste Bit des Wasserzeichens zurück (zyklisch, falls nötig)."""
         if self.bit_index >= len(self.watermark_bits):
-            print("Warnung: Wasserzeichen länger als verfügbare Code-Elemente – zyklische Wiederverwendung.")
+            _log.warning("Warnung: Wasserzeichen länger als verfügbare Code-Elemente – zyklische Wiederverwendung.")
             self.bit_index = 0
         bit = self.watermark_bits[self.bit_index]
         self.bit_index += 1
+        self.bits_consumed += 1
         return bit
 
     def visit_FunctionDef(self, node: ast.FunctionDef) -> ast.AST:
@@ -124,11 +164,16 @@ class WatermarkEmbedder(ast.NodeTransformer):
         if node.name in self.variable_whitelist:
             bit = self.next_bit()
             original_name = node.name
-            new_name = transform_name(node.name, bit, self.alternate_naming)
+            new_name = transform_name(node.name, bit, self.alternate_naming, self.rng)
             node.name = new_name
+            if new_name != original_name:
+                self.renames += 1
+                self.edits.append((node.lineno, node.col_offset, None, None, new_name, original_name))
             msg = f"Funktion umbenannt: {original_name} -> {new_name}"
             self.changes.append(msg)
-            print(msg)
+            if self._trace:
+                log_event(_log, logging.DEBUG, "rename", msg, kind="function", original=original_name,
+                          new=new_name, bit=bit, line=node.lineno)
         self.generic_visit(node)
         return node
 
@@ -137,18 +182,23 @@ class WatermarkEmbedder(ast.NodeTransformer):
         if isinstance(node.ctx, ast.Store) and node.id in self.variable_whitelist:
             bit = self.next_bit()
             original_name = node.id
-            new_name = transform_name(node.id, bit, self.alternate_naming)
+            new_name = transform_name(node.id, bit, self.alternate_naming, self.rng)
             node.id = new_name
+            if new_name != original_name:
+                self.renames += 1
+                self.edits.append((node.lineno, node.col_offset, node.end_lineno, node.end_col_offset, new_name, None))
             msg = f"Variable umbenannt: {original_name} -> {new_name}"
             self.changes.append(msg)
-            print(msg)
+            if self._trace:
+                log_event(_log, logging.DEBUG, "rename", msg, kind="variable", original=original_name,
+                          new=new_name, bit=bit, line=node.lineno)
         return node
 
     def visit_For(self, node: ast.For) -> ast.AST:
         """Transformiert For-Schleifen in List Comprehensions, wenn dies in der Whitelist aktiviert ist."""
         if "for_loop" in self.code_section_whitelist:
             bit = self.next_bit()
-            if bit == '1':
+            if bit:
                 original_target = node.target.id
                 node.target.id = original_target + "_"
                 new_node = ast.Expr(
@@ -164,11 +214,109 @@ class WatermarkEmbedder(ast.NodeTransformer):
                 )
                 msg = f"For-Schleife in List Comprehension umgewandelt; Schleifenvariable '{original_target}' -> '{node.target.id}'."
                 self.changes.append(msg)
-                print(msg)
-                return ast.copy_location(new_node, node)
+                if self._trace:
+                    log_event(_log, logging.DEBUG, "rewrite", msg, kind="for_loop", original=original_target,
+                              new=node.target.id, line=node.lineno)
+                new_node = ast.copy_location(new_node, node)
+                self.edits.append((node.lineno, node.col_offset, node.end_lineno, node.end_col_offset,
+                                   astor.to_source(new_node).rstrip("\n"), None))
+                return new_node
         self.generic_visit(node)
         return node
 
+# Schlüsselwörter, die eine zusammengesetzte Anweisung auf oberster Ebene fortsetzen (kein neuer Abschnitt)
+_CONTINUATION_KEYWORDS = {"else", "elif", "except", "finally"}
+
+# Knotentypen, die astor auf oberster Ebene mit zwei Leerzeilen absetzt
+_SPACED_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+def iter_top_level_chunks(readline) -> Iterator[str]:
+    """
+    Zerlegt eine Quelldatei in Abschnitte aus je einer Top-Level-Anweisung (inkl. Dekoratoren und
+    Fortsetzungen wie else/except). Die Datei wird über tokenize zeilenweise gelesen, sodass nur der
+    aktuelle Abschnitt im Speicher gehalten wird.
+    """
+    lines = []
+    first_row = 1
+
+    def tracked_readline() -> str:
+        line = readline()
+        if line:
+            lines.append(line)
+        return line
+
+    at_line_start = True
+    chunk_has_statement = False
+    for token in tokenize.generate_tokens(tracked_readline):
+        if token.type == tokenize.NEWLINE:
+            at_line_start = True
+            continue
+        if token.type in (tokenize.NL, tokenize.COMMENT, tokenize.INDENT, tokenize.DEDENT, tokenize.ENDMARKER):
+            continue
+        if at_line_start:
+            at_line_start = False
+            row, col = token.start
+            if col == 0:
+                if chunk_has_statement and token.string not in _CONTINUATION_KEYWORDS:
+                    count = row - first_row
+                    yield "".join(lines[:count])
+                    del lines[:count]
+                    first_row = row
+                    chunk_has_statement = False
+                if token.string != "@":
+                    chunk_has_statement = True
+    if lines:
+        yield "".join(lines)
+
+def render_output(source: str, tree: ast.AST, embedder: WatermarkEmbedder, backend: str = "astor",
+                  first_edit: int = 0) -> str:
+    """
+    Erzeugt den Ausgabetext mit dem gewählten Backend.
+    "astor" serialisiert den transformierten AST neu, "tokens" wendet die ab first_edit
+    aufgezeichneten Edits des Embedders auf den Originaltext an.
+    """
+    if backend == "tokens":
+        return apply_edits(source, embedder.edits[first_edit:])
+    return astor.to_source(tree)
+
+def embed_streaming(source_file: str, output_file: str, embedder: WatermarkEmbedder, plugin_manager=None,
+                    backend: str = "astor") -> int:
+    """
+    Bettet das Wasserzeichen abschnittsweise ein: Jede Top-Level-Anweisung wird einzeln geparst,
+    (optional) durch die Plugins und den Embedder transformiert und sofort geschrieben.
+    Der Bit-Cursor des Embedders läuft dabei über alle Abschnitte weiter.
+    Mit dem Backend "tokens" wird jeder Abschnitt als Originaltext mit seinen Edits geschrieben; mit Plugins
+    ist das nicht möglich (ValueError, siehe check_output_backend).
+    Der Speicherbedarf richtet sich nach der größten Top-Level-Definition, nicht nach der Dateigröße.
+    Gibt die Anzahl der verarbeiteten Abschnitte zurück.
+    """
+    if plugin_manager is not None:
+        check_output_backend(backend, plugin_manager.plugins_dir)
+    chunks = 0
+    previous_spaced = None
+    with open(source_file, "r", encoding="utf-8") as src, open(output_file, "w", encoding="utf-8") as dst:
+        for chunk in iter_top_level_chunks(src.readline):
+            tree = ast.parse(chunk, filename=source_file)
+            if backend == "tokens":
+                first_edit = len(embedder.edits)
+                embedder.visit(tree)
+                dst.write(render_output(chunk, tree, embedder, backend, first_edit))
+                chunks += 1
+                continue
+            if not tree.body:
+                continue
+            if plugin_manager:
+                tree = plugin_manager.apply_plugins(tree)
+            tree = embedder.visit(tree)
+            # Abstände wie bei astor.to_source über das gesamte Modul
+            spaced = isinstance(tree.body[0], _SPACED_NODES)
+            if previous_spaced is not None and (spaced or previous_spaced):
+                dst.write("\n\n")
+            dst.write(astor.to_source(tree))
+            previous_spaced = isinstance(tree.body[-1], _SPACED_NODES)
+            chunks += 1
+    return chunks
+
 def main():
     with open('config.yaml', 'r', encoding='utf-8') as f:
         config = yaml.safe_load(f)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+watermark_registry.py
+---------------------
+Dieses Modul implementiert das Register aller ausgestellten Wasserzeichen (ein Artefakt je Kunde/Mandant).
+Bei einem Leak werden die Bits der verdächtigen Datei einmal extrahiert und anschließend gegen alle
+Mandanten bewertet, statt das Werkzeug je Konfiguration erneut aufzurufen.
+
+- Gespeichert wird in SQLite (Mandant und Artefakt mit Fehlerkorrektur-Parametern und Nutzbits).
+- Verglichen werden wie bei der Erkennung die extrahierten Rohbits mit den eingebetteten Nutzbits jedes
+  Mandanten, über alle zyklischen Verschiebungen (siehe alignment.py). Dekodiert wird nur das
+  ausgerichtete Fenster der ausgegebenen Kandidaten.
+- Für die Suche werden die Mandanten nach Länge der Nutzbits gruppiert. Mit NumPy werden die
+  Spektren aller Nutzbits einer Gruppe vorab berechnet; die Anfrage wird einmal gefaltet und
+  transformiert, die Kreuzkorrelation liefert die Trefferzahlen aller Mandanten in einem Schritt.
+  Ohne NumPy wird je Mandant per XOR und Popcount verglichen.
+- Der p-Wert eines Kandidaten wird zusätzlich für die Anzahl der Mandanten korrigiert. Da sich die
+  Nutzbits unverschlüsselter Mandanten oft nur in wenigen Bits unterscheiden (gleicher Projektname,
+  anderes UUID), entscheidet über die Eindeutigkeit ein Vorzeichentest auf den Positionen, an denen
+  sich die Erwartungen des Besten und des Zweitplatzierten unterscheiden.
+"""
+
+import heapq
+import sqlite3
+import time
+from bitvector import BitVector
+from error_correction import np
+from alignment import (WatermarkAlignment, match_counts, alignment_from_counts, sidak_correction, binomial_tail,
+                       cyclic_window)
+from watermark_artifact import WatermarkArtifact
+from watermark_detector import decode_aligned_window, DETECTION_P_VALUE
+
+DEFAULT_REGISTRY_PATH = "watermark_registry.sqlite"
+
+class WatermarkRegistry:
+    """SQLite-Register der ausgestellten Wasserzeichen-Artefakte je Mandant."""
+
+    def __init__(self, path: str = DEFAULT_REGISTRY_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS tenants ("
+                          "tenant TEXT PRIMARY KEY, artifact BLOB NOT NULL, issued REAL NOT NULL)")
+        self.conn.commit()
+
+    def add(self, tenant: str, artifact: WatermarkArtifact) -> None:
+        """Registriert (bzw. ersetzt) das Artefakt eines Mandanten."""
+        self.conn.execute("INSERT OR REPLACE INTO tenants (tenant, artifact, issued) VALUES (?, ?, ?)",
+                          (tenant, artifact.to_bytes(), time.time()))
+        self.conn.commit()
+
+    def get(self, tenant: str) -> WatermarkArtifact | None:
+        """Gibt das Artefakt eines Mandanten zurück oder None."""
+        row = self.conn.execute("SELECT artifact FROM tenants WHERE tenant = ?", (tenant,)).fetchone()
+        return WatermarkArtifact.from_buffer(row[0]) if row else None
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM tenants").fetchone()[0]
+
+    def build_index(self) -> "RegistryIndex":
+        """Lädt die Nutzbits aller Mandanten in einen Suchindex."""
+        return RegistryIndex((tenant, WatermarkArtifact.from_buffer(blob))
+                             for tenant, blob in self.conn.execute("SELECT tenant, artifact FROM tenants ORDER BY tenant"))
+
+    def close(self) -> None:
+        self.conn.close()
+
+class _TenantGroup:
+    """Mandanten mit gleich langen Nutzbits."""
+    __slots__ = ("length", "tenants", "artifacts", "spectra")
+
+    def __init__(self, length: int):
+        self.length = length
+        self.tenants = []
+        self.artifacts = []
+        self.spectra = None
+
+    def freeze(self) -> None:
+        """Berechnet mit NumPy die Spektren der Nutzbits als ±1-Folgen (Zeile je Mandant)."""
+        if np is None or not self.artifacts:
+            return
+        rows = np.zeros((len(self.artifacts), self.length), dtype=np.float64)
+        for row, artifact in enumerate(self.artifacts):
+            bits = np.unpackbits(np.frombuffer(artifact.payload.to_bytes(), dtype=np.uint8))[:self.length]
+            rows[row] = bits.astype(np.float64) * 2 - 1
+        self.spectra = np.fft.rfft(rows, axis=1)
+
+    def score(self, bits: BitVector) -> list[WatermarkAlignment]:
+        """Richtet die Rohbits gegen die Nutzbits jedes Mandanten aus (beste Verschiebung und p-Wert)."""
+        if not bits:
+            return [alignment_from_counts([], 0) for _ in self.tenants]
+        if self.spectra is None:
+            return [alignment_from_counts(match_counts(bits, artifact.payload), len(bits))
+                    for artifact in self.artifacts]
+        return [alignment_from_counts(counts, len(bits)) for counts in self._match_counts_matrix(bits)]
+
+    def _match_counts_matrix(self, bits: BitVector) -> list[list[int]]:
+        """Trefferzahlen je Mandant und Verschiebung als Kreuzkorrelation mit allen Spektren der Gruppe."""
+        n, m = len(bits), self.length
+        signs = np.unpackbits(np.frombuffer(bits.to_bytes(), dtype=np.uint8))[:n].astype(np.float64) * 2 - 1
+        # Wie alignment._match_counts_fft: Bit i gehört zur Musterposition (offset + i) mod m
+        folded = np.bincount(np.arange(n) % m, weights=signs, minlength=m)
+        correlation = np.fft.irfft(np.conj(np.fft.rfft(folded)) * self.spectra, m, axis=1)
+        return ((n + np.rint(correlation)) // 2).astype(np.int64).tolist()
+
+class RegistryIndex:
+    """Suchindex über die Nutzbits aller Mandanten, gruppiert nach Länge der Nutzbits."""
+
+    def __init__(self, entries):
+        groups = {}
+        for tenant, artifact in entries:
+            length = len(artifact.payload)
+            if not length:
+                continue
+            group = groups.get(length)
+            if group is None:
+                group = groups[length] = _TenantGroup(length)
+            group.tenants.append(tenant)
+            group.artifacts.append(artifact)
+        for group in groups.values():
+            group.freeze()
+        self.groups = list(groups.values())
+
+    def __len__(self) -> int:
+        return sum(len(group.tenants) for group in self.groups)
+
+    def _best(self, raw_bits: BitVector, top_k: int) -> list[tuple]:
+        """Die top_k besten Mandanten als (p-Wert, Treffer, Mandant, Artefakt, Ausrichtung)."""
+        tenants = len(self)
+        candidates = []
+        for group in self.groups:
+            for tenant, artifact, alignment in zip(group.tenants, group.artifacts, group.score(raw_bits)):
+                candidates.append((sidak_correction(alignment.p_value, tenants), alignment.matches,
+                                   tenant, artifact, alignment))
+        # Nur die besten top_k Kandidaten werden vollständig sortiert und aufbereitet
+        return heapq.nsmallest(top_k, candidates, key=lambda c: (c[0], -c[1]))
+
+    @staticmethod
+    def _candidate(raw_bits: BitVector, entry: tuple) -> dict:
+        p_value, _, tenant, artifact, alignment = entry
+        _, ecc_decoded = decode_aligned_window(raw_bits, alignment, len(artifact.payload),
+                                               artifact.error_method, **artifact.rs_params)
+        return {"tenant": tenant, **alignment.to_dict(), "p_value": p_value,
+                "detected": p_value <= DETECTION_P_VALUE, "ecc_decoded": ecc_decoded}
+
+    def rank(self, raw_bits: BitVector, top_k: int = 5) -> list[dict]:
+        """
+        Bewertet die extrahierten Rohbits gegen die Nutzbits aller Mandanten und gibt die top_k besten
+        Kandidaten zurück (aufsteigend nach p-Wert, bei Gleichstand nach Anzahl der Treffer). Der p-Wert
+        ist für Verschiebungen und Anzahl der Mandanten korrigiert.
+        """
+        return [self._candidate(raw_bits, entry) for entry in self._best(raw_bits, top_k)]
+
+    def identify(self, raw_bits: BitVector, top_k: int = 5) -> dict:
+        """
+        Wie rank, zusätzlich mit Urteil. margin ist der Vorsprung des Besten vor dem Zweitplatzierten in
+        Treffern. Er entsteht nur an den Positionen, an denen sich ihre Erwartungen unterscheiden; ohne
+        echten Unterschied fiele jede davon mit Wahrscheinlichkeit 1/2 an den Besten (margin_p_value).
+        Der Beste gilt nur als identifiziert, wenn er signifikant ist und margin_p_value höchstens
+        DETECTION_P_VALUE beträgt, sonst ist das Ergebnis mehrdeutig ("ambiguous").
+        """
+        best = self._best(raw_bits, max(top_k, 2))
+        ranking = [self._candidate(raw_bits, entry) for entry in best[:top_k]]
+        margin = margin_p_value = None
+        if len(best) > 1:
+            top, second = [cyclic_window(artifact.payload, alignment.offset, len(raw_bits))
+                           for _, _, _, artifact, alignment in best[:2]]
+            margin = best[0][1] - best[1][1]
+            disagreements = len(raw_bits) - top.matches(second)
+            # Treffer des Besten unter den abweichenden Positionen: (disagreements + margin) / 2
+            margin_p_value = binomial_tail(disagreements, (disagreements + margin) // 2) if margin > 0 else 1.0
+        detected = bool(best) and best[0][0] <= DETECTION_P_VALUE
+        ambiguous = detected and margin_p_value is not None and margin_p_value > DETECTION_P_VALUE
+        return {"tenants": len(self), "candidates": ranking,
+                "tenant": best[0][2] if detected and not ambiguous else None, "ambiguous": ambiguous,
+                "margin": margin, "margin_p_value": margin_p_value}